@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+"""
+Generates a self-contained APT/dpkg root for benchmarking: a local repository
+with a Release and Packages file, a dpkg status file with N installed
+packages, kernels of several flavors and their metas, and an apt.conf that
+points APT at all of it. Like a real system, the repository also has packages
+that are not installed. Use it by setting APT_CONFIG to the generated
+apt.conf before APT is initialized.
+
+Usage: benchmarks/apt_root.py DIRECTORY NUMBER_OF_PACKAGES [UPGRADABLE_RATIO]
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+
+ARCH = "amd64"
+SUITE = "bench"
+# Active kernel, with an ABI bump pending in the repository
+KERNEL_SERIES = "5.4.0"
+KERNEL_ABI_INSTALLED = 40
+KERNEL_ABI_AVAILABLE = 42
+KERNEL_FLAVORS = ("-generic", "-lowlatency")
+ACTIVE_KERNEL = f"{KERNEL_SERIES}-{KERNEL_ABI_INSTALLED}-generic"
+# Packages available but not installed, relative to the installed ones
+AVAILABLE_RATIO = 0.2
+
+def stanza(fields):
+    return "".join(f"{key}: {value}\n" for key, value in fields.items()) + "\n"
+
+def package_fields(name, version, source=None, depends=None, section="misc"):
+    fields = {"Package": name,
+              "Architecture": ARCH,
+              "Version": version,
+              "Priority": "optional",
+              "Section": section,
+              "Maintainer": "Benchmark <benchmark@example.com>",
+              "Installed-Size": "100"}
+    if source:
+        fields["Source"] = source
+    if depends:
+        fields["Depends"] = ", ".join(depends)
+    fields["Description"] = f"Synthetic package {name}\n Generated for benchmarking Update Manager."
+    return fields
+
+def kernel_packages(abi):
+    """ Returns the fields of the kernel and meta packages for kernel ABI `abi` """
+    packages = []
+    version = f"{KERNEL_SERIES}-{abi}"
+    pkg_version = f"{version}.{abi + 3}"
+    meta_version = f"{KERNEL_SERIES}.{abi}.{abi + 3}"
+    packages.append(package_fields(f"linux-headers-{version}", pkg_version, "linux", section="kernel"))
+    for flavor in KERNEL_FLAVORS:
+        release = f"{version}{flavor}"
+        packages.append(package_fields(f"linux-headers-{release}", pkg_version, "linux",
+                                       [f"linux-headers-{version}"], "kernel"))
+        packages.append(package_fields(f"linux-modules-{release}", pkg_version, "linux", section="kernel"))
+        packages.append(package_fields(f"linux-image-{release}", pkg_version, "linux-signed",
+                                       [f"linux-modules-{release}"], "kernel"))
+        packages.append(package_fields(f"linux-image{flavor}", meta_version, "linux-meta",
+                                       [f"linux-image-{release}"], "kernel"))
+        packages.append(package_fields(f"linux-headers{flavor}", meta_version, "linux-meta",
+                                       [f"linux-headers-{release}"], "kernel"))
+        packages.append(package_fields(f"linux{flavor}", meta_version, "linux-meta",
+                                       [f"linux-image{flavor} (= {meta_version})",
+                                        f"linux-headers{flavor} (= {meta_version})"], "kernel"))
+    return packages
+
+def generate(root, count, upgradable_ratio=0.05, kernel_upgrade=True):
+    """
+    Generates an APT root with `count` installed packages in `root`, of which
+    `upgradable_ratio` have an upgrade available. Returns the path of its apt.conf.
+    """
+    root = os.path.abspath(root)
+    repo = os.path.join(root, "repo")
+    binary_dir = os.path.join(repo, "dists", SUITE, "main", f"binary-{ARCH}")
+    for path in (binary_dir, f"{root}/etc/apt/apt.conf.d", f"{root}/etc/apt/preferences.d",
+                 f"{root}/etc/apt/sources.list.d", f"{root}/var/lib/dpkg",
+                 f"{root}/var/lib/apt/lists/partial", f"{root}/var/cache/apt/archives/partial"):
+        os.makedirs(path, exist_ok=True)
+
+    upgradable_every = int(1 / upgradable_ratio) if upgradable_ratio else 0
+    installed_kernel = kernel_packages(KERNEL_ABI_INSTALLED)
+    available_kernel = kernel_packages(KERNEL_ABI_AVAILABLE) if kernel_upgrade else []
+    with open(os.path.join(binary_dir, "Packages"), "w") as packages, \
+         open(f"{root}/var/lib/dpkg/status", "w") as status:
+        for i in range(max(count - len(installed_kernel), 0)):
+            name = f"bench-package{i}"
+            depends = [f"bench-package{i // 2}"] if i % 10 == 9 else None
+            installed_fields = package_fields(name, "1.0-1", f"bench-source{i // 3}", depends)
+            status.write(stanza(dict(installed_fields, Status="install ok installed")))
+            version = "1.1-1" if upgradable_every and not i % upgradable_every else "1.0-1"
+            available_fields = package_fields(name, version, f"bench-source{i // 3}", depends)
+            packages.write(stanza(dict(available_fields, Filename=f"pool/{name}_{version}_{ARCH}.deb",
+                                       Size="1000")))
+        for i in range(int(count * AVAILABLE_RATIO)):
+            name = f"bench-available{i}"
+            packages.write(stanza(dict(package_fields(name, "1.0-1", f"bench-available-source{i // 3}"),
+                                       Filename=f"pool/{name}_1.0-1_{ARCH}.deb", Size="1000")))
+        for fields in installed_kernel:
+            status.write(stanza(dict(fields, Status="install ok installed")))
+        for fields in installed_kernel + available_kernel:
+            packages.write(stanza(dict(fields, Filename=f"pool/{fields['Package']}_{ARCH}.deb", Size="1000")))
+
+    with open(os.path.join(binary_dir, "Packages"), "rb") as packages:
+        data = packages.read()
+    with open(os.path.join(repo, "dists", SUITE, "Release"), "w") as release:
+        release.write(stanza({"Origin": "Ubuntu",
+                              "Label": "Ubuntu",
+                              "Suite": SUITE,
+                              "Codename": SUITE,
+                              "Date": "Thu, 01 Jan 2020 00:00:00 UTC",
+                              "Architectures": ARCH,
+                              "Components": "main",
+                              "SHA256": f"\n {hashlib.sha256(data).hexdigest()} {len(data)} main/binary-{ARCH}/Packages"
+                              }).rstrip("\n") + "\n")
+
+    with open(f"{root}/etc/apt/sources.list", "w") as sources:
+        sources.write(f"deb [trusted=yes] file:{repo} {SUITE} main\n")
+    apt_conf = f"{root}/etc/apt/apt.conf"
+    with open(apt_conf, "w") as conf:
+        conf.write(f'Dir "{root}/";\n'
+                   f'Dir::State::status "{root}/var/lib/dpkg/status";\n'
+                   f'Dir::Etc::parts "{root}/etc/apt/apt.conf.d";\n'
+                   f'APT::Architecture "{ARCH}";\n'
+                   f'APT::Architectures {{ "{ARCH}"; }};\n'
+                   'APT::Sandbox::User "root";\n'
+                   'Acquire::Languages "none";\n'
+                   # Don't run the host's hooks, e.g. our own snapshot hook
+                   '#clear APT::Update::Pre-Invoke;\n'
+                   '#clear APT::Update::Post-Invoke;\n'
+                   '#clear APT::Update::Post-Invoke-Success;\n'
+                   '#clear DPkg::Pre-Invoke;\n'
+                   '#clear DPkg::Post-Invoke;\n')
+    return apt_conf
+
+def update(apt_conf):
+    """ Fetches the package lists of the generated root """
+    subprocess.run(["apt-get", "update", "-qq"], env=dict(os.environ, APT_CONFIG=apt_conf),
+                   stdout=subprocess.DEVNULL, check=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__.strip())
+        sys.exit(1)
+    _apt_conf = generate(sys.argv[1], int(sys.argv[2]), float(sys.argv[3]) if len(sys.argv) > 3 else 0.05)
+    update(_apt_conf)
+    print(f"APT_CONFIG={_apt_conf}")
@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+"""
+Times the phases of an update check against synthetic APT roots of growing
+size (see apt_root.py) and reports wall time and peak RSS per phase:
+
+- cache open, find_changes, merge_kernel_updates and serialization of
+  APTCheck on a root with pending upgrades and a kernel ABI bump
+- find_changes on an up-to-date root, with the fast path and forced through
+  the resolver, checking that the fast path finds nothing upgradable and
+  that both return the same updates
+- checkKernels.py enumeration
+- the shared snapshot, checking that the records of a check with pending
+  upgrades survive writing and reading it, and that a blacklist applies
+  to them
+
+Every measurement runs in a fresh process. Peak RSS is the high-water mark
+of that process at the end of the phase.
+
+Usage: benchmarks/check_apt.py [number of packages ...]
+"""
+
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+MINTUPDATE_DIR = os.path.join(BENCHMARKS_DIR, "..", "usr", "lib", "linuxmint", "mintUpdate")
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import apt_root
+
+def peak_rss(who=resource.RUSAGE_SELF):
+    """ Peak RSS in MiB """
+    return resource.getrusage(who).ru_maxrss / 1024
+
+class Phases:
+
+    def __init__(self):
+        self.results = []
+
+    def run(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.results.append([name, time.perf_counter() - start, peak_rss()])
+        return result
+
+def bench_check(apt_conf):
+    """ Child: phases of a check with pending updates """
+    sys.path.insert(0, MINTUPDATE_DIR)
+    from checkAPT import APTCheck
+    from common.records import write_record
+
+    phases = Phases()
+    check = APTCheck(use_mainline=False)
+    check.active_kernel_release = apt_root.ACTIVE_KERNEL
+    phases.run("cache open", check.open_cache)
+    phases.run("find_changes", check.find_changes)
+    def merge():
+        check.merge_kernel_updates()
+        check.clean_descriptions()
+    phases.run("merge_kernel_updates", merge)
+    def serialize():
+        output = io.BytesIO()
+        for update in check.updates.values():
+            write_record(output, "update", **update.to_record())
+        return len(check.updates)
+    updates = phases.run("serialization", serialize)
+    return {"phases": phases.results, "updates": updates}
+
+def bench_fast_path(apt_conf):
+    """ Child: find_changes on an up-to-date system, fast path versus resolver """
+    sys.path.insert(0, MINTUPDATE_DIR)
+    from checkAPT import APTCheck
+
+    phases = Phases()
+    check = APTCheck(use_mainline=False)
+    check.active_kernel_release = apt_root.ACTIVE_KERNEL
+    phases.run("cache open", check.open_cache)
+    upgradable = check.has_upgradable_packages()
+    phases.run("find_changes (fast path)", check.find_changes)
+    fast = sorted(check.updates)
+    check.reset()
+    # Force the full path
+    check.has_upgradable_packages = lambda: True
+    phases.run("find_changes (resolver)", check.find_changes)
+    full = sorted(check.updates)
+    return {"phases": phases.results, "agree": not upgradable and fast == full}
+
+def bench_check_kernels(apt_conf):
+    """ Child: checkKernels.py enumeration """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, os.path.join(MINTUPDATE_DIR, "checkKernels.py")],
+                             stdout=subprocess.PIPE, cwd=MINTUPDATE_DIR)
+    duration = time.perf_counter() - start
+    kernels = sum(b'"type": "kernel"' in line for line in process.stdout.splitlines())
+    return {"phases": [["checkKernels.py", duration, peak_rss(resource.RUSAGE_CHILDREN)]],
+            "kernels": kernels}
+
+def bench_snapshot(apt_conf):
+    """ Child: writes the records of a check with pending updates to a snapshot and reads them back """
+    sys.path.insert(0, MINTUPDATE_DIR)
+    import checkAPT
+    from common.records import read_records
+
+    phases = Phases()
+    check = checkAPT.APTCheck(use_mainline=False)
+    check.active_kernel_release = apt_root.ACTIVE_KERNEL
+    with tempfile.TemporaryDirectory(prefix="mintupdate-snapshot-") as tmpdir:
+        checkAPT.UPDATES_SNAPSHOT_FILE = os.path.join(tmpdir, "updates-snapshot")
+        output = io.BytesIO()
+        checkAPT.run_check(check, output)
+        output.seek(0)
+        records = [record for record in read_records(output) if record["type"] != "header"]
+        key = check.get_snapshot_key()
+        phases.run("snapshot write", checkAPT.write_snapshot, key, records, check.checked_sources)
+        snapshot, checked = phases.run("snapshot read", checkAPT.load_snapshot, key)
+        leftovers = sorted(set(os.listdir(tmpdir)) - {"updates-snapshot"})
+        # Blacklisting an update bypasses the snapshot
+        checked_names = {source_name for source_name, _version in checked}
+        name = next(record["source_name"] for record in records if record["source_name"] in checked_names)
+        check.reset()
+        check.blacklist.compile([name])
+        blacklisted = check.check_updates()
+    return {"phases": phases.results,
+            "round-trip": bool(records) and all(record["type"] == "update" for record in records) and
+                          snapshot == records and not leftovers and
+                          sorted(record["source_name"] for record in blacklisted) ==
+                          sorted(record["source_name"] for record in records if record["source_name"] != name)}
+
+CHILDREN = {"check": bench_check, "fast-path": bench_fast_path, "check-kernels": bench_check_kernels,
+            "snapshot": bench_snapshot}
+
+def run_child(name, apt_conf):
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name, apt_conf],
+                             stdout=subprocess.PIPE, env=dict(os.environ, APT_CONFIG=apt_conf), check=True)
+    return json.loads(process.stdout.decode("utf-8").splitlines()[-1])
+
+def main(sizes):
+    print(f"{'packages':>9}  {'phase':<28} {'wall (ms)':>10} {'peak RSS (MiB)':>15}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="mintupdate-bench-") as tmpdir:
+            apt_conf = apt_root.generate(os.path.join(tmpdir, "pending"), size)
+            apt_root.update(apt_conf)
+            up_to_date_conf = apt_root.generate(os.path.join(tmpdir, "up-to-date"), size,
+                                                upgradable_ratio=0, kernel_upgrade=False)
+            apt_root.update(up_to_date_conf)
+            results = [run_child("check", apt_conf),
+                       run_child("fast-path", up_to_date_conf),
+                       run_child("check-kernels", apt_conf),
+                       run_child("snapshot", apt_conf)]
+        for result in results:
+            for name, duration, rss in result["phases"]:
+                print(f"{size:>9}  {name:<28} {duration * 1000:>10.1f} {rss:>15.1f}")
+        print(f"{size:>9}  {results[0]['updates']} updates, {results[2]['kernels']} kernels, "
+              f"fast path {'agrees with' if results[1]['agree'] else 'DIFFERS FROM'} the resolver, "
+              f"snapshot {'round-trips' if results[3]['round-trip'] else 'DOES NOT ROUND-TRIP'}")
+        if not results[1]["agree"] or not results[3]["round-trip"]:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        print(json.dumps(CHILDREN[sys.argv[2]](sys.argv[3])))
+    else:
+        main([int(x) for x in sys.argv[1:]] or [1000, 10000, 50000, 100000])
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+"""
+Kernel detection time against package cache size: the three full scans
+APTCheck.find_changes() used to do versus building a KernelIndex once and
+querying it.
+
+Usage: benchmarks/kernel_index.py [number of packages ...]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "usr", "lib", "linuxmint", "mintUpdate"))
+
+from common.KernelIndex import KernelIndex
+from common.KernelVersion import KernelVersion
+
+FLAVOR = "-generic"
+ACTIVE_KERNEL = KernelVersion(f"5.4.0-40{FLAVOR}")
+
+def package_names(count):
+    """ Returns `count` package names of which roughly 5% are kernel packages """
+    names = ["linux-generic", "linux-generic-hwe-18.04", "linux-lowlatency"]
+    abi = 0
+    while len(names) < count:
+        abi += 1
+        for series in ("4.15.0", "5.0.0", "5.3.0", "5.4.0"):
+            version = f"{series}-{abi}"
+            names.append(f"linux-headers-{version}")
+            for flavor in ("-generic", "-lowlatency"):
+                for kind in ("image", "image-unsigned", "headers", "modules", "modules-extra"):
+                    names.append(f"linux-{kind}-{version}{flavor}")
+        # Pad with non-kernel packages
+        names.extend(f"libexample{abi}-{i}" for i in range(19 * 44))
+    return names[:count]
+
+def scan(names):
+    active_kernel_pkg_name = next((s for s in names \
+        if s.startswith("linux-image-") and s.endswith(ACTIVE_KERNEL.version)), "")
+    meta_names = [s for s in names if s.startswith("linux" + FLAVOR)]
+    meta_names.sort()
+    max_kernel = ACTIVE_KERNEL
+    for pkgname in names:
+        match = re.match(rf'^(?:linux-image-)(\d.+?){FLAVOR}$', pkgname)
+        if match:
+            kernel = KernelVersion(match.group(1))
+            if kernel.series == max_kernel.series and kernel.version_id > max_kernel.version_id:
+                max_kernel = kernel
+    return active_kernel_pkg_name, meta_names, max_kernel.version
+
+def index(names):
+    kernel_index = KernelIndex(names)
+    active_kernel_pkg_name = kernel_index.get_image_name(ACTIVE_KERNEL.version)
+    meta_names = kernel_index.get_meta_names(FLAVOR)
+    max_kernel = ACTIVE_KERNEL
+    for package in kernel_index.get_packages("image", FLAVOR, ACTIVE_KERNEL.series_key):
+        if package.unsigned or package.suffix:
+            continue
+        if package.kernel_version.key > max_kernel.key:
+            max_kernel = package.kernel_version
+    return active_kernel_pkg_name, meta_names, max_kernel.version
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [5000, 20000, 60000, 120000]
+    print(f"{'packages':>10} {'scan (ms)':>12} {'index (ms)':>12}")
+    for size in sizes:
+        names = package_names(size)
+        assert scan(names) == index(names)
+        repeat = 5
+        scan_time = min(timeit.repeat(lambda: scan(names), number=1, repeat=repeat))
+        index_time = min(timeit.repeat(lambda: index(names), number=1, repeat=repeat))
+        print(f"{size:>10} {scan_time * 1000:>12.2f} {index_time * 1000:>12.2f}")
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+"""
+KernelVersion against the string-based implementation it replaced: parsing
+the versions of a kernel listing, repeating that as a refresh does, sorting
+them and finding the highest version in the active series. Also checks that
+both produce the same `version_id` and the same order.
+
+Usage: benchmarks/kernel_version.py [number of versions ...]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "usr", "lib", "linuxmint", "mintUpdate"))
+
+from common import KernelVersion as kernel_version_module
+from common.KernelVersion import KernelVersion
+
+class LegacyKernelVersion:
+    """ KernelVersion before the switch to integer keys """
+
+    def __init__(self, version):
+        field_length = 3
+        self.version = version
+        self.version_id = []
+        _version_id = version.replace("-", ".").split(".")
+        suffix = next((x for x in _version_id if "rc" in x), None)
+        if suffix:
+            suffix = f"rc{suffix.split('rc', 1)[1]}"
+        else:
+            suffix = "z"
+        for element in _version_id:
+            e = element.replace(suffix, "")
+            if e and e[0].isnumeric():
+                self.version_id.append("0" * (field_length - len(e)) + e)
+        while len(self.version_id) < 3:
+            self.version_id.append("0" * field_length)
+        if len(self.version_id) == 3:
+            _version_id = self.version_id.copy()
+            self.version_id.append(f"{''.join((x[:field_length - 2].lstrip('0') + x[field_length - 2:] for x in _version_id))}{suffix}")
+        elif len(self.version_id[3]) == 6:
+            self.version_id[3] += suffix
+        self.series = tuple(self.version_id[:3])
+        self.shortseries = tuple(self.version_id[:2])
+
+ACTIVE = "4.15.0-40-generic"
+
+def versions(count):
+    """ Returns `count` versions as found in a kernel listing: packaged, mainline and rc """
+    result = []
+    abi = 0
+    while len(result) < count:
+        abi += 1
+        for series in ("4.15.0", "5.0.0", "5.3.0", "5.4.0"):
+            result.append(f"{series}-{abi}-generic")
+            result.append(f"{series}-{abi}.{abi + 3}")
+        minor = abi % 20
+        result.append(f"5.{minor}.{abi // 20}")
+        result.append(f"5.{minor}-rc{abi % 8 + 1}")
+        result.append(f"5.{minor}.0-05{minor:02}00rc{abi % 8 + 1}-generic")
+    return result[:count]
+
+def check(names):
+    for name in names:
+        assert KernelVersion(name).version_id == LegacyKernelVersion(name).version_id, name
+    # Kernel listings only compare versions of the same kind, packaged or mainline
+    for kind in ([name for name in names if "-" in name and "rc" not in name],
+                 [name for name in names if "-" not in name]):
+        legacy = sorted(kind, key=lambda name: (LegacyKernelVersion(name).version_id, name))
+        new = sorted(kind, key=lambda name: (KernelVersion(name).key, name))
+        assert legacy == new
+
+def legacy(names, repeat):
+    for _ in range(repeat):
+        kernels = [LegacyKernelVersion(name) for name in names]
+        kernels.sort(key=lambda kernel: kernel.version_id)
+        active = LegacyKernelVersion(ACTIVE)
+        max_kernel = active
+        for kernel in kernels:
+            if kernel.series == active.series and kernel.version_id > max_kernel.version_id:
+                max_kernel = kernel
+    return max_kernel.version
+
+def new(names, repeat):
+    kernel_version_module._cache.clear()
+    for _ in range(repeat):
+        kernels = [KernelVersion(name) for name in names]
+        kernels.sort()
+        active = KernelVersion(ACTIVE)
+        max_kernel = active
+        for kernel in kernels:
+            if kernel.series_key == active.series_key and kernel > max_kernel:
+                max_kernel = kernel
+    return max_kernel.version
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [500, 2000, 4000]
+    print(f"{'versions':>10} {'refreshes':>10} {'legacy (ms)':>12} {'new (ms)':>12}")
+    for size in sizes:
+        names = versions(size)
+        check(names)
+        for repeat in (1, 5):
+            assert legacy(names, repeat) == new(names, repeat)
+            legacy_time = min(timeit.repeat(lambda: legacy(names, repeat), number=1, repeat=5))
+            new_time = min(timeit.repeat(lambda: new(names, repeat), number=1, repeat=5))
+            print(f"{size:>10} {repeat:>10} {legacy_time * 1000:>12.2f} {new_time * 1000:>12.2f}")
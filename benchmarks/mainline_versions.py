@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""
+MainlineVersionIndex against the list filtering it replaced: filtering the
+versions of the mainline kernel PPA by support status as
+`get_available_versions()` does and finding the highest version in the
+active series as the update check does, repeated as the callers of a
+refresh do. Also checks that both give the same versions.
+
+Usage: benchmarks/mainline_versions.py [number of versions ...]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "usr", "lib", "linuxmint", "mintUpdate"))
+
+from common.KernelVersion import KernelVersion
+from common.MainlineVersionIndex import MainlineVersionIndex
+
+# get_available_versions() calls of one refresh: APTCheck, checkKernels.py, KernelWindow
+CALLS = 3
+
+def legacy_filter(versions, supported_series, filter_eol=True, filter_rc=True, filter_longterm=True):
+    """ MainlineKernels.filter_versions() """
+    filtered = []
+    known_series = []
+    r = re.compile(r"^(\d)\.(\d+)(-rc\d)?.*$")
+    for kernel in versions:
+        match = r.match(kernel)
+        kernel_series = f"{match.group(1)}.{match.group(2)}"
+        is_rc = match.group(3) is not None
+        if not kernel_series in known_series and not is_rc:
+            known_series.append(kernel_series)
+        if (not filter_eol or (kernel_series in supported_series and
+                               (not filter_longterm or supported_series[kernel_series] != "longterm"))) and \
+           (not is_rc or (kernel_series not in known_series and not filter_rc)):
+            filtered.append(kernel)
+    return filtered
+
+def legacy_target(versions, active):
+    """ The search of MainlineLookup.lookup_versioned_build() """
+    max_kernel = active
+    target = ""
+    for version in versions:
+        kernel = KernelVersion(version)
+        if kernel.shortseries_key == max_kernel.shortseries_key and kernel.key > max_kernel.key:
+            max_kernel = kernel
+            target = version
+    return target
+
+def mainline_versions(count):
+    """
+    Returns `count` versions as listed by the PPA, newest first, a support
+    status and an active kernel of an older longterm series
+    """
+    versions = []
+    major, minor, patch = 2, 6, 0
+    while len(versions) < count:
+        versions.append(f"{major}.{minor}.{patch}" if patch else f"{major}.{minor}")
+        if patch == 0:
+            versions.extend(f"{major}.{minor}-rc{rc}" for rc in range(1, 8))
+        patch += 1
+        if patch > 40:
+            major, minor, patch = (major + 1, 0, 0) if minor >= 19 else (major, minor + 1, 0)
+    versions = sorted(versions[:count], key=lambda version: KernelVersion(version).key, reverse=True)
+    series = list(dict.fromkeys(".".join(version.split("-")[0].split(".")[:2]) for version in versions))
+    supported_series = {x: "longterm" if i % 3 else "stable" for i, x in enumerate(series[:8])}
+    active = series[len(series) // 2]
+    supported_series[active] = "longterm"
+    major, minor = (int(x) for x in active.split("."))
+    return versions, supported_series, KernelVersion(f"{active}.0-{major:02}{minor:02}00-generic")
+
+def legacy(versions, supported_series, active):
+    for _i in range(CALLS):
+        available = legacy_filter(versions, supported_series)
+    return available, legacy_target(legacy_filter(versions, supported_series, False, False, False), active)
+
+def indexed(versions, supported_series, active):
+    # The index is built once per download of the PPA index and reused by the later calls
+    for _i in range(CALLS):
+        available = MainlineVersionIndex.of(versions).filter(supported_series).versions
+    index = MainlineVersionIndex.of(versions).filter(supported_series, False, False, False)
+    target = index.latest(MainlineVersionIndex.series_of(active))
+    return available, target if target and KernelVersion(target).key > active.key else ""
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [500, 2000, 5000]
+    print(f"{'versions':>10} {'legacy (ms)':>12} {'build (ms)':>12} {'index (ms)':>12}")
+    for size in sizes:
+        versions, supported_series, active = mainline_versions(size)
+        assert legacy(versions, supported_series, active) == indexed(versions, supported_series, active), size
+        legacy_time = min(timeit.repeat(lambda: legacy(versions, supported_series, active), number=1, repeat=5))
+        build_time = min(timeit.repeat(lambda: MainlineVersionIndex(versions), number=1, repeat=5))
+        index_time = min(timeit.repeat(lambda: indexed(versions, supported_series, active), number=1, repeat=5))
+        print(f"{size:>10} {legacy_time * 1000:>12.2f} {build_time * 1000:>12.2f} {index_time * 1000:>12.2f}")
@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+"""
+Kernel PPA index parsing: the HTMLParser subclasses MainlineKernels used to
+feed the whole page to against KernelPPA_IndexScanner fed in chunks as they
+are received. Covers the versioned builds index, the daily builds index
+and the file list of a version. Also checks that both find the same
+entries.
+
+The pages follow the Apache autoindex markup of kernel.ubuntu.com, with
+`rows` entries in each index. The file list is also checked with links
+carrying more attributes than href, as other web servers write them.
+
+Usage: benchmarks/ppa_index.py [rows ...]
+"""
+
+import datetime
+import os
+import re
+import sys
+import timeit
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "usr", "lib", "linuxmint", "mintUpdate"))
+
+from common.MainlineKernels import (DAILY_BUILD_PATTERN, PACKAGE_PATTERN, VERSION_PATTERN,
+                                    KernelPPA_IndexScanner)
+
+ARCH = "amd64"
+KERNEL_TYPE = "-generic"
+CHUNK_SIZE = 16384
+
+class LegacyIndexParser(HTMLParser):
+    """ KernelPPA_IndexParser """
+
+    def __init__(self):
+        super().__init__()
+        self.new_row = False
+        self.r = re.compile(r"^v(\d)\.(\d+)(.*?)?\/$")
+        self.versions = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self.new_row = True
+
+    def handle_data(self, data):
+        if self.new_row:
+            match = self.r.match(data)
+            if match:
+                self.versions.append(data[1:-1])
+                self.new_row = False
+
+class LegacyDailyIndexParser(HTMLParser):
+    """ KernelPPA_DailyIndexParser """
+
+    def __init__(self):
+        super().__init__()
+        self.new_row = False
+        self.r = re.compile(r"^(\d{4}-\d{2}-\d{2})\/$")
+        self.daily_build = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self.new_row = True
+
+    def handle_data(self, data):
+        if self.new_row:
+            match = self.r.match(data)
+            if match:
+                self.daily_build = data[:-1]
+
+class LegacyKernelParser(HTMLParser):
+    """ KernelPPA_KernelParser """
+
+    def __init__(self, kernel_type, arch):
+        super().__init__()
+        self.new_row = False
+        self.r = re.compile(r"^(.+?)\-(.+?)\-(\d\.\d+\.\d+\-\d+(?:rc\d)?)(\-.+?)?_(.+?)\_(.+?)\.deb$")
+        self.arch = arch
+        self.kernel_type = kernel_type
+        self.files = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self.new_row = True
+
+    def handle_data(self, data):
+        if self.new_row:
+            match = self.r.match(data)
+            if match and match.group(1) == "linux" and \
+               (not match.group(4) or match.group(4) == self.kernel_type) and \
+               (match.group(6) == "all" or match.group(6) == self.arch):
+                self.files.append(data)
+                self.new_row = False
+
+class Response:
+    """ The parts of a `requests` response the scanner uses """
+
+    def __init__(self, content):
+        self.content = content
+        self.encoding = "utf-8"
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+def row(name, icon="folder.gif", alt="[DIR]", size="-", link_attrs=""):
+    return (f'<tr><td valign="top"><img src="/icons/{icon}" alt="{alt}"></td>'
+            f'<td><a{link_attrs} href="{name}">{name}</a></td>'
+            f'<td align="right">2020-02-03 10:15  </td><td align="right">{size} </td><td>&nbsp;</td></tr>\n')
+
+def page(title, rows, header=""):
+    return (f"<!DOCTYPE HTML PUBLIC \"-//W3C//DTD HTML 3.2 Final//EN\">\n<html>\n <head>\n"
+            f"  <title>Index of {title}</title>\n </head>\n <body>\n{header}<table>\n"
+            '   <tr><th valign="top"><img src="/icons/blank.gif" alt="[ICO]"></th>'
+            '<th><a href="?C=N;O=D">Name</a></th><th><a href="?C=M;O=A">Last modified</a></th>'
+            '<th><a href="?C=S;O=A">Size</a></th><th><a href="?C=D;O=A">Description</a></th></tr>\n'
+            '   <tr><th colspan="5"><hr></th></tr>\n'
+            + "".join(rows) +
+            '   <tr><th colspan="5"><hr></th></tr>\n</table>\n<address>Apache/2.4.29 (Ubuntu) Server</address>\n'
+            "</body></html>\n")
+
+def versions_page(rows):
+    names = []
+    major, minor, patch = 2, 6, 0
+    while len(names) < rows:
+        names.append(f"v{major}.{minor}.{patch}/")
+        if patch == 0:
+            names.extend(f"v{major}.{minor}-rc{rc}/" for rc in range(1, 8))
+        patch += 1
+        if patch > 40:
+            major, minor, patch = (major + 1, 0, 0) if minor >= 19 else (major, minor + 1, 0)
+    return page("/~kernel-ppa/mainline", [row(name) for name in sorted(names[:rows])])
+
+def daily_page(rows):
+    start = datetime.date(2015, 1, 1)
+    names = [f"{start + datetime.timedelta(days=i)}/" for i in range(rows)] + ["current/"]
+    return page("/~kernel-ppa/mainline/daily", [row(name) for name in sorted(names)])
+
+def files_page(link_attrs=""):
+    version = "5.5.0-050500"
+    rows = []
+    for arch in ("amd64", "arm64", "armhf", "i386", "ppc64el", "s390x"):
+        rows.append(row(f"linux-headers-{version}_{version}.202001262030_all.deb", "unknown.gif", "[   ]", "11M"))
+        for flavor in ("generic", "generic-lpae", "lowlatency"):
+            for kind in ("headers", "image-unsigned", "modules"):
+                rows.append(row(f"linux-{kind}-{version}-{flavor}_{version}.202001262030_{arch}.deb",
+                                "unknown.gif", "[   ]", "1.2M", link_attrs))
+    rows.extend(row(name, "text.gif", "[TXT]", "1K") for name in ("CHANGES", "CHECKSUMS", "CHECKSUMS.gpg"))
+    header = "<p>Build for amd64 succeeded (rc=0, on=amd64, time=0:21:27)</p>\n" * 6
+    return page("/~kernel-ppa/mainline/v5.5", sorted(rows), header)
+
+def legacy_versions(text):
+    parser = LegacyIndexParser()
+    parser.feed(text)
+    parser.close()
+    return parser.versions[::-1]
+
+def new_versions(content):
+    versions = [entry[1:-1] for entry in KernelPPA_IndexScanner().scan(Response(content), CHUNK_SIZE)
+                if VERSION_PATTERN.match(entry)]
+    return versions[::-1]
+
+def legacy_daily(text):
+    parser = LegacyDailyIndexParser()
+    parser.feed(text)
+    parser.close()
+    return parser.daily_build
+
+def new_daily(content):
+    return max((entry[:-1] for entry in KernelPPA_IndexScanner().scan(Response(content), CHUNK_SIZE)
+                if DAILY_BUILD_PATTERN.match(entry)), default=None)
+
+def legacy_files(text):
+    parser = LegacyKernelParser(KERNEL_TYPE, ARCH)
+    parser.feed(text)
+    parser.close()
+    return parser.files
+
+def new_files(content):
+    scanner = KernelPPA_IndexScanner(f"Build for {ARCH} failed")
+    files = []
+    for entry in scanner.scan(Response(content), CHUNK_SIZE):
+        if scanner.marker_found:
+            break
+        match = PACKAGE_PATTERN.match(entry)
+        if match and match.group(1) == "linux" and \
+           (not match.group(4) or match.group(4) == KERNEL_TYPE) and \
+           (match.group(6) == "all" or match.group(6) == ARCH):
+            files.append(entry)
+    return files
+
+def measure(label, legacy, legacy_page, new, new_page):
+    legacy_result = legacy(legacy_page.decode("utf-8"))
+    assert legacy_result == new(new_page), label
+    # The legacy parsers needed the whole page as text first
+    legacy_time = min(timeit.repeat(lambda: legacy(legacy_page.decode("utf-8")), number=1, repeat=5))
+    new_time = min(timeit.repeat(lambda: new(new_page), number=1, repeat=5))
+    print(f"{label:>24} {len(new_page) // 1024:>8} {legacy_time * 1000:>12.2f} {new_time * 1000:>12.2f}")
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [500, 2000, 5000]
+    print(f"{'page':>24} {'KiB':>8} {'legacy (ms)':>12} {'scanner (ms)':>12}")
+    files = files_page().encode("utf-8")
+    measure("version files", legacy_files, files, new_files, files)
+    files = files_page(' class="file" title="Download"').encode("utf-8")
+    measure("files, more attributes", legacy_files, files, new_files, files)
+    for size in sizes:
+        versions = versions_page(size).encode("utf-8")
+        measure(f"versions ({size})", legacy_versions, versions, new_versions, versions)
+        daily = daily_page(size).encode("utf-8")
+        measure(f"daily builds ({size})", legacy_daily, daily, new_daily, daily)
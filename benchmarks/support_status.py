@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""
+Mainline kernel support status: reading releases.json from a mirror of the
+mainline kernel PPA against parsing the kernel.org front page, the fallback
+for mirrors without releases.json. Both are served by a local HTTP server
+standing in for the mirror and kernel.org. Checks that both give the
+expected support status.
+
+Usage: benchmarks/support_status.py [repeats]
+"""
+
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "usr", "lib", "linuxmint", "mintUpdate"))
+
+from common.HTTPCache import HTTPCache
+from common.MainlineKernels import RELEASES_FILE, MainlineKernels
+
+RELEASES = [("mainline", "6.12-rc3", False),
+            ("stable", "6.11.3", False),
+            ("stable", "6.10.14", True),
+            ("longterm", "6.6.56", False),
+            ("longterm", "6.1.112", False),
+            ("longterm", "4.19.322", True),
+            ("linux-next", "next-20241016", False)]
+EXPECTED = {"6.12": "mainline", "6.11": "stable", "6.10": "eol", "6.6": "longterm", "6.1": "longterm",
+            "4.19": "eol"}
+
+def releases_json():
+    return json.dumps({"releases": [{"moniker": moniker, "version": version, "iseol": iseol}
+                                    for moniker, version, iseol in RELEASES]})
+
+def front_page():
+    """ The releases table of the kernel.org front page """
+    rows = []
+    for moniker, version, iseol in RELEASES:
+        eol = ' <span class="eolkernel">[EOL]</span>' if iseol else ""
+        rows.append(f'<tr align="left"><td>{moniker}:</td><td><strong>{version}</strong>{eol}</td>'
+                    '<td>2024-10-16</td><td>[<a href="#">tarball</a>]</td></tr>')
+    return ('<html><body><table id="latest"><tr><td>Latest Release</td></tr></table>\n'
+            f'<table id="releases">\n{chr(10).join(rows)}\n</table></body></html>')
+
+def serve(pages):
+    """ Serves `pages`, a dict of path: text, on a local port and returns its URL """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            page = pages.get(self.path)
+            if page is None:
+                self.send_error(404)
+                return
+            data = page.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/"
+
+def support_status(mirror_url, front_page_url, cache_dir):
+    mainline = MainlineKernels(cached=False, flavor="-generic", ppa_url=mirror_url)
+    mainline.supported_url = front_page_url
+    mainline.cache = HTTPCache(cache_dir, cache_dir)
+    return mainline.get_support_status()
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    url = serve({f"/mirror/{RELEASES_FILE}": releases_json(),
+                 "/kernel.org/": front_page()})
+    failed = False
+    print(f"{'source':>24} {'time (ms)':>10}  status")
+    with tempfile.TemporaryDirectory(prefix="mintupdate-support-status-") as tmpdir:
+        # The HTML-only mirror has no releases.json, so the front page is parsed
+        for label, mirror in (("releases.json", "mirror/"), ("front page", "html-only-mirror/")):
+            def run():
+                return support_status(f"{url}{mirror}", f"{url}kernel.org/", tmpdir)
+            status = run()
+            duration = min(timeit.repeat(run, number=1, repeat=repeat))
+            ok = status == EXPECTED
+            failed = failed or not ok
+            print(f"{label:>24} {duration * 1000:>10.2f}  {'as expected' if ok else f'UNEXPECTED {status}'}")
+    if failed:
+        sys.exit(1)
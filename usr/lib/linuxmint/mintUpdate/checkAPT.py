@@ -1,21 +1,40 @@
 #!/usr/bin/python3
 
-import fnmatch
+import fcntl
+import hashlib
+import json
 import os
-import re
+import socketserver
 import sys
+import threading
+import time
 from datetime import datetime, timedelta
 
 import apt
+import apt_pkg
 
 from common import settings
-from common.constants import (KERNEL_PKG_NAMES, PRIORITY_UPDATES,
-                              SUPPORTED_KERNEL_TYPES, USE_MAINLINE_KERNELS)
+from common.Blacklist import Blacklist
+from common.constants import (CHECK_APT_LOCK, CHECK_APT_SOCKET, KERNEL_PKG_NAMES,
+                              PRIORITY_UPDATES, SUPPORTED_KERNEL_TYPES,
+                              UPDATES_SNAPSHOT_FILE)
 from common.functions import configured_kernel_type
+from common.KernelIndex import KernelIndex
 from common.KernelVersion import KernelVersion
 from common.MainlineKernels import MainlineKernels
+from common.Profiler import profiler
+from common.records import (RecordStreamError, read_records, write_header,
+                            write_record)
 from main.Update import Update
 
+DEBUG = False
+# Seconds without a request after which the check service exits
+SERVICE_IDLE_TIMEOUT = 1800
+# Seconds after which a check completes without waiting for mainline kernel data
+MAINLINE_LOOKUP_TIMEOUT = 10
+# Environment variables selecting the language of descriptions, see gettext(3)
+LOCALE_VARIABLES = ("LANGUAGE", "LC_ALL", "LC_MESSAGES", "LANG")
+
 
 def get_origins(package):
     package_origins = set()
@@ -25,6 +44,168 @@ def get_origins(package):
                 package_origins.add(origin.origin)
     return package_origins
 
+def get_cache_stamp():
+    """ Returns modification times and sizes of the files an `apt.Cache` is built from """
+    stamp = []
+    for path in (apt_pkg.config.find_file("Dir::Cache::pkgcache"),
+                 apt_pkg.config.find_file("Dir::State::status"),
+                 apt_pkg.config.find_dir("Dir::State::Lists")):
+        try:
+            stat = os.stat(path)
+            stamp.append([stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+def load_snapshot(key):
+    """
+    Returns the update records and the checked source packages of the shared
+    snapshot if its key is `key`, else `None`
+    """
+    try:
+        with open(UPDATES_SNAPSHOT_FILE, "rb") as snapshot:
+            records = list(read_records(snapshot))
+    except (OSError, RecordStreamError):
+        return None
+    if len(records) < 2 or records[1]["type"] != "snapshot" or records[1].get("key") != key:
+        return None
+    return ([record for record in records[2:] if record["type"] == "update"],
+            records[1].get("checked", []))
+
+def write_snapshot(key, records, checked=()):
+    """
+    Atomically replaces the shared snapshot with `records`, the results of a
+    check ignoring the blacklist. `checked` lists the [source name, version]
+    pairs the check would have looked up in the blacklist.
+    """
+    tmpfile = f"{UPDATES_SNAPSHOT_FILE}.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(UPDATES_SNAPSHOT_FILE), exist_ok=True)
+        with open(tmpfile, "wb") as snapshot:
+            write_header(snapshot)
+            write_record(snapshot, "snapshot", key=key, checked=[list(pair) for pair in checked])
+            for record in records:
+                write_record(snapshot, record["type"], **record)
+        os.chmod(tmpfile, 0o644)
+        os.replace(tmpfile, UPDATES_SNAPSHOT_FILE)
+    except OSError:
+        pass
+    finally:
+        # Left behind if anything failed
+        try:
+            os.unlink(tmpfile)
+        except OSError:
+            pass
+
+class MainlineLookup(threading.Thread):
+    """
+    Retrieves the mainline kernel update for `active_kernel` in the
+    background, so the requests overlap with the APT work of the check.
+    The support status and the available versions are requested at the same
+    time. Waiting for the results is up to the caller, until `deadline`.
+
+    Results are `files`, the file list of `target_kernel_version`, which is
+    `None` if there is no update, or `error`, the message to print.
+    """
+
+    def __init__(self, mainline, active_kernel, branch_id, upgrade_series, timeout=MAINLINE_LOOKUP_TIMEOUT):
+        threading.Thread.__init__(self, daemon=True)
+        self.mainline = mainline
+        self.active_kernel = active_kernel
+        self.branch_id = branch_id
+        self.upgrade_series = upgrade_series
+        self.deadline = time.monotonic() + timeout
+        self.error = None
+        self.files = None
+        self.target_kernel_version = None
+        self.latest_build_date = None
+        self.mainline_kernels = []
+        self.is_eol = False
+        self.is_rc = False
+        self._support_status = None
+        self._support_status_error = None
+
+    def run(self):
+        with profiler.phase("mainline lookup"):
+            try:
+                if self.branch_id == 0:
+                    self.lookup_versioned_build()
+                else:
+                    self.lookup_daily_build()
+            except self.mainline.MainlineKernelsException as e:
+                self.error = str(e)
+            except:
+                self.error = "E: Exception trying to retrieve available mainline kernel versions"
+            finally:
+                # The service runs a lookup per check, do not keep their connections
+                self.mainline.close()
+
+    def _get_support_status(self):
+        try:
+            self._support_status = self.mainline.get_support_status()
+        except Exception as e:
+            self._support_status_error = e
+
+    def lookup_versioned_build(self):
+        mainline = self.mainline
+        active_kernel = self.active_kernel
+        status_thread = threading.Thread(target=self._get_support_status, daemon=True)
+        status_thread.start()
+        index = mainline.get_version_index()
+        status_thread.join(max(self.deadline - time.monotonic(), 0))
+        if self._support_status_error:
+            raise self._support_status_error
+        if self._support_status is None:
+            # Timed out, the caller gives up anyway
+            return
+        ver = ".".join(active_kernel.version.split(".")[:2])
+        if not ver in self._support_status or self._support_status[ver] == "eol":
+            self.is_eol = True
+        # if the active kernel is not eol, check if it is a release candidate
+        self.is_rc = not self.is_eol and active_kernel.is_rc
+        mainline.include_rc = self.is_rc
+        index = mainline.filter_versions(
+            index, self._support_status,
+            filter_eol=not (self.is_eol or self.upgrade_series),
+            filter_rc=not self.is_rc,
+            filter_longterm=False)
+        self.mainline_kernels = index.versions
+        if not self.mainline_kernels:
+            self.error = "E: Could not retrieve available mainline kernel versions"
+            return
+        # get the highest available mainline kernel version matching the
+        # current shortseries, or, if the current series is end of life
+        # and series upgrades are enabled, the highest available mainline
+        # kernel from the highest released series:
+        if self.is_eol and self.upgrade_series:
+            target_kernel_version = index.latest()
+        else:
+            target_kernel_version = index.latest(ver)
+        if not target_kernel_version or KernelVersion(target_kernel_version).key <= active_kernel.key:
+            return
+        self.files = mainline.get_filelist(target_kernel_version)
+        self.target_kernel_version = target_kernel_version
+
+    def lookup_daily_build(self):
+        target_kernel_version = self.mainline.get_daily_build()
+        if not target_kernel_version:
+            self.error = "E: Could not retrieve available mainline kernel versions"
+            return
+        self.mainline_kernels = [target_kernel_version]
+        active_build_date = os.uname().version[1:9]
+        # The source version is one day older than the actual build date, so we
+        # substract a day to be able to compare with the installed build
+        latest_build_date = KernelVersion(target_kernel_version).version_id[3]
+        latest_build_date = datetime.strptime(latest_build_date, "%Y%m%dz")
+        latest_build_date = latest_build_date - timedelta(days=1)
+        latest_build_date = latest_build_date.strftime("%Y%m%d")
+        # Check if we're already on the latest build:
+        if latest_build_date == active_build_date:
+            return
+        self.files = self.mainline.get_filelist(target_kernel_version)
+        self.target_kernel_version = target_kernel_version
+        self.latest_build_date = latest_build_date
+
 class Meta:
 
     def __init__(self, package_name, package):
@@ -35,37 +216,135 @@ class Meta:
 class APTCheck:
 
     def __init__(self, use_mainline=None):
-        if not use_mainline == None:
-            self.use_mainline = use_mainline
+        self.use_mainline_override = use_mainline
+        self.active_kernel_release = os.uname().release
+        self.cache = None
+        self.cache_stamp = None
+        self.kernel_index = None
+        self.priority_updates_available = False
+        self.updates = {}
+        self.metas = {}
+        self.blacklist = Blacklist()
+        self.ignore_blacklist = False
+        # (source name, version) pairs looked up in the blacklist
+        self.checked_sources = set()
+        self.load_settings()
+
+    def load_settings(self):
+        """ (Re-)reads the settings the check depends on """
+        if not self.use_mainline_override == None:
+            self.use_mainline = self.use_mainline_override
             self.mainline_upgrade_series = True
         else:
-            self.use_mainline = USE_MAINLINE_KERNELS
+            self.use_mainline = settings.get_boolean("use-mainline-kernels")
             self.mainline_upgrade_series = settings.get_boolean("mainline-upgrade-eol-series")
-        self.cache = apt.Cache()
-        self.priority_updates_available = False
-        self.updates = {}
         self.configured_kernel_type = configured_kernel_type()
-        self.metas = {}
+        self.blacklist.reload()
+
+    def open_cache(self):
+        """ Opens the cache if it isn't open yet """
+        if not self.cache:
+            with profiler.phase("cache open"):
+                self.cache = apt.Cache()
+            self.cache_stamp = get_cache_stamp()
+            self.kernel_index = None
+
+    def reset(self):
+        """
+        Prepares a long-lived instance for another `find_changes()` run,
+        reloading the cache in place if the package lists or dpkg status changed
+        """
+        if self.cache:
+            cache_stamp = get_cache_stamp()
+            if cache_stamp != self.cache_stamp:
+                with profiler.phase("cache reload"):
+                    self.cache.open()
+                self.cache_stamp = cache_stamp
+                self.kernel_index = None
+            else:
+                self.cache.clear()
+        self.priority_updates_available = False
+        self.updates.clear()
+        self.metas.clear()
+        self.checked_sources.clear()
+        self.load_settings()
+
+    def get_snapshot_key(self):
+        """
+        Returns the key of the shared snapshot matching the current package
+        cache, dpkg status, kernel and language. Snapshots are only used
+        with mainline kernels disabled, whatever the other mainline settings.
+        """
+        key = [get_cache_stamp(), self.active_kernel_release, self.configured_kernel_type,
+               [os.environ.get(name) for name in LOCALE_VARIABLES], self.use_mainline]
+        return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+    def check_updates(self):
+        """
+        Returns the update records of a complete check. They are taken from the
+        shared snapshot if it matches, else computed and, when running as root,
+        written to the snapshot for everyone else to use.
+
+        The snapshot holds the results of a check ignoring the blacklist, so it
+        serves every user. Users whose blacklist matches any of the source
+        packages it checked get a check of their own.
+
+        Checks with mainline kernels enabled bypass the snapshot, as their
+        results depend on the mainline kernel PPA rather than on local state.
+        """
+        use_snapshot = not self.use_mainline
+        if use_snapshot:
+            with profiler.phase("snapshot lookup"):
+                snapshot = load_snapshot(self.get_snapshot_key())
+            if snapshot is not None:
+                records, checked = snapshot
+                if not self.is_any_blacklisted(checked):
+                    profiler.count("snapshot hits")
+                    return records
+        self.open_cache()
+        if not (use_snapshot and os.getuid() == 0):
+            return self.get_update_records()
+        records = self.get_update_records(ignore_blacklist=True)
+        # Opening the cache may have rebuilt it, so get a fresh key
+        with profiler.phase("snapshot write"):
+            write_snapshot(self.get_snapshot_key(), records, self.checked_sources)
+        if self.is_any_blacklisted(self.checked_sources):
+            self.cache.clear()
+            records = self.get_update_records()
+        return records
+
+    def get_update_records(self, ignore_blacklist=False):
+        """ Finds the updates and returns their records """
+        self.ignore_blacklist = ignore_blacklist
+        self.priority_updates_available = False
+        self.checked_sources.clear()
+        try:
+            self.find_changes()
+        finally:
+            self.ignore_blacklist = False
+        with profiler.phase("merge_kernel_updates"):
+            self.merge_kernel_updates()
+            self.clean_descriptions()
+        return [dict(update.to_record(), type="update") for update in self.updates.values()]
+
+    def has_upgradable_packages(self):
+        """
+        Returns True if any installed package has a newer candidate version,
+        checked on the low-level apt_pkg cache without running the resolver
+        """
+        depcache = self.cache._depcache
+        for package in self.cache._cache.packages:
+            # is_upgradable() is also true for packages that aren't installed
+            if package.current_ver and depcache.is_upgradable(package):
+                return True
+        return False
 
     def find_changes(self):
-        self.cache.upgrade(True) # dist-upgrade
-        changes = self.cache.get_changes()
-
+        self.open_cache()
         self.updates.clear()
 
-        ### Package updates:
-        for pkg in changes:
-            if pkg.is_installed and pkg.marked_upgrade and pkg.candidate.version != pkg.installed.version:
-                self.add_update(pkg)
-
-        # Stop here if we have priority updates - which kernels never are
-        if self.priority_updates_available:
-            return
-
-        ### Kernel updates:
-
         # Get the uname version
-        active_kernel = KernelVersion(os.uname().release)
+        active_kernel = KernelVersion(self.active_kernel_release)
 
         # Uncomment for testing, pass --debug parameter on command line or set this:
         # global DEBUG
@@ -80,109 +359,132 @@ class APTCheck:
         # self.mainline_upgrade_series = True
         # self.mainline_upgrade_series = False
 
+        # Have the mainline kernel data retrieved while we resolve the upgrades
+        mainline_lookup = self.start_mainline_lookup(active_kernel)
+
+        ### Package updates:
+        # The resolver can only mark upgrades if there's an upgradable package,
+        # skip it in the common case of there being none
+        with profiler.phase("upgradable scan"):
+            upgradable = self.has_upgradable_packages()
+        if upgradable:
+            with profiler.phase("cache.upgrade"):
+                self.cache.upgrade(True) # dist-upgrade
+            for pkg in self.cache.get_changes():
+                if pkg.is_installed and pkg.marked_upgrade and pkg.candidate.version != pkg.installed.version:
+                    self.add_update(pkg)
+
+        # Stop here if we have priority updates - which kernels never are
+        if self.priority_updates_available:
+            return
+
+        ### Kernel updates:
+
         # Get available meta-packages
-        active_kernel_pkg_name = next((s for s in self.cache.keys() \
-            if s.startswith("linux-image-") and s.endswith(active_kernel.version)), "")
-        active_kernel_pkg = self.cache.get(active_kernel_pkg_name)
-        if active_kernel_pkg:
-            active_kernel_origins = get_origins(active_kernel_pkg)
-        else:
-            active_kernel_origins = set()
-        lts_meta_name = "linux" + self.configured_kernel_type
-        meta_names = [s for s in self.cache.keys() if s.startswith(lts_meta_name)]
-        meta_names.sort()
-        if self.configured_kernel_type == "-generic" and "Ubuntu" in active_kernel_origins:
-            meta_names.append("linux-virtual")
-        elif self.configured_kernel_type == "-liquorix":
-            # The Liquorix PPA doesn't include a linux-liquorix meta unfortunately
-            meta_names.append("linux-headers-liquorix-amd64")
-            meta_names.append("linux-image-liquorix-amd64")
-        for meta_name in meta_names:
-            meta_name = meta_name.split(":")[0]
-            if not meta_name in self.metas:
-                meta_pkg = self.cache.get(meta_name)
-                if meta_pkg:
-                    self.metas[meta_name] = Meta(meta_name, meta_pkg)
-
-        # Override installed kernel if not of the configured type
-        try:
-            active_kernel_type = "-" + active_kernel.version.split("-")[-1]
-        except:
-            active_kernel_type = self.configured_kernel_type
-        if  active_kernel_type != self.configured_kernel_type:
-            active_kernel.series = ("0", "0", "0")
-
-        # Check if any meta is installed..
-        meta_candidate_same_series = None
-        meta_candidate_higher_series = None
-        for meta_name, meta in self.metas.items():
-            if not active_kernel_origins.intersection(meta.origins):
-                # Meta package shares no origin with the active kernel, ignore
-                continue
-            meta_kernel = KernelVersion(meta.package.candidate.version)
-            if active_kernel.series > meta_kernel.series:
-                # Meta is lower than the active kernel series, ignore
-                continue
+        if not self.kernel_index:
+            with profiler.phase("kernel index"):
+                self.kernel_index = KernelIndex(self.cache.keys())
+        with profiler.phase("kernel meta selection"):
+            active_kernel_pkg_name = self.kernel_index.get_image_name(active_kernel.version)
+            active_kernel_pkg = self.cache.get(active_kernel_pkg_name)
+            if active_kernel_pkg:
+                active_kernel_origins = get_origins(active_kernel_pkg)
             else:
-                # Meta is higher or same as active kernel series:
-                if meta.package.is_installed:
-                    # Meta is already installed, return
-                    return
-                # never install linux-virtual, we only support it if installed
-                if meta_name == "linux-virtual":
+                active_kernel_origins = set()
+            lts_meta_name = "linux" + self.configured_kernel_type
+            meta_names = self.kernel_index.get_meta_names(self.configured_kernel_type)
+            if self.configured_kernel_type == "-generic" and "Ubuntu" in active_kernel_origins:
+                meta_names.append("linux-virtual")
+            elif self.configured_kernel_type == "-liquorix":
+                # The Liquorix PPA doesn't include a linux-liquorix meta unfortunately
+                meta_names.append("linux-headers-liquorix-amd64")
+                meta_names.append("linux-image-liquorix-amd64")
+            for meta_name in meta_names:
+                meta_name = meta_name.split(":")[0]
+                if not meta_name in self.metas:
+                    meta_pkg = self.cache.get(meta_name)
+                    if meta_pkg:
+                        self.metas[meta_name] = Meta(meta_name, meta_pkg)
+
+            # Override installed kernel if not of the configured type
+            try:
+                active_kernel_type = "-" + active_kernel.version.split("-")[-1]
+            except:
+                active_kernel_type = self.configured_kernel_type
+            active_series = active_kernel.series_key
+            if  active_kernel_type != self.configured_kernel_type:
+                active_series = (0, 0, 0)
+
+            # Check if any meta is installed..
+            meta_candidate_same_series = None
+            meta_candidate_higher_series = None
+            for meta_name, meta in self.metas.items():
+                if not active_kernel_origins.intersection(meta.origins):
+                    # Meta package shares no origin with the active kernel, ignore
+                    continue
+                meta_kernel = KernelVersion(meta.package.candidate.version)
+                if active_series > meta_kernel.series_key:
+                    # Meta is lower than the active kernel series, ignore
                     continue
-                # Meta is not installed, make it a candidate if higher than any
-                # current candidate
-                if active_kernel.series == meta_kernel.series:
-                    # same series
-                    if not meta_candidate_same_series or meta_kernel.version_id > \
-                        KernelVersion(meta_candidate_same_series.candidate.version).version_id:
-                        meta_candidate_same_series = meta.package
                 else:
-                    # higher series
-                    if meta_candidate_higher_series:
-                        meta_candidate_version = KernelVersion(meta_candidate_higher_series.candidate.version)
-                    # use meta with lowest highest series with highest version
-                    if not meta_candidate_higher_series or \
-                       meta_kernel.series < meta_candidate_version.series or \
-                       (meta_kernel.series == meta_candidate_version.series and \
-                       meta_kernel.version_id > meta_candidate_version.version_id):
-                        meta_candidate_higher_series = meta.package
-
-        # If we're here, no meta was installed
-        if self.configured_kernel_type == "-liquorix":
-            # Since the Liquorix PPA has no proper meta, we need to work around this:
-            for meta in self.metas:
-                self.add_update(meta, kernel_update=True)
-            return
-        if meta_candidate_same_series:
-            # but a candidate of the same series was found, add to updates and return
-            self.add_update(meta_candidate_same_series, kernel_update=True)
-            return
+                    # Meta is higher or same as active kernel series:
+                    if meta.package.is_installed:
+                        # Meta is already installed, return
+                        return
+                    # never install linux-virtual, we only support it if installed
+                    if meta_name == "linux-virtual":
+                        continue
+                    # Meta is not installed, make it a candidate if higher than any
+                    # current candidate
+                    if active_series == meta_kernel.series_key:
+                        # same series
+                        if not meta_candidate_same_series or meta_kernel.key > \
+                            KernelVersion(meta_candidate_same_series.candidate.version).key:
+                            meta_candidate_same_series = meta.package
+                    else:
+                        # higher series
+                        if meta_candidate_higher_series:
+                            meta_candidate_version = KernelVersion(meta_candidate_higher_series.candidate.version)
+                        # use meta with lowest highest series with highest version
+                        if not meta_candidate_higher_series or \
+                           meta_kernel.series_key < meta_candidate_version.series_key or \
+                           (meta_kernel.series_key == meta_candidate_version.series_key and \
+                           meta_kernel.key > meta_candidate_version.key):
+                            meta_candidate_higher_series = meta.package
+
+            # If we're here, no meta was installed
+            if self.configured_kernel_type == "-liquorix":
+                # Since the Liquorix PPA has no proper meta, we need to work around this:
+                for meta in self.metas:
+                    self.add_update(meta, kernel_update=True)
+                return
+            if meta_candidate_same_series:
+                # but a candidate of the same series was found, add to updates and return
+                self.add_update(meta_candidate_same_series, kernel_update=True)
+                return
 
-        # If we're here, no matching meta was found
-        if meta_candidate_higher_series:
-            # but we found a higher meta candidate, add it to the list of updates
-            # unless the installed kernel series is lower than the LTS series
-            # for some reason, in the latter case force the LTS meta
-            if meta_candidate_higher_series.name != lts_meta_name and lts_meta_name in self.cache:
-                lts_meta = self.cache.get(lts_meta_name)
-                lts_meta_kernel = KernelVersion(lts_meta.candidate.version)
-                if active_kernel.series < lts_meta_kernel.series:
-                    meta_candidate_higher_series = lts_meta
-            self.add_update(meta_candidate_higher_series, kernel_update=True)
-            return
+            # If we're here, no matching meta was found
+            if meta_candidate_higher_series:
+                # but we found a higher meta candidate, add it to the list of updates
+                # unless the installed kernel series is lower than the LTS series
+                # for some reason, in the latter case force the LTS meta
+                if meta_candidate_higher_series.name != lts_meta_name and lts_meta_name in self.cache:
+                    lts_meta = self.cache.get(lts_meta_name)
+                    lts_meta_kernel = KernelVersion(lts_meta.candidate.version)
+                    if active_series < lts_meta_kernel.series_key:
+                        meta_candidate_higher_series = lts_meta
+                self.add_update(meta_candidate_higher_series, kernel_update=True)
+                return
 
         # We've gone past all the metas, so we should recommend the latest
         # kernel on the series we're in
         max_kernel = active_kernel
-        for pkgname in self.cache.keys():
-            match = re.match(rf'^(?:linux-image-)(\d.+?){active_kernel_type}$', pkgname)
-            if match:
-                kernel = KernelVersion(match.group(1))
-                if kernel.series == max_kernel.series and kernel.version_id > max_kernel.version_id:
-                    max_kernel = kernel
-        if max_kernel.version_id != active_kernel.version_id:
+        for package in self.kernel_index.get_packages("image", active_kernel_type, active_series):
+            if package.unsigned or package.suffix:
+                continue
+            if package.kernel_version.key > max_kernel.key:
+                max_kernel = package.kernel_version
+        if max_kernel.key != active_kernel.key:
             _upgrade_added = False
             for pkgname in KERNEL_PKG_NAMES:
                 pkgname = pkgname.replace('VERSION', max_kernel.version).replace("-KERNELTYPE", active_kernel_type)
@@ -194,110 +496,43 @@ class APTCheck:
                 return
 
         # check mainline kernels, if enabled
-        if self.use_mainline:
-            if active_kernel.version_id[3].isnumeric():
-                # Daily builds like "5.2.0-999-generic"
-                mainline_branch_id = int(active_kernel.version_id[3])
-            else:
-                # Regular versioned builds
-                mainline_branch_id = 0
-            # since all we got is the active kernel version, try to make sure there's no
-            # signed, i.e. non-mainline package of the same version installed:
-            pkg = self.cache.get(f"linux-image-{active_kernel.version}")
-            if not DEBUG and pkg and pkg.is_installed:
-                return
-            # and that an unsigned, local version is installed instead:
-            pkg = self.cache.get(f"linux-image-unsigned-{active_kernel.version}")
-            if not DEBUG and (not pkg or not pkg.is_installed or pkg.candidate.downloadable):
-                return
-            max_kernel = active_kernel
-            try:
-                mainline = MainlineKernels(cached=True, branch_id=mainline_branch_id)
-            except:
-                print("E: Unhandled kernel type installed")
-                return
-            is_eol = False
-            is_rc = False
-            try:
-                # regular versioned builds:
-                if mainline_branch_id == 0:
-                    ver = ".".join(active_kernel.version.split(".")[:2])
-                    mainline_support_status = mainline.get_support_status()
-                    if not ver in mainline_support_status or mainline_support_status[ver] == "eol":
-                        is_eol = True
-                    # if the active kernel is not eol, check if it is a release candidate
-                    is_rc = not is_eol and "rc" in active_kernel.version_id[3]
-                    mainline.include_rc = is_rc
-                    mainline_kernels = mainline.get_available_versions(
-                        filter_eol=not (is_eol or self.mainline_upgrade_series),
-                        filter_rc=not is_rc,
-                        filter_longterm=False)
-                # dated (daily) builds:
-                else:
-                    mainline_kernels = [mainline.get_daily_build()]
-                if not mainline_kernels:
-                    print("E: Could not retrieve available mainline kernel versions")
-                    return
-            except:
-                print("E: Exception trying to retrieve available mainline kernel versions")
+        if mainline_lookup:
+            with profiler.phase("mainline wait"):
+                mainline_lookup.join(max(mainline_lookup.deadline - time.monotonic(), 0))
+            if mainline_lookup.is_alive():
+                print("E: Timed out retrieving mainline kernel data")
                 return
             if DEBUG:
-                print(mainline_kernels)
+                print(mainline_lookup.mainline_kernels)
                 print("active_kernel.version:", active_kernel.version)
-                print("mainline_branch_id:", mainline_branch_id)
-                print("is_eol:", is_eol, ", filter_eol:", not (is_eol or self.mainline_upgrade_series))
-                print("is_rc:", is_rc, ", filter_rc:", not is_rc)
+                print("mainline_branch_id:", mainline_lookup.branch_id)
+                print("is_eol:", mainline_lookup.is_eol, ", filter_eol:",
+                      not (mainline_lookup.is_eol or self.mainline_upgrade_series))
+                print("is_rc:", mainline_lookup.is_rc, ", filter_rc:", not mainline_lookup.is_rc)
                 print("self.mainline_upgrade_series:", self.mainline_upgrade_series)
+            if mainline_lookup.error:
+                print(mainline_lookup.error)
+                return
+            if not mainline_lookup.files:
+                # Already up to date
+                return
+            mainline = mainline_lookup.mainline
+            mainline_branch_id = mainline_lookup.branch_id
+            mainline_kernel_files = mainline_lookup.files
+            target_kernel_version = mainline_lookup.target_kernel_version
+            package_version = mainline_kernel_files[0]["filename"].split("_")[0].split("-", 2)[-1]
             # Versioned builds:
             if mainline_branch_id == 0:
-                # get the highest available mainline kernel version matching the
-                # current shortseries, or, if the current series is end of life
-                # and series upgrades are enabled, the highest available mainline
-                # kernel from the highest released series:
-                target_kernel_version = ""
-                for mainline_kernel in mainline_kernels:
-                    kernel = KernelVersion(mainline_kernel)
-                    if ((is_eol and self.mainline_upgrade_series) or
-                        kernel.shortseries == max_kernel.shortseries) and \
-                       kernel.version_id > max_kernel.version_id:
-                        max_kernel = kernel
-                        target_kernel_version = mainline_kernel
-                if max_kernel.version_id != active_kernel.version_id:
-                    try:
-                        mainline_kernel_files = mainline.get_filelist(target_kernel_version)
-                    except mainline.MainlineKernelsException as e:
-                        print(e)
-                        return
-                    package_version = mainline_kernel_files[0]["filename"].split("_")[0].split("-", 2)[-1]
-                    # Check if blacklisted
-                    if self.is_blacklisted("linux", package_version):
-                        return
-                    # Check if already installed but not active (yet):
-                    pkg = self.cache.get(f"linux-image-unsigned-{package_version}")
-                    if pkg and pkg.is_installed:
-                        return
-                    base_url = f"{mainline.base_data.base_url}v{target_kernel_version}/"
-                else:
+                # Check if blacklisted
+                if self.is_blacklisted("linux", package_version):
                     return
+                # Check if already installed but not active (yet):
+                pkg = self.cache.get(f"linux-image-unsigned-{package_version}")
+                if pkg and pkg.is_installed:
+                    return
+                base_url = f"{mainline.base_data.base_url}v{target_kernel_version}/"
             # Dated (daily) builds:
             else:
-                target_kernel_version = mainline_kernels[0]
-                active_build_date = os.uname().version[1:9]
-                # The source version is one day older than the actual build date, so we
-                # substract a day to be able to compare with the installed build
-                latest_build_date = KernelVersion(target_kernel_version).version_id[3]
-                latest_build_date = datetime.strptime(latest_build_date, "%Y%m%dz")
-                latest_build_date = latest_build_date - timedelta(days=1)
-                latest_build_date = latest_build_date.strftime("%Y%m%d")
-                # Check if we're already on the latest build:
-                if latest_build_date == active_build_date:
-                    return
-                try:
-                    mainline_kernel_files = mainline.get_filelist(target_kernel_version)
-                except mainline.MainlineKernelsException as e:
-                    print(e)
-                    return
-                package_version = mainline_kernel_files[0]["filename"].split("_")[0].split("-", 2)[-1]
                 if not DEBUG:
                     pkg = self.cache.get(f"linux-image-unsigned-{package_version}")
                     # Double check that a daily build is really already installed,
@@ -306,36 +541,73 @@ class APTCheck:
                         return
                     # Check whether we already installed the latest version and it's just not active (yet):
                     installed_build_date = pkg.installed.version.split(f".0-{mainline_branch_id}.", 1)[1][:8]
-                    if installed_build_date == latest_build_date:
+                    if installed_build_date == mainline_lookup.latest_build_date:
                         return
                 base_url = mainline.base_data.versioned_url(target_kernel_version)
             download_size = sum([x["size"] for x in mainline_kernel_files])
             # we cannot know installed size before downloading, at best we could offer an guess here
             installed_size = 0
             installed_size_change = 0
-            mainline_update = \
-                "###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s" %\
-                (f"Linux kernel {package_version}", "linux", "linux",
-                f"linux={package_version}", mainline_kernel_files[2]["filename"],
-                ", ".join([x["filename"] for x in mainline_kernel_files]),
-                target_kernel_version, active_kernel.version,
-                download_size, installed_size, installed_size_change,
-                "kernel", "ubuntu", mainline.base_data.title,
-                _("Warning: This is an unsupported kernel meant for testing purposes. "
-                "Consider switching to a supported kernel instead."),
-                base_url, f"mainline-{mainline.base_data.name}-{mainline_branch_id}")
-            self.updates["linux"] = Update(package=None, input_string=mainline_update, source_name=None)
+            mainline_update = {
+                "display_name": f"Linux kernel {package_version}",
+                "source_name": "linux",
+                "real_source_name": "linux",
+                "source_packages": [f"linux={package_version}"],
+                "main_package_name": mainline_kernel_files[2]["filename"],
+                "package_names": [x["filename"] for x in mainline_kernel_files],
+                "new_version": target_kernel_version,
+                "old_version": active_kernel.version,
+                "size": download_size,
+                "installed_size": installed_size,
+                "installed_size_change": installed_size_change,
+                "type": "kernel",
+                "origin": "ubuntu",
+                "short_description": mainline.base_data.title,
+                "description": _("Warning: This is an unsupported kernel meant for testing purposes. "
+                                 "Consider switching to a supported kernel instead."),
+                "site": base_url,
+                "archive": f"mainline-{mainline.base_data.name}-{mainline_branch_id}"
+                }
+            self.updates["linux"] = Update(package=None, record=mainline_update, source_name=None)
+
+    def start_mainline_lookup(self, active_kernel):
+        """
+        Starts and returns a `MainlineLookup` for `active_kernel` if mainline
+        kernels are enabled and it is a mainline build, else returns `None`
+        """
+        if not self.use_mainline:
+            return None
+        if active_kernel.version_id[3].isnumeric():
+            # Daily builds like "5.2.0-999-generic"
+            mainline_branch_id = int(active_kernel.version_id[3])
+        else:
+            # Regular versioned builds
+            mainline_branch_id = 0
+        # since all we got is the active kernel version, try to make sure there's no
+        # signed, i.e. non-mainline package of the same version installed:
+        pkg = self.cache.get(f"linux-image-{active_kernel.version}")
+        if not DEBUG and pkg and pkg.is_installed:
+            return None
+        # and that an unsigned, local version is installed instead:
+        pkg = self.cache.get(f"linux-image-unsigned-{active_kernel.version}")
+        if not DEBUG and (not pkg or not pkg.is_installed or pkg.candidate.downloadable):
+            return None
+        try:
+            mainline = MainlineKernels(cached=True, branch_id=mainline_branch_id)
+        except:
+            print("E: Unhandled kernel type installed")
+            return None
+        lookup = MainlineLookup(mainline, active_kernel, mainline_branch_id, self.mainline_upgrade_series)
+        lookup.start()
+        return lookup
 
     def is_blacklisted(self, source_name, version):
-        for blacklist in settings.get_strv("blacklisted-packages"):
-            if "=" in blacklist:
-                bl_pkg, bl_ver = blacklist.split("=", 1)
-            else:
-                bl_pkg = blacklist
-                bl_ver = None
-            if fnmatch.fnmatch(source_name, bl_pkg) and (not bl_ver or bl_ver == version):
-                return True
-        return False
+        self.checked_sources.add((source_name, version))
+        return not self.ignore_blacklist and self.blacklist.matches(source_name, version)
+
+    def is_any_blacklisted(self, sources):
+        """ Returns True if the blacklist matches any of the (source name, version) pairs `sources` """
+        return any(self.blacklist.matches(source_name, version) for source_name, version in sources)
 
     def get_kernel_version_from_meta_package(self, pkg):
         for dependency in pkg.dependencies:
@@ -395,10 +667,10 @@ class APTCheck:
                 update.type = "kernel"
             update.new_version = source_version
 
-    def serialize_updates(self):
-        # Print updates
+    def serialize_updates(self, output=sys.stdout.buffer):
+        # Write update records
         for _source_name, update in self.updates.items():
-            update.serialize()
+            write_record(output, "update", **update.to_record())
 
     def merge_kernel_updates(self):
         for source_name, update in self.updates.items():
@@ -430,17 +702,162 @@ class APTCheck:
             if update.short_description.endswith("."):
                 update.short_description = update.short_description[:-1]
 
+def write_error(error, output):
+    write_record(output, "error", exception=str(sys.exc_info()[0]), message=str(error))
+
+def run_check(check, output=sys.stdout.buffer):
+    """ Runs a complete update check and writes the resulting records to `output` """
+    try:
+        records = check.check_updates()
+        with profiler.phase("serialization"):
+            for record in records:
+                write_record(output, record["type"], **record)
+        profiler.count("updates", len(records))
+    except Exception as error:
+        write_error(error, output)
+        return False
+    finally:
+        if profiler.enabled:
+            profiler.dump("checkAPT")
+            write_record(output, "profile", **profiler.results("checkAPT"))
+    return True
+
+class CheckRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a single request to the check service. Requests are one line,
+    `check` optionally followed by `mainline` or `nomainline`, overriding the
+    mainline kernel setting, and/or `profile`. The response is the same
+    record stream `checkAPT.py` prints when run directly
+    """
+
+    def handle(self):
+        command = self.rfile.readline().decode("utf-8", "replace").split()
+        if not command or command[0] != "check":
+            return
+        if self.server.is_outdated():
+            # We got updated, let the client start a new instance
+            self.server.timed_out = True
+            return
+        output = self.wfile
+        write_header(output)
+        profile = "profile" in command[1:] and not profiler.enabled
+        if profile:
+            profiler.enable()
+        profiler.reset()
+        try:
+            if not self.server.check:
+                self.server.check = APTCheck()
+            else:
+                self.server.check.reset()
+            if "mainline" in command[1:]:
+                self.server.check.use_mainline_override = True
+            elif "nomainline" in command[1:]:
+                self.server.check.use_mainline_override = False
+            else:
+                self.server.check.use_mainline_override = None
+            self.server.check.load_settings()
+        except Exception as error:
+            self.server.check = None
+            write_error(error, output)
+        else:
+            run_check(self.server.check, output)
+        finally:
+            if profile:
+                profiler.disable()
+
+class ServiceRunningError(Exception):
+    """ Another instance of the checkAPT service is running """
+
+class APTCheckService(socketserver.UnixStreamServer):
+    """
+    Keeps the APT cache open between update checks and answers check requests
+    on `CHECK_APT_SOCKET`. Exits after `idle_timeout` seconds without a request.
+
+    The running service holds a lock on `CHECK_APT_LOCK`. Instances started
+    while it runs wait up to `lock_timeout` seconds for it to exit, e.g. when
+    it is outdated, then raise `ServiceRunningError`.
+    """
+
+    def __init__(self, idle_timeout=SERVICE_IDLE_TIMEOUT, lock_timeout=10):
+        self.check = None
+        self.timed_out = False
+        self.mtime = os.path.getmtime(__file__)
+        self.lock_file = open(CHECK_APT_LOCK, "a")
+        os.chmod(CHECK_APT_LOCK, 0o600)
+        deadline = time.monotonic() + lock_timeout
+        while True:
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    self.lock_file.close()
+                    raise ServiceRunningError()
+                time.sleep(0.05)
+        # Holding the lock, a socket left here is one of an instance that did not shut down cleanly
+        try:
+            os.unlink(CHECK_APT_SOCKET)
+        except FileNotFoundError:
+            pass
+        socketserver.UnixStreamServer.__init__(self, CHECK_APT_SOCKET, CheckRequestHandler)
+        os.chmod(CHECK_APT_SOCKET, 0o600)
+        self.socket_inode = os.stat(CHECK_APT_SOCKET).st_ino
+        self.timeout = idle_timeout
+
+    def is_outdated(self):
+        try:
+            return os.path.getmtime(__file__) != self.mtime
+        except OSError:
+            return True
+
+    def handle_timeout(self):
+        self.timed_out = True
+
+    def handle_error(self, request, client_address):
+        # stderr is closed, errors are reported to the client by run_check()
+        pass
+
+    def serve(self):
+        try:
+            while not self.timed_out:
+                self.handle_request()
+        finally:
+            self.server_close()
+            try:
+                # Leave the socket of a newer instance alone
+                if os.stat(CHECK_APT_SOCKET).st_ino == self.socket_inode:
+                    os.unlink(CHECK_APT_SOCKET)
+            except OSError:
+                pass
+            self.lock_file.close()
+
 if __name__ == "__main__":
     DEBUG = len(sys.argv) > 1 and sys.argv[1] == "--debug"
+    if "--profile" in sys.argv[1:]:
+        profiler.enable()
+    profiler.reset()
+    sys.stderr.close()
+    if "--service" in sys.argv[1:]:
+        try:
+            service = APTCheckService()
+        except ServiceRunningError:
+            sys.exit()
+        service.serve()
+        sys.exit()
+    if "--snapshot" in sys.argv[1:]:
+        # Refresh the shared snapshot, run by the APT update hook. Without
+        # mainline kernels, so apt update does not wait for the network
+        if os.getuid() == 0:
+            try:
+                APTCheck(use_mainline=False).check_updates()
+            except Exception:
+                sys.exit(1)
+        sys.exit()
+    write_header(sys.stdout.buffer)
     try:
-        sys.stderr.close()
         check = APTCheck()
-        check.find_changes()
-        check.merge_kernel_updates()
-        check.clean_descriptions()
-        check.serialize_updates()
     except Exception as error:
-        print("CHECK_APT_ERROR---EOL---")
-        print(sys.exc_info()[0])
-        print(f"Error: {error}")
+        write_error(error, sys.stdout.buffer)
+        sys.exit(1)
+    if not run_check(check):
         sys.exit(1)
@@ -1,17 +1,24 @@
 #!/usr/bin/python3
 
 import os
-import re
 import sys
+import time
 
 import apt
 
 from common.constants import (SUPPORTED_KERNEL_TYPES, USE_MAINLINE_KERNELS,
                               Origin)
 from common.functions import configured_kernel_type, get_release_dates
+from common.KernelIndex import KernelIndex
 from common.KernelVersion import KernelVersion
 from common.MainlineKernels import MainlineKernels
+from common.Profiler import profiler
+from common.records import write_header, write_record
 
+if "--profile" in sys.argv[1:]:
+    sys.argv.remove("--profile")
+    profiler.enable()
+profiler.reset()
 if len(sys.argv) > 1 and sys.argv[1] in SUPPORTED_KERNEL_TYPES:
     default_kernel_type = sys.argv[1]
 else:
@@ -19,17 +26,22 @@ else:
 release_dates = get_release_dates()
 
 sys.stderr.close()
+output = sys.stdout.buffer
+write_header(output)
 try:
     current_version = os.uname().release
-    cache = apt.Cache()
+    with profiler.phase("cache open"):
+        cache = apt.Cache()
     signed_kernels = ['']
     local_kernels = {}
-    r = re.compile(r'^(?:linux-image-)(?:unsigned-)?(\d.+?)(%s)(|-amd64)$' % "|".join(SUPPORTED_KERNEL_TYPES))
-    for pkg_name in cache.keys():
-        pkg_match = r.match(pkg_name)
-        if not pkg_match:
-            continue
-        pkg = cache[pkg_name]
+    with profiler.phase("kernel index"):
+        kernel_index = KernelIndex(cache.keys())
+    kernel_packages = []
+    for kernel_type in SUPPORTED_KERNEL_TYPES:
+        kernel_packages.extend(kernel_index.get_packages("image", kernel_type))
+    start = time.perf_counter()
+    for kernel_package in kernel_packages:
+        pkg = cache[kernel_package.name]
         pkg_data = None
         if pkg.candidate:
             pkg_data = pkg.candidate
@@ -37,9 +49,9 @@ try:
             pkg_data = pkg.installed
         else:
             continue
-        version = pkg_match.group(1)
-        kernel_type = pkg_match.group(2)
-        full_version = f"{version}{kernel_type}{pkg_match.group(3)}"
+        version = kernel_package.version
+        kernel_type = kernel_package.flavor
+        full_version = kernel_package.release
         used = 0
         if pkg.is_installed:
             pkg_version = pkg.installed.version
@@ -109,14 +121,17 @@ try:
             # unsupported
             support_duration = 0
 
-        resultString = f"KERNEL###{'.'.join(version_id)}###{version}###{pkg_version}###{installed}###{used}" \
-                        f"###{origin}###{archive}###{support_duration}###{kernel_type}"
-        print(resultString.encode("utf-8").decode("ascii", "xmlcharrefreplace"))
+        write_record(output, "kernel", version_id=version_id, version=version, pkg_version=pkg_version,
+                     installed=installed, used=used, origin=origin, archive=archive,
+                     support_duration=support_duration, kernel_type=kernel_type)
+        profiler.count("kernels")
+    profiler.add("kernel enumeration", time.perf_counter() - start)
 
 except:
     import traceback
-    print("ERROR###ERROR###ERROR###ERROR")
-    traceback.print_exc()
+    write_record(output, "error", message=traceback.format_exc())
+    if profiler.enabled:
+        write_record(output, "profile", **profiler.results("checkKernels"))
     sys.exit(1)
 
 if USE_MAINLINE_KERNELS:
@@ -132,8 +147,12 @@ if USE_MAINLINE_KERNELS:
             if default_kernel_type in local_kernels.keys() and \
             version_id in local_kernels[default_kernel_type]:
                 continue
-            resultString = f"KERNEL###{'.'.join(version_id)}###{display_version}###{mainline_version}" \
-                        f"###0###0###3######0###{default_kernel_type}"
-            print(resultString.encode("utf-8").decode('ascii', 'xmlcharrefreplace'))
+            write_record(output, "kernel", version_id=version_id, version=display_version,
+                         pkg_version=mainline_version, installed=0, used=0, origin=Origin.MAINLINE_PPA,
+                         archive="", support_duration=0, kernel_type=default_kernel_type)
     except:
-        print("ERROR: List of available mainline kernels could not be retrieved")
+        write_record(output, "error", message="List of available mainline kernels could not be retrieved")
+
+if profiler.enabled:
+    profiler.dump("checkKernels")
+    write_record(output, "profile", **profiler.results("checkKernels"))
@@ -0,0 +1,101 @@
+import fnmatch
+import os
+import re
+
+from common import settings
+from common.functions import read_file
+
+BLACKLIST_FILE = "/etc/mintupdate.blacklist"
+
+class Blacklist:
+    """
+    Compiled matcher for update ignore rules. Rules are source package names,
+    optionally containing wildcards, each optionally limited to one version in
+    the form name=version.
+
+    The rules come from the blacklisted-packages setting if `use_settings` is
+    set, from the files in `paths` and from `extra_rules`. They are compiled
+    once and only recompiled by `reload()` if the setting or a file changed.
+    """
+
+    def __init__(self, use_settings=True, paths=(), extra_rules=()):
+        self.use_settings = use_settings
+        self.paths = paths
+        self.extra_rules = list(extra_rules)
+        self._sources = None
+        self.rules = []
+        # name: None for all versions, else a set of versions
+        self._names = {}
+        # merged regex of the version-less patterns
+        self._pattern = None
+        # version: merged regex of the patterns limited to that version
+        self._versioned_patterns = {}
+        self.reload()
+
+    def _get_sources(self):
+        sources = []
+        if self.use_settings:
+            sources.append(tuple(settings.get_strv("blacklisted-packages")))
+        for path in self.paths:
+            try:
+                sources.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                sources.append(None)
+        return sources
+
+    def reload(self):
+        """ Recompiles the rules if any of their sources changed, returns True if it did """
+        sources = self._get_sources()
+        if sources == self._sources:
+            return False
+        self._sources = sources
+        rules = []
+        if self.use_settings:
+            rules.extend(sources[0])
+        for path in self.paths:
+            for line in read_file(path):
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    rules.append(line)
+        rules.extend(self.extra_rules)
+        self.compile(rules)
+        return True
+
+    def compile(self, rules):
+        self.rules = rules
+        self._names = {}
+        patterns = []
+        versioned_patterns = {}
+        for rule in rules:
+            if "=" in rule:
+                name, version = rule.split("=", 1)
+            else:
+                name = rule
+                version = None
+            if not name:
+                continue
+            if any(char in name for char in "*?["):
+                if version:
+                    versioned_patterns.setdefault(version, []).append(fnmatch.translate(name))
+                else:
+                    patterns.append(fnmatch.translate(name))
+            elif version:
+                versions = self._names.setdefault(name, set())
+                if versions is not None:
+                    versions.add(version)
+            else:
+                self._names[name] = None
+        self._pattern = re.compile("|".join(patterns)) if patterns else None
+        self._versioned_patterns = {version: re.compile("|".join(patterns))
+                                    for version, patterns in versioned_patterns.items()}
+
+    def matches(self, source_name, version):
+        """ Returns True if the update of `source_name` to `version` is to be ignored """
+        if source_name in self._names:
+            versions = self._names[source_name]
+            if versions is None or version in versions:
+                return True
+        if self._pattern and self._pattern.match(source_name):
+            return True
+        pattern = self._versioned_patterns.get(version)
+        return bool(pattern and pattern.match(source_name))
@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+
+from common.constants import CACHE_DIR, USER_CACHE_DIR
+
+# Folder of the cache in CACHE_DIR and USER_CACHE_DIR
+CACHE_FOLDER = "changelogs"
+# Bytes of compressed changelogs kept, the least recently used ones beyond that are removed
+CACHE_SIZE = 32 * 1024 ** 2
+
+class ChangelogCache:
+    """
+    Persistent cache of changelogs, shared by the main window, the Kernel
+    Manager and the History window.
+
+    Entries are keyed by a "source=version" string as found in
+    `Update.source_packages`, or by the URL of a mainline kernel's CHANGES
+    file. Neither changes once published, so entries do not expire. They
+    are stored gzip-compressed under the SHA-1 of their key, the least
+    recently used ones are removed when they exceed `size_limit` bytes.
+
+    Root reads and writes the entries in `CACHE_DIR`. Everybody else reads
+    those too, but keeps their own in `USER_CACHE_DIR`.
+    """
+
+    def __init__(self, system_dir=os.path.join(CACHE_DIR, CACHE_FOLDER),
+                 user_dir=os.path.join(USER_CACHE_DIR, CACHE_FOLDER), size_limit=CACHE_SIZE):
+        self.dirs = [system_dir]
+        if os.getuid() != 0:
+            self.dirs.append(user_dir)
+        self.write_dir = self.dirs[-1]
+        self.size_limit = size_limit
+        self._lock = threading.Lock()
+        # Events set when the changelogs being retrieved are done, by key
+        self._retrieving = {}
+
+    @staticmethod
+    def filename(key):
+        return f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.gz"
+
+    def get(self, key):
+        """ Returns the changelog for `key` or `None` """
+        filename = self.filename(key)
+        for directory in reversed(self.dirs):
+            path = os.path.join(directory, filename)
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    changelog = f.read()
+            except (OSError, EOFError, UnicodeDecodeError, zlib.error):
+                continue
+            if directory == self.write_dir:
+                # The modification time orders entries for prune()
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+            return changelog
+        return None
+
+    def store(self, key, changelog):
+        """ Atomically writes `changelog` for `key`, failure is not an error """
+        filename = self.filename(key)
+        path = os.path.join(self.write_dir, filename)
+        tmpfile = os.path.join(self.write_dir, f".{filename}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            os.makedirs(self.write_dir, exist_ok=True)
+            with gzip.open(tmpfile, "wt", encoding="utf-8") as f:
+                f.write(changelog)
+            os.chmod(tmpfile, 0o644)
+            os.replace(tmpfile, path)
+        except OSError:
+            try:
+                os.unlink(tmpfile)
+            except OSError:
+                pass
+            return
+        self.prune(filename)
+
+    def prune(self, keep=None):
+        """ Removes the least recently used entries beyond `size_limit` bytes, except `keep` """
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.write_dir) as it:
+                for entry in it:
+                    # Files being written start with a dot
+                    if not entry.is_file(follow_symlinks=False) or entry.name.startswith("."):
+                        continue
+                    stat = entry.stat()
+                    total += stat.st_size
+                    if entry.name != keep:
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        for _mtime, size, path in sorted(entries):
+            if total <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def retrieve(self, key, get):
+        """
+        Returns the changelog for `key`, from the cache if it has it, from
+        `get()` otherwise, which is stored unless it is empty. Without a
+        `key` the changelog is not cached.
+
+        Concurrent retrievals of the same `key` wait for the first one
+        instead of calling `get()` again.
+        """
+        if not key:
+            return get()
+        while True:
+            changelog = self.get(key)
+            if changelog is not None:
+                return changelog
+            with self._lock:
+                retrieving = self._retrieving.get(key)
+                if not retrieving:
+                    retrieving = self._retrieving[key] = threading.Event()
+                    break
+            # Retried if the other retrieval fails
+            retrieving.wait()
+        try:
+            changelog = get()
+            if changelog:
+                self.store(key, changelog)
+        finally:
+            with self._lock:
+                del self._retrieving[key]
+            retrieving.set()
+        return changelog
+
+changelog_cache = ChangelogCache()
@@ -0,0 +1,192 @@
+import codecs
+import re
+import threading
+import time
+
+# Imported for initializing apt_pkg
+import apt
+import apt_pkg
+import requests
+
+import gi
+gi.require_version('Gdk', '3.0')
+from gi.repository import Gdk, GLib
+
+from mintcommon import apt_changelog
+
+from common.ChangelogCache import changelog_cache
+
+# Seconds a changelog may take to load
+CHANGELOG_TIMEOUT = 30
+# Bytes read from the network at a time, small enough to notice cancellation soon
+READ_SIZE = 8192
+# Seconds between checks for cancellation while APT retrieves a changelog
+CANCEL_INTERVAL = 0.1
+
+# Versions of kernel meta packages: the kernel version, its ABI and upload number
+KERNEL_META_VERSION = re.compile(r"^(\d+\.\d+\.\d+)\.(\d+)\.(.+)$")
+
+def get_source_versions(package_name, versions):
+    """
+    Returns the names and versions of the source packages of binary package
+    `package_name` in `versions`, empty or `None` versions as they are. If
+    APT does not know a version any more, they are guessed from those it
+    knows, assuming the source package stays the same and a binNMU suffix
+    and the epoch are all that sets the versions apart.
+    """
+    sources = [None] * len(versions)
+    try:
+        cache = apt_pkg.Cache(None)
+        if package_name in cache:
+            records = apt_pkg.PackageRecords(cache)
+            for package_version in cache[package_name].version_list:
+                if package_version.ver_str in versions and package_version.file_list and \
+                   records.lookup(package_version.file_list[0]):
+                    source = (records.source_pkg or package_name.split(":")[0],
+                              records.source_ver or package_version.ver_str)
+                    for i, version in enumerate(versions):
+                        if version == package_version.ver_str:
+                            sources[i] = source
+    except SystemError:
+        pass
+    known = [(version, source) for version, source in zip(versions, sources) if source]
+    source_name = known[0][1][0] if known else package_name.split(":")[0]
+    drop_epoch = any(":" in version and ":" not in source[1] for version, source in known)
+    for i, version in enumerate(versions):
+        if not sources[i]:
+            if version:
+                version = re.sub(r"\+b\d+$", "", version)
+                if drop_epoch:
+                    version = version.split(":", 1)[-1]
+            sources[i] = (source_name, version)
+    return sources
+
+def changelog_version(source_name, source_version):
+    """
+    Returns `source_version` as found in the changelog of `source_name`.
+    The updates of kernel meta packages are listed with the version of their
+    kernel, see checkAPT.py, and so are their changes. Kernel versions have
+    a dash, so any kernel package with a version like that of a meta
+    package is taken for one, also when APT no longer knows its source.
+    """
+    match = KERNEL_META_VERSION.match(source_version or "")
+    if match and source_name.startswith("linux"):
+        return f"{match.group(1)}-{match.group(2)}.{match.group(3)}"
+    return source_version
+
+class ChangelogLoader(threading.Thread):
+    """
+    Loads a changelog in the background and hands it to the main loop, so
+    no window waits for the network.
+
+    `source` is a package name or the URL of a changelog, `key` what it is
+    kept under in the ChangelogCache, see `ChangelogCache.retrieve()`. For a
+    package with a `version` and no `key`, the key is the "source=version"
+    string of its source package, the one `Update.changelog_key()` returns.
+    Once loaded, `version` and `old_version`, the version updated from, are
+    those of the source package as its changelog lists them, for use with
+    `ChangelogView.finish()`.
+
+    `append(text)` is called in the main loop with the parts of a changelog
+    loaded from a URL as they are received, `finish(changelog)` with the
+    whole of it once loaded, or with an empty string if it could not be
+    loaded within `timeout` seconds. Neither is called after `cancel()`,
+    e.g. when the window showing the changelog is closed.
+    """
+
+    def __init__(self, source, key=None, append=None, finish=None, timeout=CHANGELOG_TIMEOUT, version=None,
+                 old_version=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.source = source
+        self.key = key
+        self.append = append
+        self.finish = finish
+        self.timeout = timeout
+        self.version = version
+        self.old_version = old_version
+        self.canceled = False
+
+    def cancel(self):
+        self.canceled = True
+
+    def run(self):
+        if "://" in self.source:
+            changelog = changelog_cache.get(self.key) if self.key else None
+            if changelog is None:
+                changelog = self._load_url()
+        else:
+            changelog = self._wait(self._load_package)
+        self._idle(self.finish, changelog)
+
+    def _load_package(self):
+        """ Returns the changelog of package `self.source`, retrieved by APT unless it is cached """
+        if self.version:
+            (source_name, source_version), (_name, old_version) = \
+                get_source_versions(self.source, [self.version, self.old_version])
+            if not self.key:
+                self.key = f"{source_name}={source_version}"
+            self.version = changelog_version(source_name, source_version)
+            self.old_version = changelog_version(source_name, old_version)
+        return changelog_cache.retrieve(
+            self.key, lambda: apt_changelog.AptChangelog().get_changelog(self.source)) or ""
+
+    def _wait(self, load):
+        """
+        Returns what `load()` returns, an empty string if canceled, timed
+        out or failed. A timed out `load()` goes on in the background, so
+        it still caches what it retrieves.
+        """
+        result = []
+
+        def work():
+            try:
+                result.append(load())
+            except Exception:
+                pass
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        deadline = time.monotonic() + self.timeout
+        while worker.is_alive():
+            if self.canceled or time.monotonic() > deadline:
+                return ""
+            worker.join(CANCEL_INTERVAL)
+        return result[0] if result else ""
+
+    def _load_url(self):
+        """
+        Returns the changelog at `self.source`, an empty string if canceled or
+        timed out. Passes its parts to `append` as they are received.
+        """
+        deadline = time.monotonic() + self.timeout
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        parts = []
+        try:
+            with requests.get(self.source, stream=True, timeout=self.timeout) as r:
+                if not r.ok:
+                    return ""
+                for data in r.iter_content(READ_SIZE):
+                    if self.canceled or time.monotonic() > deadline:
+                        return ""
+                    self._received(parts, decoder.decode(data))
+                self._received(parts, decoder.decode(b"", final=True))
+        except requests.RequestException:
+            return ""
+        changelog = "".join(parts)
+        if changelog and self.key:
+            changelog_cache.store(self.key, changelog)
+        return changelog
+
+    def _received(self, parts, text):
+        if text:
+            parts.append(text)
+            self._idle(self.append, text)
+
+    def _idle(self, callback, text):
+        if callback and not self.canceled:
+            Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self._call, callback, text)
+
+    def _call(self, callback, text):
+        # Canceled while waiting for the main loop
+        if not self.canceled:
+            callback(text)
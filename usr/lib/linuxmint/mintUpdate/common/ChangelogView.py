@@ -0,0 +1,152 @@
+import re
+
+# Imported for initializing apt_pkg
+import apt
+import apt_pkg
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import GLib, Gtk
+
+# Characters inserted into the buffer at a time
+CHUNK_SIZE = 32768
+# The first line of a Debian changelog entry: "package (version) distributions; urgency=..."
+ENTRY_HEADER = re.compile(r"^\S+ \(([^()\s]+)\) [^\n;]+;", re.M)
+
+def version_range(changelog, old_version, new_version=None):
+    """
+    Returns the start and end offsets of the entries of Debian changelog
+    `changelog` which are newer than `old_version` and not newer than
+    `new_version`, or only the latest entry when `old_version` is empty or
+    `None`.
+
+    Returns the whole changelog if it has no such entries, e.g. if it is
+    not in the Debian format.
+    """
+    # Debian changelogs start with an entry, there is no need to search the others
+    if not ENTRY_HEADER.match(changelog):
+        return 0, len(changelog)
+    start = None
+    for match in ENTRY_HEADER.finditer(changelog):
+        version = match.group(1)
+        if start is None:
+            if not new_version or apt_pkg.version_compare(version, new_version) <= 0:
+                if old_version and apt_pkg.version_compare(version, old_version) <= 0:
+                    break
+                start = match.start()
+        elif not old_version or apt_pkg.version_compare(version, old_version) <= 0:
+            return start, match.start()
+    if start is None:
+        return 0, len(changelog)
+    return start, len(changelog)
+
+class ChangelogView:
+    """
+    Shows changelogs in Gtk.TextView `textview`.
+
+    Large changelogs are inserted a chunk at a time while the main loop is
+    idle, so the window stays responsive. With the versions of an update,
+    only its entries are shown, followed by a button to show the full
+    history.
+
+    A changelog being received can be shown part by part with `append()`,
+    followed by `finish()` once all of it was received.
+    """
+
+    def __init__(self, textview):
+        self.textview = textview
+        self.buffer = textview.get_buffer()
+        self.changelog = ""
+        self.end = 0
+        self.position = 0
+        self.truncated = False
+        self.source_id = None
+        self.receiving = False
+
+    def show(self, changelog, old_version=None, new_version=None):
+        """
+        Shows `changelog`, only the entries between `old_version` and
+        `new_version` if `old_version` is not `None`
+        """
+        self.receiving = False
+        self.changelog = changelog
+        self.insert(*self._range(old_version, new_version))
+
+    def append(self, text):
+        """ Appends `text`, the next part of a changelog being received """
+        if not self.receiving:
+            self.cancel()
+            self.buffer.set_text("")
+            self.receiving = True
+        self.buffer.insert(self.buffer.get_end_iter(), text)
+
+    def finish(self, changelog, old_version=None, new_version=None):
+        """
+        Shows `changelog` as `show()` does, keeping the text inserted by
+        `append()` if all of it is to be shown
+        """
+        if not self.receiving:
+            self.show(changelog, old_version, new_version)
+            return
+        self.receiving = False
+        self.changelog = changelog
+        start, end = self._range(old_version, new_version)
+        if end - start < len(changelog):
+            self.insert(start, end)
+
+    def _range(self, old_version, new_version):
+        if old_version is None:
+            return 0, len(self.changelog)
+        return version_range(self.changelog, old_version, new_version)
+
+    def insert(self, start, end):
+        """ Replaces the text of the buffer with the changelog from offset `start` to `end` """
+        self.cancel()
+        self.buffer.set_text("")
+        self.position = start
+        self.end = end
+        self.truncated = end - start < len(self.changelog)
+        # The start is shown right away, the rest follows
+        if self._insert_chunk():
+            self.source_id = GLib.idle_add(self._insert_chunk, priority=GLib.PRIORITY_LOW)
+
+    def cancel(self):
+        """ Stops inserting the current changelog """
+        if self.source_id:
+            GLib.source_remove(self.source_id)
+            self.source_id = None
+
+    def _insert_chunk(self):
+        if self.position < self.end:
+            stop = min(self.position + CHUNK_SIZE, self.end)
+            if stop < self.end:
+                # Whole lines, if possible
+                newline = self.changelog.rfind("\n", self.position, stop)
+                if newline > self.position:
+                    stop = newline + 1
+            self.buffer.insert(self.buffer.get_end_iter(), self.changelog[self.position:stop])
+            self.position = stop
+            if self.position < self.end:
+                return True
+        self.source_id = None
+        if self.truncated:
+            self._add_expander()
+        return False
+
+    def _add_expander(self):
+        self.buffer.insert(self.buffer.get_end_iter(), "\n")
+        anchor = self.buffer.create_child_anchor(self.buffer.get_end_iter())
+        button = Gtk.Button(label=_("Show full history"))
+        button.connect("clicked", self.on_expand)
+        self.textview.add_child_at_anchor(button, anchor)
+        button.show()
+
+    def on_expand(self, _button):
+        # Not while the button is handling the click, as replacing the text removes it
+        self.cancel()
+        self.source_id = GLib.idle_add(self._expand)
+
+    def _expand(self):
+        self.source_id = None
+        self.insert(0, len(self.changelog))
+        return False
@@ -1,15 +1,15 @@
-import requests
-
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gdk, Gtk
 
-from mintcommon import apt_changelog
+from common.ChangelogLoader import ChangelogLoader
+from common.ChangelogView import ChangelogView
 
 
 class ChangelogWindow(Gtk.Window):
     """
-    Retrieves the changelog and displays it in a new window.
+    Displays a new window and loads the changelog into it in the background.
+    Loading is canceled when the window is closed.
 
     Parameters:
 
@@ -23,11 +23,18 @@ class ChangelogWindow(Gtk.Window):
 
     `modal` (bool) controls whether the window will be a modal window
 
+    `version` (str) the version of package `source` the changelog is cached for, under that of its source package; if omitted, it is not cached
+
+    `old_version` (str) the version of package `source` updated from; if given, only the changes since are shown
+
     """
 
-    def __init__(self, source, name="", transient_for=None, widget=None, modal=False):
+    def __init__(self, source, name="", transient_for=None, widget=None, modal=False, version="",
+                 old_version=None):
         super().__init__()
         self.source = source
+        self.version = version
+        self.old_version = old_version
         if name:
             self.source_name = name
         else:
@@ -37,30 +44,13 @@ class ChangelogWindow(Gtk.Window):
         if self.source_widget:
             self.source_widget.set_sensitive(False)
         self.modal = modal
+        self.loader = None
         self.show_changelog()
 
     def __del__(self):
         if self.source_widget:
             self.source_widget.set_sensitive(True)
 
-    def get_changelog(self):
-        changelog = ""
-        if "://" in self.source:
-            try:
-                r = requests.get(self.source)
-                if r.ok:
-                    r.encoding = None
-                    changelog = r.text
-                r.close()
-            except:
-                pass
-        else:
-            _apt_changelog = apt_changelog.AptChangelog()
-            changelog = _apt_changelog.get_changelog(self.source)
-        if not changelog:
-            changelog = _("No changelog available")
-        return changelog
-
     def show_changelog(self):
         self.set_transient_for(self.transient_for)
         self.set_modal(self.modal)
@@ -84,21 +74,38 @@ class ChangelogWindow(Gtk.Window):
         scrolled_window.add(output_box)
         box.pack_start(scrolled_window, True, True, 0)
         self.add(box)
-        changelog = self.get_changelog()
         self.show_all()
         changelog_buffer = output_box.get_buffer()
+        self.changelog_view = ChangelogView(output_box)
+        def on_finish(changelog):
+            if changelog:
+                # The versions of the source package, as listed in the changelog
+                self.changelog_view.finish(changelog, self.loader.old_version, self.loader.version)
+            else:
+                self.changelog_view.show(_("No changelog available"))
         def on_allocate(widget, _event):
             " Locks the container size in place after the first automatic resize "
             widget.disconnect(tw_allocate_handle)
             scrolled_window.set_size_request(
                 widget.get_preferred_width().natural_width, 500)
             scrolled_window.set_propagate_natural_width(False)
-            changelog_buffer.set_text(changelog)
+            changelog_buffer.set_text(_("Retrieving changelog…"))
+            # Packages are kept under their source package and its version
+            key = self.source if "://" in self.source else None
+            self.loader = ChangelogLoader(self.source, key, self.changelog_view.append, on_finish,
+                                          version=self.version, old_version=self.old_version)
+            self.loader.start()
         tw_allocate_handle = output_box.connect("size-allocate", on_allocate)
         changelog_buffer.set_text("x" * 80)
+        self.connect("destroy", self.on_destroy)
         self.connect("key-press-event", self.on_key_press_event)
         self.present_with_time(Gtk.get_current_event_time())
 
+    def on_destroy(self, _widget):
+        if self.loader:
+            self.loader.cancel()
+        self.changelog_view.cancel()
+
     @staticmethod
     def on_key_press_event(widget, event):
         if event.keyval in (Gdk.KEY_Escape, Gdk.KEY_Return, Gdk.KEY_KP_Enter):
@@ -0,0 +1,78 @@
+import hashlib
+import os
+
+# Sections of a CHECKSUMS file and their hash algorithms, in order of preference
+SECTIONS = (("Checksums-Sha256:", "sha256"), ("Checksums-Sha1:", "sha1"))
+CHUNK_SIZE = 65536
+
+class ChecksumError(Exception):
+    """ Raised when files do not match their checksums, `filenames` lists them """
+
+    def __init__(self, message, filenames):
+        super().__init__(message)
+        self.filenames = filenames
+
+class ChecksumVerifier:
+    """
+    Verifies files against the digests of a CHECKSUMS file as found in the
+    folders of the mainline kernel PPA.
+
+    The file is parsed once into `self.digests`, a dictionary of file names
+    and their digests by algorithm. Files are checked against the digest of
+    the strongest algorithm listed for them.
+    """
+
+    def __init__(self, checksums):
+        self.digests = {}
+        algorithm = None
+        for line in checksums.splitlines():
+            section = next((x[1] for x in SECTIONS if x[0] in line), None)
+            if section:
+                algorithm = section
+                continue
+            fields = line.split()
+            if algorithm and len(fields) == 2:
+                self.digests.setdefault(fields[1].lstrip("*"), {})[algorithm] = fields[0].lower()
+
+    def expected(self, filename):
+        """ Returns the algorithm and digest `filename` is checked against, or `(None, None)` """
+        digests = self.digests.get(filename, {})
+        for _section, algorithm in SECTIONS:
+            if algorithm in digests:
+                return algorithm, digests[algorithm]
+        return None, None
+
+    @staticmethod
+    def hash_file(path, algorithm):
+        """ Returns the hex digest of `path` computed with `algorithm` """
+        file_hash = hashlib.new(algorithm)
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                file_hash.update(data)
+        return file_hash.hexdigest()
+
+    def mismatches(self, paths):
+        """ Returns the names of the files in `paths` that do not match their checksums or have none """
+        mismatched = []
+        for path in paths:
+            filename = os.path.basename(path)
+            algorithm, expected = self.expected(filename)
+            if not algorithm:
+                mismatched.append(filename)
+                continue
+            try:
+                digest = self.hash_file(path, algorithm)
+            except OSError:
+                digest = None
+            if digest != expected:
+                mismatched.append(filename)
+        return mismatched
+
+    def verify(self, paths):
+        """ Raises ChecksumError naming the files in `paths` that fail verification, see `mismatches()` """
+        mismatched = self.mismatches(paths)
+        if mismatched:
+            raise ChecksumError(_(f"Checksum verification of {', '.join(mismatched)} failed"), mismatched)
@@ -0,0 +1,137 @@
+import email.utils
+import html
+import io
+import os
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Served for folders, written by `write_index()`
+INDEX_FILE = "index.html"
+
+def autoindex(path, descending=False):
+    """
+    Returns an index page of the folder `path` in the markup of Apache's
+    autoindex, so it is read like the pages of the mainline kernel PPA
+    """
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name == INDEX_FILE or entry.name.startswith("."):
+                continue
+            entries.append(f"{entry.name}/" if entry.is_dir() else entry.name)
+    rows = []
+    for name in sorted(entries, reverse=descending):
+        rows.append(f'<tr><td><a href="{quote(name)}">{html.escape(name)}</a></td></tr>\n')
+    title = html.escape(os.path.basename(os.path.normpath(path)))
+    return (f"<!DOCTYPE html>\n<html>\n<head><title>Index of {title}</title></head>\n<body>\n"
+            f"<table>\n{''.join(rows)}</table>\n</body>\n</html>\n")
+
+def write_index(path):
+    """
+    Writes the `autoindex()` of `path` to its index file, sorted by name
+    descending as the daily builds are looked up, for mirrors served by a
+    web server without directory listings
+    """
+    tmpfile = os.path.join(path, f".{INDEX_FILE}")
+    with open(tmpfile, "w") as f:
+        f.write(autoindex(path, descending=True))
+    os.chmod(tmpfile, 0o644)
+    os.replace(tmpfile, os.path.join(path, INDEX_FILE))
+
+class FileAdapter(BaseAdapter):
+    """
+    Transport adapter serving file:// URLs to `requests`, for mainline kernel
+    PPA mirrors on the local file system. Folders are served as their index
+    file, or as an `autoindex()` sorted like the query asks. GET, HEAD and
+    Range requests are supported.
+    """
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        path = unquote(url.path)
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.headers = CaseInsensitiveDict()
+        response.raw = io.BytesIO()
+        if request.method not in ("GET", "HEAD"):
+            response.status_code = 405
+            response.reason = "Method Not Allowed"
+            return response
+        try:
+            if os.path.isdir(path):
+                index = os.path.join(path, INDEX_FILE)
+                if os.path.isfile(index):
+                    path = index
+                else:
+                    query = parse_qs(url.query.replace(";", "&"))
+                    content = autoindex(path, query.get("O") == ["D"]).encode("utf-8")
+                    response.status_code = 200
+                    response.reason = "OK"
+                    response.headers["Content-Type"] = "text/html; charset=utf-8"
+                    response.headers["Content-Length"] = str(len(content))
+                    if request.method == "GET":
+                        response.raw = io.BytesIO(content)
+                    response.encoding = "utf-8"
+                    return response
+            f = open(path, "rb")
+        except OSError:
+            response.status_code = 404
+            response.reason = "Not Found"
+            return response
+        stat = os.fstat(f.fileno())
+        since = request.headers.get("If-Modified-Since")
+        if since:
+            try:
+                if int(stat.st_mtime) <= email.utils.parsedate_to_datetime(since).timestamp():
+                    f.close()
+                    response.status_code = 304
+                    response.reason = "Not Modified"
+                    return response
+            except (TypeError, ValueError):
+                pass
+        offset = 0
+        byte_range = request.headers.get("Range", "")
+        if byte_range.startswith("bytes=") and byte_range.endswith("-"):
+            try:
+                offset = int(byte_range[6:-1])
+            except ValueError:
+                pass
+        if offset >= stat.st_size and offset:
+            f.close()
+            response.status_code = 416
+            response.reason = "Range Not Satisfiable"
+            response.headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+        if offset:
+            f.seek(offset)
+            response.status_code = 206
+            response.reason = "Partial Content"
+            response.headers["Content-Range"] = f"bytes {offset}-{stat.st_size - 1}/{stat.st_size}"
+        else:
+            response.status_code = 200
+            response.reason = "OK"
+        response.headers["Content-Length"] = str(stat.st_size - offset)
+        response.headers["Last-Modified"] = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        if path.endswith(".html"):
+            response.headers["Content-Type"] = "text/html"
+        if request.method == "GET":
+            response.raw = f
+        else:
+            f.close()
+        return response
+
+    def close(self):
+        pass
+
+def new_session(pool_maxsize=10):
+    """ Returns a `requests` session with connection pools of `pool_maxsize` that also serves file:// URLs """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.mount("file://", FileAdapter())
+    return session
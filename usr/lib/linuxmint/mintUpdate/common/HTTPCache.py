@@ -0,0 +1,160 @@
+import json
+import os
+import time
+
+from common.constants import CACHE_DIR, USER_CACHE_DIR
+
+CACHE_FORMAT = 1
+
+class HTTPCacheError(Exception):
+    """ Raised when a resource could neither be retrieved nor taken from the cache """
+
+class HTTPCache:
+    """
+    Cache of parsed web resources with per-entry expiry and revalidation.
+
+    Entries are JSON files holding the parsed data of a URL, when it was
+    retrieved, until when it is fresh and the ETag and Last-Modified headers
+    of the response. Expired entries are revalidated with a conditional
+    request, a 304 response only renews them.
+
+    Root reads and writes the entries in `CACHE_DIR`. Everybody else reads
+    those too, but keeps their own in `USER_CACHE_DIR`, the fresher of both
+    wins.
+
+    With `size_limit` set, the least recently used entries are removed when
+    the entries written exceed that many bytes.
+    """
+
+    def __init__(self, system_dir=CACHE_DIR, user_dir=USER_CACHE_DIR, size_limit=None):
+        self.dirs = [system_dir]
+        if os.getuid() != 0:
+            self.dirs.append(user_dir)
+        self.write_dir = self.dirs[-1]
+        self.size_limit = size_limit
+
+    def load(self, key):
+        """ Returns the most recent entry for `key` or `None` """
+        best = None
+        best_dir = None
+        for directory in self.dirs:
+            try:
+                with open(os.path.join(directory, key)) as f:
+                    entry = json.load(f)
+                if entry.get("format") != CACHE_FORMAT:
+                    continue
+                if not best or entry["time"] > best["time"]:
+                    best = entry
+                    best_dir = directory
+            except (OSError, ValueError, AttributeError, KeyError, TypeError):
+                pass
+        if self.size_limit and best_dir == self.write_dir:
+            # The modification time orders entries for prune()
+            try:
+                os.utime(os.path.join(self.write_dir, key))
+            except OSError:
+                pass
+        return best
+
+    def store(self, key, entry):
+        """ Atomically writes `entry` for `key`, failure is not an error """
+        path = os.path.join(self.write_dir, key)
+        tmpfile = f"{path}.{os.getpid()}"
+        try:
+            os.makedirs(self.write_dir, exist_ok=True)
+            with open(tmpfile, "w") as f:
+                json.dump(entry, f)
+            os.chmod(tmpfile, 0o644)
+            os.replace(tmpfile, path)
+        except OSError:
+            try:
+                os.unlink(tmpfile)
+            except OSError:
+                pass
+            return
+        if self.size_limit:
+            self.prune(key)
+
+    def prune(self, keep=None):
+        """ Removes the least recently used entries beyond `size_limit` bytes, except `keep` """
+        entries = []
+        try:
+            with os.scandir(self.write_dir) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False) and entry.name != keep:
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(x[1] for x in entries)
+            if keep:
+                total += os.stat(os.path.join(self.write_dir, keep)).st_size
+        except OSError:
+            return
+        for _mtime, size, path in sorted(entries):
+            if total <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def update(self, key, url, data):
+        """
+        Replaces the data of the entry for `key` if it is the one of `url`,
+        e.g. with details looked up later, keeping its expiry
+        """
+        entry = self.load(key)
+        if entry and entry["url"] == url:
+            entry["data"] = data
+            self.store(key, entry)
+
+    def fetch(self, key, url, get, parse, ttl, use_cache=True):
+        """
+        Returns the data of `url` parsed by `parse(response)`, from the entry
+        for `key` while it is fresh.
+
+        `get(url, headers)` performs the request and returns a `requests`
+        response. `ttl` is the number of seconds a result is fresh for, or a
+        function returning it for the parsed data, e.g. to cache failures for
+        a shorter time. With `use_cache` unset, cached entries are ignored.
+
+        If the request fails, the data of an expired entry is returned
+        rather than nothing. Raises HTTPCacheError if there is none.
+        Exceptions raised by `parse` are passed on.
+        """
+        now = time.time()
+        entry = self.load(key) if use_cache else None
+        if entry and entry["url"] != url:
+            entry = None
+        if entry and now < entry["expires"]:
+            return entry["data"]
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = get(url, headers)
+        except Exception as e:
+            if entry:
+                return entry["data"]
+            raise HTTPCacheError(str(e))
+        if response.status_code == 304 and entry:
+            entry["time"] = now
+            entry["expires"] = now + (ttl(entry["data"]) if callable(ttl) else ttl)
+            self.store(key, entry)
+            return entry["data"]
+        if not response.ok:
+            if entry:
+                return entry["data"]
+            raise HTTPCacheError(f"{url}: HTTP {response.status_code}")
+        data = parse(response)
+        self.store(key, {"format": CACHE_FORMAT,
+                         "url": url,
+                         "time": now,
+                         "expires": now + (ttl(data) if callable(ttl) else ttl),
+                         "etag": response.headers.get("ETag"),
+                         "last_modified": response.headers.get("Last-Modified"),
+                         "data": data})
+        return data
@@ -0,0 +1,90 @@
+import re
+
+from common.constants import SUPPORTED_KERNEL_TYPES
+from common.KernelVersion import KernelVersion
+
+# linux-image-5.4.0-26-generic, linux-image-unsigned-5.4.0-050400rc2-generic,
+# linux-headers-5.4.0-26, linux-image-5.4.0-6.1-liquorix-amd64, ...
+KERNEL_PKG_RE = re.compile(r'^linux-(image|image-extra|headers|modules|modules-extra)-(unsigned-)?'
+                           r'(\d.+?)(%s)?(-amd64)?$' % "|".join(SUPPORTED_KERNEL_TYPES))
+
+class KernelPackage:
+    """ A kernel package name split into its components """
+
+    def __init__(self, name, kind, unsigned, version, flavor, suffix):
+        self.name = name
+        self.kind = kind
+        self.unsigned = unsigned
+        self.version = version
+        self.flavor = flavor
+        self.suffix = suffix
+        self._kernel_version = None
+
+    @property
+    def release(self):
+        """ The kernel release as reported by `uname -r` """
+        return f"{self.version}{self.flavor}{self.suffix}"
+
+    @property
+    def kernel_version(self):
+        if not self._kernel_version:
+            self._kernel_version = KernelVersion(self.version)
+        return self._kernel_version
+
+class KernelIndex:
+    """
+    Index of the kernel and kernel meta packages among `package_names`, e.g.
+    the keys of an `apt.Cache`, built in a single pass over the names
+    """
+
+    def __init__(self, package_names):
+        self._packages = {}
+        self._series = {}
+        self._images = {}
+        self._metas = {}
+        meta_prefixes = [(f"linux{flavor}", flavor) for flavor in SUPPORTED_KERNEL_TYPES]
+        for name in package_names:
+            if not name.startswith("linux-"):
+                continue
+            match = KERNEL_PKG_RE.match(name)
+            if match:
+                kind, unsigned, version, flavor, suffix = match.groups()
+                package = KernelPackage(name, kind, bool(unsigned), version, flavor or "", suffix or "")
+                self._packages.setdefault((kind, package.flavor), []).append(package)
+                if kind == "image":
+                    self._images.setdefault(package.release, []).append(package)
+                continue
+            for prefix, flavor in meta_prefixes:
+                if name.startswith(prefix):
+                    self._metas.setdefault(flavor, []).append(name)
+        for packages in self._packages.values():
+            # Signed before unsigned builds of the same version
+            packages.sort(key=lambda package: (package.version, package.unsigned, package.name))
+        for packages in self._images.values():
+            packages.sort(key=lambda package: (package.unsigned, package.name))
+
+    def get_packages(self, kind, flavor, series=None):
+        """
+        Returns the packages of `kind` ("image", "headers", "modules", ...) and
+        `flavor`, optionally only those of the given `KernelVersion.series_key`
+        """
+        packages = self._packages.get((kind, flavor), [])
+        if series is None:
+            return packages
+        if not (kind, flavor) in self._series:
+            buckets = {}
+            for package in packages:
+                buckets.setdefault(package.kernel_version.series_key, []).append(package)
+            self._series[(kind, flavor)] = buckets
+        return self._series[(kind, flavor)].get(series, [])
+
+    def get_image_name(self, release):
+        """ Returns the name of the image package of kernel release `release`, or "" if there is none """
+        packages = self._images.get(release)
+        if packages:
+            return packages[0].name
+        return ""
+
+    def get_meta_names(self, flavor):
+        """ Returns the sorted names of the packages starting with "linux`flavor`", i.e. the metas """
+        return sorted(self._metas.get(flavor, []))
@@ -1,30 +1,156 @@
+import re
+
+# Rank of release versions, higher than that of any release candidate
+RELEASE_RANK = 1000
+# Parsed versions kept by KernelVersion()
+CACHE_SIZE = 4096
+
+_LEADING_DIGITS = re.compile(r"\d*")
+# Trailing flavor of a kernel release, e.g. "generic" of "5.4.0-26-generic", but not the "rc2" of "5.4-rc2"
+_FLAVOR = re.compile(r"-(?!rc\d)([a-zA-Z][^\s]*)$")
+_cache = {}
+
 class KernelVersion:
+    """
+    Immutable, comparable representation of a kernel version such as
+    "5.4.0-26-generic", "5.4.0-26.30", "5.4-rc2" or "2020-01-01".
 
-    def __init__(self, version):
-        field_length = 3
-        self.version = version
-        self.version_id = []
-        _version_id = version.replace("-", ".").split(".")
+    `key` is a tuple of integers ordering versions, with the rank of release
+    candidates (`rc_rank`, `RELEASE_RANK` for releases) following the fourth
+    component, e.g. (5, 4, 0, 50400, 2) for "5.4-rc2" and (5, 4, 0, 26,
+    1000, 30) for "5.4.0-26.30". `series_key` and `shortseries_key` are its
+    first three and two components. `flavor` is the flavor of a kernel
+    release, e.g. "generic", or an empty string. KernelVersion orders by
+    `key`, then by flavor, so versions are only equal if their flavors are
+    too.
+
+    Instances are cached by version string, so `KernelVersion(version)`
+    only parses each version once.
+
+    `version_id`, `series` and `shortseries` provide the zero-padded string
+    representation older code and serialized kernel records use.
+    """
+
+    __slots__ = ("version", "key", "flavor", "rc_rank", "_order", "_elements", "_suffix")
+
+    def __new__(cls, version):
+        kernel = _cache.get(version)
+        if kernel is None:
+            # Only cached once parsed, other threads may look it up meanwhile
+            kernel = object.__new__(cls)
+            kernel._parse(version)
+            if len(_cache) >= CACHE_SIZE:
+                _cache.clear()
+            kernel = _cache.setdefault(version, kernel)
+        return kernel
+
+    def _parse(self, version):
+        parts = version.replace("-", ".").split(".")
         # Check if mainline rc kernel to ensure proper sorting vs mainline release kernels
-        suffix = next((x for x in _version_id if "rc" in x), None)
+        suffix = next((x for x in parts if "rc" in x), None)
         if suffix:
             suffix = f"rc{suffix.split('rc', 1)[1]}"
+            rc_rank = int(_LEADING_DIGITS.match(suffix, 2).group() or 0)
         else:
             suffix = "z"
-        # Copy numeric parts from version_id to self.version_id and fill up to field_length
-        for element in _version_id:
-            e = element.replace(suffix, "")
-            if e and e[0].isnumeric():
-                self.version_id.append("0" * (field_length - len(e)) + e)
-        # Installed kernels always have len(self.version_id) >= 4 at this point,
+            rc_rank = RELEASE_RANK
+        elements = []
+        for part in parts:
+            element = part.replace(suffix, "")
+            if element and element[0].isnumeric():
+                elements.append(element)
+        numbers = [int(element) if element.isdigit() else int(_LEADING_DIGITS.match(element).group() or 0)
+                   for element in elements]
+        # Installed kernels always have at least four numbers at this point,
         # create missing parts for not installed mainline kernels:
-        while len(self.version_id) < 3:
-            self.version_id.append("0" * field_length)
-        if len(self.version_id) == 3:
-            _version_id = self.version_id.copy() # not needed but gets me around a pylint error
-            self.version_id.append(f"{''.join((x[:field_length - 2].lstrip('0') + x[field_length - 2:] for x in _version_id))}{suffix}")
-        elif len(self.version_id[3]) == 6:
+        while len(numbers) < 3:
+            numbers.append(0)
+        if len(numbers) == 3:
+            numbers.append(int("".join(f"{number:02}" for number in numbers)))
+        key = tuple(numbers[:4]) + (rc_rank,) + tuple(numbers[4:])
+        _set = object.__setattr__
+        _set(self, "version", version)
+        _set(self, "key", key)
+        flavor = _FLAVOR.search(version)
+        flavor = flavor.group(1) if flavor else ""
+        _set(self, "flavor", flavor)
+        _set(self, "rc_rank", rc_rank)
+        _set(self, "_order", (key, flavor))
+        _set(self, "_elements", tuple(elements))
+        _set(self, "_suffix", suffix)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"KernelVersion is immutable, cannot set {name}")
+
+    def __reduce__(self):
+        return (KernelVersion, (self.version,))
+
+    def __repr__(self):
+        return f"KernelVersion({self.version!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, KernelVersion):
+            return NotImplemented
+        return self._order == other._order
+
+    def __ne__(self, other):
+        if not isinstance(other, KernelVersion):
+            return NotImplemented
+        return self._order != other._order
+
+    def __lt__(self, other):
+        if not isinstance(other, KernelVersion):
+            return NotImplemented
+        return self._order < other._order
+
+    def __le__(self, other):
+        if not isinstance(other, KernelVersion):
+            return NotImplemented
+        return self._order <= other._order
+
+    def __gt__(self, other):
+        if not isinstance(other, KernelVersion):
+            return NotImplemented
+        return self._order > other._order
+
+    def __ge__(self, other):
+        if not isinstance(other, KernelVersion):
+            return NotImplemented
+        return self._order >= other._order
+
+    def __hash__(self):
+        return hash(self._order)
+
+    @property
+    def series_key(self):
+        return self.key[:3]
+
+    @property
+    def shortseries_key(self):
+        return self.key[:2]
+
+    @property
+    def is_rc(self):
+        return self.rc_rank != RELEASE_RANK
+
+    @property
+    def version_id(self):
+        """ Zero-padded string representation, e.g. ["005", "004", "000", "050400rc2"] """
+        field_length = 3
+        version_id = ["0" * (field_length - len(x)) + x for x in self._elements]
+        while len(version_id) < 3:
+            version_id.append("0" * field_length)
+        if len(version_id) == 3:
+            version_id.append(f"{''.join((x[:field_length - 2].lstrip('0') + x[field_length - 2:] for x in version_id))}{self._suffix}")
+        elif len(version_id[3]) == 6:
             # installed release mainline kernel, add suffix for sorting
-            self.version_id[3] += suffix
-        self.series = tuple(self.version_id[:3])
-        self.shortseries = tuple(self.version_id[:2])
+            version_id[3] += self._suffix
+        return version_id
+
+    @property
+    def series(self):
+        return tuple(self.version_id[:3])
+
+    @property
+    def shortseries(self):
+        return tuple(self.version_id[:2])
@@ -0,0 +1,247 @@
+import fcntl
+import hashlib
+import os
+import queue
+import shutil
+import threading
+
+import requests
+
+from common.constants import CACHE_DIR, USER_CACHE_DIR
+from common.FileAdapter import new_session
+from common.functions import make_private_dir
+from common.Profiler import profiler
+
+# Files downloaded at the same time
+DOWNLOAD_WORKERS = 4
+# Attempts per file, interrupted downloads are resumed
+DOWNLOAD_ATTEMPTS = 3
+# Bytes of downloaded packages kept, the least recently used ones beyond that are removed
+CACHE_LIMIT = 1024 ** 3
+CHUNK_SIZE = 65536
+# Folder in the cache directories holding the downloaded packages
+CACHE_FOLDER = "debs"
+
+class MainlineDownloaderError(Exception):
+    """ Raised when a file could not be downloaded or verified """
+
+class MainlineDownloader:
+    """
+    Downloads the packages of a mainline kernel concurrently over one pooled
+    session.
+
+    Files are hashed while they are written, with the algorithm a
+    `ChecksumVerifier` checks them with, and kept in a cache named after
+    their digest. A file that is in the cache already is not downloaded
+    again, an interrupted download is resumed with a Range request. The
+    verified files are linked or copied into `folder` under their original
+    names, so removing those after installation keeps the cache.
+
+    The cache is in `CACHE_DIR` for root, in `USER_CACHE_DIR` for everybody
+    else, so prefetched packages are still there after a reboot.
+    Downloads of the same file by other downloaders, also of other
+    processes, wait for each other.
+
+    `progress(received, total)` is called from the download threads with the
+    number of bytes received and expected so far.
+
+    `folder` is to be private, see `make_private_dir()`, as the files in it
+    are installed as root.
+    """
+
+    def __init__(self, folder, progress=None, workers=DOWNLOAD_WORKERS):
+        self.folder = folder
+        self.cache_dir = os.path.join(CACHE_DIR if os.getuid() == 0 else USER_CACHE_DIR, CACHE_FOLDER)
+        self.progress = progress
+        self.workers = workers
+        self.canceled = False
+        self._lock = threading.Lock()
+        self._received = {}
+        self._sizes = {}
+
+    def cancel(self):
+        """ Stops the downloads, `download()` then raises MainlineDownloaderError """
+        self.canceled = True
+
+    def download(self, base_url, filelist, verifier):
+        """
+        Downloads the files in `filelist` from `base_url` and checks them
+        against the digests of `verifier`. Returns the paths of the files in
+        `self.folder`, which are links to the verified files in the cache.
+        """
+        checksums = self.fetch(base_url, filelist, verifier)
+        downloaded_files = []
+        for filename, (_algorithm, digest) in checksums.items():
+            path = os.path.join(self.folder, filename)
+            if os.path.lexists(path):
+                os.remove(path)
+            try:
+                os.link(self.cached_path(digest), path)
+            except OSError:
+                shutil.copyfile(self.cached_path(digest), path)
+            downloaded_files.append(path)
+        return downloaded_files
+
+    def fetch(self, base_url, filelist, verifier):
+        """
+        Downloads the files in `filelist` from `base_url` into the cache only,
+        see `download()`. Returns their algorithms and digests by file name.
+        """
+        make_private_dir(self.cache_dir)
+        checksums = {filename: verifier.expected(filename) for filename in filelist}
+        missing = [filename for filename, (algorithm, _digest) in checksums.items() if not algorithm]
+        if missing:
+            raise MainlineDownloaderError(_(f"No checksum for {', '.join(missing)}"))
+        jobs = queue.Queue()
+        for filename in checksums:
+            jobs.put(filename)
+        errors = []
+
+        def worker():
+            while not errors and not self.canceled:
+                try:
+                    filename = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    self._download_file(session, filename, f"{base_url}{filename}", *checksums[filename])
+                except MainlineDownloaderError as e:
+                    errors.append(e)
+                except Exception as e:
+                    errors.append(MainlineDownloaderError(_(f"Failed to download {base_url}{filename}: {e}")))
+
+        with new_session(self.workers) as session:
+            threads = [threading.Thread(target=worker, daemon=True)
+                       for _i in range(min(self.workers, len(checksums)))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+        if self.canceled:
+            raise MainlineDownloaderError(_("Download canceled"))
+        self.prune(set(x[1] for x in checksums.values()))
+        return checksums
+
+    def cached_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.deb")
+
+    def is_cached(self, filelist, verifier):
+        """ Whether the files in `filelist` with the digests of `verifier` are all in the cache """
+        for filename in filelist:
+            algorithm, digest = verifier.expected(filename)
+            if not algorithm or not os.path.isfile(self.cached_path(digest)):
+                return False
+        return True
+
+    def prune(self, keep=()):
+        """ Removes the least recently used files beyond `CACHE_LIMIT` bytes, except those in `keep` """
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    # Lock files are in use while they exist
+                    if entry.is_file(follow_symlinks=False) and not entry.name.endswith(".lock"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path, entry.name))
+        except OSError:
+            return
+        total = sum(x[1] for x in entries)
+        for _mtime, size, path, name in sorted(entries):
+            if total <= CACHE_LIMIT:
+                break
+            if os.path.splitext(name)[0] in keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def _update_progress(self, filename, received, size=None):
+        with self._lock:
+            self._received[filename] = received
+            if size is not None:
+                self._sizes[filename] = size
+            progress = (sum(self._received.values()), sum(self._sizes.values()))
+        if self.progress:
+            self.progress(*progress)
+
+    @staticmethod
+    def _hash_file(path, file_hash):
+        """ Returns `file_hash` updated with the contents of `path` and their length """
+        length = 0
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                file_hash.update(data)
+                length += len(data)
+        return file_hash, length
+
+    def _download_file(self, session, filename, url, algorithm, digest):
+        lock = os.open(os.path.join(self.cache_dir, f"{digest}.lock"), os.O_RDONLY | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._fetch_file(session, filename, url, algorithm, digest)
+        finally:
+            os.close(lock)
+
+    def _fetch_file(self, session, filename, url, algorithm, digest):
+        target = self.cached_path(digest)
+        partial = os.path.join(self.cache_dir, f"{digest}.part")
+        # Cached by another downloader, which may have been interrupted writing it
+        if os.path.isfile(target):
+            file_hash, length = self._hash_file(target, hashlib.new(algorithm))
+            if file_hash.hexdigest() == digest:
+                os.utime(target)
+                profiler.count("mainline cached downloads")
+                self._update_progress(filename, length, length)
+                return
+            os.remove(target)
+        error = _(f"Failed to download {url}")
+        for _attempt in range(DOWNLOAD_ATTEMPTS):
+            if self.canceled:
+                return
+            file_hash = hashlib.new(algorithm)
+            offset = 0
+            if os.path.isfile(partial):
+                file_hash, offset = self._hash_file(partial, file_hash)
+                if file_hash.hexdigest() == digest:
+                    os.replace(partial, target)
+                    return
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            profiler.count("mainline requests")
+            try:
+                with session.get(url, headers=headers, stream=True, timeout=5) as r:
+                    if offset and r.status_code != 206:
+                        # Not resumable, start over
+                        file_hash = hashlib.new(algorithm)
+                        offset = 0
+                        if r.status_code == 416:
+                            os.remove(partial)
+                            continue
+                    if not r.ok:
+                        raise MainlineDownloaderError(_(f"Failed to download {url}"))
+                    length = r.headers.get("Content-Length")
+                    received = offset
+                    self._update_progress(filename, received, offset + int(length) if length else None)
+                    with open(partial, "ab" if offset else "wb") as outfile:
+                        for data in r.iter_content(chunk_size=CHUNK_SIZE):
+                            if self.canceled:
+                                return
+                            outfile.write(data)
+                            file_hash.update(data)
+                            received += len(data)
+                            self._update_progress(filename, received)
+            except requests.RequestException:
+                continue
+            if file_hash.hexdigest() == digest:
+                os.replace(partial, target)
+                return
+            os.remove(partial)
+            error = _(f"Checksum verification of {filename} failed")
+        if not self.canceled:
+            raise MainlineDownloaderError(error)
@@ -6,7 +6,6 @@ gi.require_version('Gtk', '3.0')
 gi.require_version('Vte', '2.91')
 from gi.repository import Gtk, Gdk, Vte, GLib
 
-import requests
 from mintcommon.localization import localized_ui
 
 from common.constants import ROOT_FUNCTIONS
@@ -91,77 +90,32 @@ class MainlineKernelInstaller(MainlineKernels):
 
     def cancel_download(self, _widget):
         self.download_canceled = True
+        downloader = self.downloader
+        if downloader:
+            downloader.cancel()
 
-    def download_files(self, version, filelist):
+    def download_files(self, version, filelist, progress=None):
         """
         Downloads `filelist` of packages for mainline kernel `version` into
-        `self.tmpfolder`
+        `self.tmpfolder`, without a download window if they were prefetched
         """
+        if self.is_staged(version, filelist):
+            return super().download_files(version, filelist, progress)
         self.download_canceled = False
         self.vte_spawn(title=_("Mainline Kernel Download"), deletable=True, destroy_cb=self.cancel_download)
-
-        if not os.path.exists(self.tmpfolder):
-            os.umask(0)
-            os.makedirs(self.tmpfolder)
-        base_url = self.base_data.versioned_url(version)
-        session = requests.Session()
-        downloaded_files = []
-        # get the files
-        for filename in filelist:
-            self.vte_set_status(_(f"Downloading {filename}…"))
-            download_failed = False
-            url = base_url + filename
-            try:
-                r = session.get(url, stream=True, timeout=5)
-            except:
-                download_failed = True
-            if not download_failed and r.ok:
-                try:
-                    length = r.headers.get("Content-Length")
-                    if length:
-                        r.length = int(length)
-                        Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self._show_progressbar)
-                    else:
-                        r.length = 0
-                    with open(self.tmpfolder + filename, "wb") as outfile:
-                        recv_length = 0
-                        for data in r.iter_content(chunk_size=16384):
-                            if self.download_canceled:
-                                raise self.DownloadError(_("Download canceled"))
-                            recv_length += len(data)
-                            outfile.write(data)
-                            Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self._update_progressbar, recv_length / r.length)
-                    downloaded_files.append(self.tmpfolder + filename)
-                except:
-                    download_failed = True
-            else:
-                download_failed = True
-            if download_failed:
-                for downloaded_file in downloaded_files:
-                    if os.path.isfile(downloaded_file):
-                        os.remove(downloaded_file)
-                try:
-                    session.close()
-                except:
-                    pass
-                raise self.DownloadError(_(f"Failed to download {url}"))
-        # verify the checksums
-        verified = False
-        try:
-            self.vte_set_status(_(f"Verifying downloaded files…"))
-            r = session.get(f"{self.base_data.versioned_url(version)}CHECKSUMS", timeout=5)
-            # TODO: Checksum authentication via CHECKSUMS.gpg necessary?
-            # If we do this, we should supply the key so we do not have to rely on the
-            # keyserver - fingerprint 60AA7B6F30434AE68E569963E50C6A0917C622B0
-            if r.ok:
-                r.encoding = None
-                checksums = r.text
-                verified = self.verify_checksums(checksums, downloaded_files)
-        except:
-            pass
-        if not verified:
-            raise self.DownloadError(_(f"Checksum verification of downloaded files failed"))
-        session.close()
+        self.vte_set_status(_(f"Downloading mainline kernel {version}…"))
+        Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self._show_progressbar)
+
+        def _progress(received, total):
+            if self.download_canceled and self.downloader:
+                # Canceled before the downloads started
+                self.downloader.cancel()
+            if total:
+                Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self._update_progressbar, received / total)
+            if progress:
+                progress(received, total)
+
+        downloaded_files = super().download_files(version, filelist, _progress)
         if self.window:
             Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self._hide_window)
         return downloaded_files
@@ -1,35 +1,87 @@
-import hashlib
-import json
+import codecs
+import copy
+import html
 import os
+import queue
 import re
+import shutil
 import subprocess
 import tempfile
+import threading
+import time
 from html.parser import HTMLParser
 
-import requests
-
 from common import settings
-from common.constants import ROOT_FUNCTIONS
-from common.functions import configured_kernel_type
+from common.ChangelogCache import changelog_cache
+from common.ChecksumVerifier import ChecksumError, ChecksumVerifier
+from common.constants import CACHE_DIR, ROOT_FUNCTIONS, USER_CACHE_DIR
+from common.FileAdapter import new_session, write_index
+from common.functions import configured_kernel_type, make_private_dir
+from common.HTTPCache import HTTPCache, HTTPCacheError
+from common.MainlineDownloader import MainlineDownloader, MainlineDownloaderError
+from common.MainlineVersionIndex import MainlineVersionIndex
+from common.Profiler import profiler
 
 
 PPA_URL = "https://kernel.ubuntu.com/~kernel-ppa/mainline/"
-CACHEFOLDER = "/var/cache/mintupdate/"
+# Machine-readable list of the kernel.org releases, also kept in mirrors of the PPA
+RELEASES_URL = "https://www.kernel.org/releases.json"
+RELEASES_FILE = "releases.json"
+SUPPORT_STATUS_CACHE_KEY = "mainline-support-status"
+SUPPORT_STATUS_HTML_CACHE_KEY = "mainline-support-status-html"
+# Seconds the retrieved data is used for before it is revalidated
+INDEX_TTL = 3600
+SUPPORT_STATUS_TTL = 6 * 3600
+# The file list of a version does not change once it is built
+FILELIST_TTL = 7 * 24 * 3600
+# Failed builds are sometimes redone
+FAILED_TTL = 24 * 3600
+# Cached in place of the file list of a version that failed to build
+FAILED = "FAILED"
+# Folder in the cache directories holding the file lists and CHECKSUMS of all
+# versions and branches, and the bytes they may take up
+CATALOG_FOLDER = "mainline"
+CATALOG_SIZE = 2 * 1024 * 1024
+# Seconds the sizes of the files of a version are looked up for altogether
+SIZE_LOOKUP_TIMEOUT = 5
+# Niceness of the thread prefetching mainline kernel packages
+PREFETCH_NICENESS = 19
+
+def mainline_ppa_url():
+    """ Returns the URL of the configured mirror of the mainline kernel PPA, `PPA_URL` if there is none """
+    url = settings.get_string("mainline-mirror").strip()
+    if not url:
+        return PPA_URL
+    return url if url.endswith("/") else f"{url}/"
 
 class MainlineKernelData:
-    """ Holds mainline kernel type-specific data, `name` must be the folder name in the PPA """
-    def __init__(self, name=None, title="", is_daily=False):
+    """
+    Holds mainline kernel type-specific data, `name` must be the folder name
+    in the PPA at `ppa_url`
+    """
+    def __init__(self, name=None, title="", is_daily=False, ppa_url=PPA_URL):
         self.title = _("Ubuntu mainline kernel")
         if title:
             self.title += f"{self.title} - {title}"
         if name:
-            self.base_url = f"{PPA_URL}{name}/"
+            self.folder = f"{name}/"
         else:
             name = "ppa"
-            self.base_url = PPA_URL
-        self.cachefile = f"{CACHEFOLDER}mainline-{name}"
+            self.folder = ""
+        self.cache_key = f"mainline-{name}"
         self.is_daily = is_daily
         self.name = name
+        self.ppa_url = ppa_url
+
+    @property
+    def base_url(self):
+        return f"{self.ppa_url}{self.folder}"
+
+    def with_url(self, ppa_url):
+        """ Returns a copy of this data for the PPA, or a mirror of it, at `ppa_url` """
+        data = copy.copy(self)
+        data.ppa_url = ppa_url
+        return data
 
     def versioned_url(self, version):
         """
@@ -41,6 +93,10 @@ class MainlineKernelData:
         else:
             return f"{self.base_url}v{self.format_version(version)}/"
 
+    def catalog_key(self, version):
+        """ Returns the prefix of the catalog entries of `version` """
+        return f"{self.name}-{self.format_version(version)}"
+
     def changelog_url(self, version):
         """
         Returns a URI to the CHANGES file at `PPA_URL` corresponding to `version`.
@@ -97,27 +153,61 @@ MAINLINE_KERNEL_DATA = {
     997: MainlineKernelData("drm-intel-next", "drm-intel-next build", True),
 }
 
-class KernelPPA_DailyIndexParser(HTMLParser):
-    """ Returns the newest entry from a daily builds index """
+# Entries of the kernel PPA index pages
+DAILY_BUILD_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})\/$")
+VERSION_PATTERN = re.compile(r"^v(\d)\.(\d+)(.*?)?\/$")
+PACKAGE_PATTERN = re.compile(r"^(.+?)\-(.+?)\-(\d\.\d+\.\d+\-\d+(?:rc\d)?)(\-.+?)?_(.+?)\_(.+?)\.deb$")
+# Series of a kernel.org release, e.g. 5.4 of 5.4.20 or 5.6-rc2
+SERIES_PATTERN = re.compile(r"^(\d+\.\d+)")
 
-    def __init__(self):
-        super().__init__()
-        self.new_row = False
-        self.r = re.compile(r"^(\d{4}-\d{2}-\d{2})\/$")
-        self.daily_build = None
-
-    def handle_starttag(self, tag, attrs):
-        if tag == "tr":
-            self.new_row = True
+class KernelPPA_IndexScanner:
+    """
+    Pulls the link texts, i.e. the folder and file names, out of a kernel
+    PPA index page fed in chunks, so the page is parsed while it is
+    received. Links may have attributes other than href, as in the listings
+    of web servers other than Apache, their texts are unescaped.
 
-    def handle_data(self, data):
-        if self.new_row:
-            match = self.r.match(data)
-            if match:
-                self.daily_build = data[:-1]
+    If `marker` is given, `marker_found` tells whether the text so far
+    contained it, so reading the page can stop there.
+    """
 
-    def error(self, message):
-        raise Exception(message)
+    link = re.compile(r"<a\s[^>]*?\bhref\s*=[^>]*>([^<]*)</a>", re.IGNORECASE)
+
+    def __init__(self, marker=None):
+        self.buffer = ""
+        self.marker = marker
+        self.marker_found = False
+
+    def feed(self, text):
+        """ Returns the link texts completed by `text` """
+        buffer = self.buffer + text
+        if self.marker and not self.marker_found:
+            self.marker_found = self.marker in buffer
+        entries = []
+        end = 0
+        for match in self.link.finditer(buffer):
+            entries.append(html.unescape(match.group(1)))
+            end = match.end()
+        # Keep an incomplete link, and enough text to find a marker split between chunks
+        start = buffer.rfind("<a", end)
+        if start < 0:
+            start = buffer.rfind("<", end)
+        if start < 0:
+            start = len(buffer)
+        if self.marker:
+            start = min(start, max(end, len(buffer) - len(self.marker) + 1))
+        self.buffer = buffer[start:]
+        return entries
+
+    def scan(self, response, chunk_size=16384):
+        """ Yields the link texts of the index page `response` while it is received """
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                yield from self.feed(decoder.decode(chunk))
+            yield from self.feed(decoder.decode(b"", final=True))
+        finally:
+            response.close()
 
 class MainlineKernels:
     """
@@ -137,14 +227,19 @@ class MainlineKernels:
     class ParserError(MainlineKernelsException):
         """ Generic exception class for download errors """
 
-    def __init__(self, branch_id=0, cached=True, flavor=""):
+    def __init__(self, branch_id=0, cached=True, flavor="", ppa_url=None):
         if not branch_id in MAINLINE_KERNEL_DATA:
             raise self.KernelUnavailable("Unknown kernel type")
 
-        self.tmpfolder = os.path.join(tempfile.gettempdir(), "mintUpdate/")
-        self.supported_cachefile = f"{CACHEFOLDER}mainline-support-status"
+        # Private, other users must not be able to replace the packages before they are installed
+        self.tmpfolder = os.path.join(tempfile.gettempdir(), f"mintUpdate-{os.getuid()}/")
         self.supported_url = "https://www.kernel.org/"
         self.use_cache = cached
+        self.cache = HTTPCache()
+        self.catalog = HTTPCache(os.path.join(CACHE_DIR, CATALOG_FOLDER),
+                                 os.path.join(USER_CACHE_DIR, CATALOG_FOLDER), CATALOG_SIZE)
+        self.downloader = None
+        self.session = new_session()
         self.include_rc = settings.get_boolean("mainline-include-rc")
         self.include_longterm = settings.get_boolean("mainline-include-longterm")
         self.supported_mainline_kernel_types = ["-generic", "-lowlatency"]
@@ -152,7 +247,27 @@ class MainlineKernels:
             self.configured_kernel_type = configured_kernel_type()
         else:
             self.configured_kernel_type = flavor
-        self.base_data = MAINLINE_KERNEL_DATA[branch_id]
+        self.base_data = MAINLINE_KERNEL_DATA[branch_id].with_url(ppa_url or mainline_ppa_url())
+        if self.base_data.ppa_url == PPA_URL:
+            self.releases_url = RELEASES_URL
+        else:
+            self.releases_url = f"{self.base_data.ppa_url}{RELEASES_FILE}"
+
+    def close(self):
+        """ Closes the connections kept open for further requests """
+        self.session.close()
+
+    def _get(self, url, session=None, **kwargs):
+        """ GET request on `url`, via `session` if given, recorded by the profiler """
+        profiler.count("mainline requests")
+        with profiler.phase("mainline request", url):
+            return (session or self.session).get(url, timeout=5, **kwargs)
+
+    def _head(self, url, session=None, **kwargs):
+        """ HEAD request on `url`, via `session` if given, recorded by the profiler """
+        profiler.count("mainline requests")
+        with profiler.phase("mainline request", url):
+            return (session or self.session).head(url, timeout=5, allow_redirects=True, **kwargs)
 
     def get_daily_build(self):
         """
@@ -161,31 +276,51 @@ class MainlineKernels:
         if self.configured_kernel_type not in self.supported_mainline_kernel_types:
             return []
 
-        daily_build = self._load_cache(self.base_data.cachefile)
-        if not daily_build:
-
+        def parse(r):
+            # The order of index pages depends on the web server, so all of it is read. The dates
+            # sort as strings
             try:
-                r = requests.get(self.base_data.base_url, timeout=5)
-                if not r.ok:
-                    raise self.DownloadError
-            except:
-                raise self.DownloadError(_("Failed to retrieve daily mainline builds list."))
-            try:
-                mainline_kernels = KernelPPA_DailyIndexParser()
-                mainline_kernels.feed(r.text)
-                mainline_kernels.close()
-                daily_build = mainline_kernels.daily_build
+                return max((entry[:-1] for entry in KernelPPA_IndexScanner().scan(r)
+                            if DAILY_BUILD_PATTERN.match(entry)), default=None)
             except:
                 raise self.ParserError(_("Failed to retrieve daily mainline builds list."))
-            self._write_cache(self.base_data.cachefile, daily_build)
 
-        return daily_build
+        return self._fetch(self.base_data.cache_key, self.base_data.base_url, parse,
+                           INDEX_TTL, _("Failed to retrieve daily mainline builds list."), stream=True)
 
     def get_support_status(self):
+        """
+        Returns a dictionary containing series:support_status, where
+        support_status is either eol for End of Life or the string used on
+        kernel.org (i.e. mainline, stable, longterm).
+
+        The status is read from kernel.org's releases.json, or that of the
+        configured mirror. If it cannot be retrieved, the kernel.org front
+        page is parsed instead.
+        """
+        def parse(r):
+            supported_series = {}
+            try:
+                for release in r.json()["releases"]:
+                    match = SERIES_PATTERN.match(release["version"])
+                    if match:
+                        supported_series[match.group(1)] = "eol" if release["iseol"] else release["moniker"]
+            except:
+                raise self.ParserError(_("Failed to parse mainline kernel support status."))
+            if not supported_series:
+                raise self.ParserError(_("Failed to parse mainline kernel support status."))
+            return supported_series
+
+        try:
+            return self._fetch(SUPPORT_STATUS_CACHE_KEY, self.releases_url, parse, SUPPORT_STATUS_TTL,
+                               _("Failed to retrieve mainline kernel support status."))
+        except self.MainlineKernelsException:
+            return self.get_support_status_html()
+
+    def get_support_status_html(self):
         """
         Parses kernel.org front page and returns a dictionary containing
-        series:support_status, where support_status is either End of Life or
-        the string used on kernel.org (i.e. mainline, stable, longterm)
+        series:support_status as `get_support_status()` does
         """
 
         class KernelOrgParser(HTMLParser):
@@ -239,25 +374,17 @@ class MainlineKernels:
             def error(self, message):
                 raise Exception(message)
 
-        supported_series = self._load_cache(self.supported_cachefile)
-
-        if not supported_series:
-            try:
-                r = requests.get(self.supported_url, timeout=5)
-                if not r.ok:
-                    raise self.DownloadError
-            except:
-                raise self.DownloadError(_("Failed to retrieve mainline kernel support status."))
+        def parse(r):
             try:
                 mainline_kernels = KernelOrgParser()
                 mainline_kernels.feed(r.text)
                 mainline_kernels.close()
-                supported_series = mainline_kernels.supported_series
+                return mainline_kernels.supported_series
             except:
                 raise self.ParserError(_("Failed to parse mainline kernel support status."))
-            self._write_cache(self.supported_cachefile, supported_series)
 
-        return supported_series
+        return self._fetch(SUPPORT_STATUS_HTML_CACHE_KEY, self.supported_url, parse, SUPPORT_STATUS_TTL,
+                           _("Failed to retrieve mainline kernel support status."))
 
     def get_available_versions(self, filter_eol=True, filter_rc=True, filter_longterm=True):
         """
@@ -271,280 +398,268 @@ class MainlineKernels:
         Longterm support series are only included if `filter_longterm=False` is
         passed or `self.include_longterm` is `True`
         """
+        return self.filter_versions(self.get_version_index(), filter_eol=filter_eol, filter_rc=filter_rc,
+                                    filter_longterm=filter_longterm).versions
 
+    def get_version_index(self):
+        """
+        Returns the `MainlineVersionIndex` of all mainline kernel versions,
+        built once per download of the index.
+        """
         if self.configured_kernel_type not in self.supported_mainline_kernel_types:
-            return []
-
-        class KernelPPA_IndexParser(HTMLParser):
-            """ Parses HTML into `self.versions` list """
-
-            def __init__(self):
-                super().__init__()
-                self.new_row = False
-                self.r = re.compile(r"^v(\d)\.(\d+)(.*?)?\/$")
-                self.versions = []
-
-            def handle_starttag(self, tag, attrs):
-                if tag == "tr":
-                    self.new_row = True
+            return MainlineVersionIndex([])
 
-            def handle_data(self, data):
-                if self.new_row:
-                    match = self.r.match(data)
-                    if match:
-                        self.versions.append(data[1:-1])
-                        self.new_row = False
-
-            def error(self, message):
-                raise Exception(message)
-
-        mainline_kernel_versions = self._load_cache(self.base_data.cachefile)
-
-        if not mainline_kernel_versions:
+        def parse(r):
             try:
-                r = requests.get(self.base_data.base_url, timeout=5)
-                if not r.ok:
-                    raise self.DownloadError
-            except:
-                raise self.DownloadError(_("Failed to retrieve mainline kernel list."))
-            try:
-                mainline_kernels = KernelPPA_IndexParser()
-                mainline_kernels.feed(r.text)
-                mainline_kernels.close()
-                mainline_kernel_versions = mainline_kernels.versions[::-1]
+                return [entry[1:-1] for entry in KernelPPA_IndexScanner().scan(r) if VERSION_PATTERN.match(entry)]
             except:
                 raise self.ParserError(_("Failed to parse mainline kernel list."))
-            self._write_cache(self.base_data.cachefile, mainline_kernel_versions)
-
-        if filter_eol or filter_rc or filter_longterm:
-            if filter_eol:
-                try:
-                    supported_series = self.get_support_status()
-                except self.MainlineKernelsException as e:
-                    print(e)
-                    supported_series = {}
-
-            filtered = []
-            known_series = []
-            r = re.compile(r"^(\d)\.(\d+)(-rc\d)?.*$")
-            for kernel in mainline_kernel_versions:
-                match = r.match(kernel)
-                kernel_series = f"{match.group(1)}.{match.group(2)}"
-                is_rc = match.group(3) is not None
-                if not kernel_series in known_series and not is_rc:
-                    known_series.append(kernel_series)
-                # Filter conditition getting a bit complex:
-                if (
-                        not filter_eol or
-                        (
-                            # Supported kernels
-                            kernel_series in supported_series and
-                            (
-                                # Longterm support kernels
-                                not filter_longterm or
-                                self.include_longterm or
-                                supported_series[kernel_series] != "longterm"
-                            )
-                        )
-                   ) and \
-                   (
-                        # Release candidates that have no released version in
-                        # the series
-                        not is_rc or
-                        (
-                            kernel_series not in known_series and
-                            (not filter_rc or self.include_rc)
-                        )
-                   ):
-                    filtered.append(kernel)
-            return filtered
-
-        return mainline_kernel_versions
+
+        versions = self._fetch(self.base_data.cache_key, self.base_data.base_url, parse,
+                               INDEX_TTL, _("Failed to retrieve mainline kernel list."), stream=True)
+        return MainlineVersionIndex.of(versions)
+
+    def filter_versions(self, index, supported_series=None, filter_eol=True, filter_rc=True, filter_longterm=True):
+        """
+        Returns `MainlineVersionIndex` `index` filtered as described in
+        `get_available_versions()`. The support status is taken from
+        `supported_series` if given, retrieved otherwise.
+        """
+        if filter_eol and supported_series is None:
+            try:
+                supported_series = self.get_support_status()
+            except self.MainlineKernelsException as e:
+                print(e)
+                supported_series = {}
+        return index.filter(supported_series, filter_eol,
+                            filter_rc and not self.include_rc,
+                            filter_longterm and not self.include_longterm)
 
     def get_filelist(self, version, get_size=True):
         """
         Returns a dictionary of the files making up the given kernel version.
         Dictionary keys are "filename" and "size", with size only getting
         populated if called with get_size=True, otherwise size is 0.
-        """
-        class KernelPPA_KernelParser(HTMLParser):
-            """ Parses HTML into `self.files` list """
-
-            def __init__(self, kernel_type:str, arch:str):
-                super().__init__()
-                self.new_row = False
-                self.r = re.compile(r"^(.+?)\-(.+?)\-(\d\.\d+\.\d+\-\d+(?:rc\d)?)(\-.+?)?_(.+?)\_(.+?)\.deb$")
-                self.arch = arch
-                self.kernel_type = kernel_type
-                self.files = []
-
-            def handle_starttag(self, tag, attrs):
-                if tag == "tr":
-                    self.new_row = True
-
-            def handle_data(self, data):
-                if self.new_row:
-                    match = self.r.match(data)
-                    if match and match.group(1) == "linux" and \
-                       (not match.group(4) or match.group(4) == self.kernel_type) and \
-                       (match.group(6) == "all" or match.group(6) == self.arch):
-                        self.files.append(data)
-                        self.new_row = False
-
-            def error(self, message):
-                raise Exception(message)
 
+        The file list is kept in the catalog shared by all versions and
+        branches, separately per flavor and architecture. Sizes are looked up by `get_sizes()` unless the catalog has
+        them already, and then stored along with the file list.
+        """
         arch = os.uname().machine
         if arch == "x86_64":
             arch = "amd64"
 
-        cachefile = f"{self.base_data.cachefile}-kernel"
-        filelist = self._load_cache(cachefile)
-        if filelist:
-            if not filelist[0] == version:
-                filelist = []
-            elif filelist[1] == "FAILED":
-                raise self.KernelUnavailable(_(f"Mainline kernel {version} is unavailable (failed to build)"))
-        if not filelist:
-            filelist = [version]
-            session = requests.Session()
+        def parse(r):
+            # The build status precedes the file list
+            scanner = KernelPPA_IndexScanner(f"Build for {arch} failed")
+            files = []
             try:
-                r = session.get(self.base_data.versioned_url(version), timeout=5)
-                if not r.ok:
-                    session.close()
-                    raise self.DownloadError
+                for entry in scanner.scan(r):
+                    if scanner.marker_found:
+                        break
+                    match = PACKAGE_PATTERN.match(entry)
+                    if match and match.group(1) == "linux" and \
+                       (not match.group(4) or match.group(4) == self.configured_kernel_type) and \
+                       (match.group(6) == "all" or match.group(6) == arch):
+                        files.append(entry)
             except:
-                try:
-                    session.close()
-                except:
-                    pass
-                raise self.DownloadError(_(f"Failed to retrieve mainline kernel {version} data"))
-            if f"Build for {arch} failed" in r.text:
-                filelist.append("FAILED")
-                self._write_cache(cachefile, filelist)
-                session.close()
+                raise self.ParserError(_(f"Failed to parse mainline kernel {version} data"))
+            if scanner.marker_found:
+                return FAILED
+            if not files or len(files) < 4:
                 raise self.KernelUnavailable(_(f"Mainline kernel {version} is unavailable (failed to build)"))
+            return [{"filename": filename, "size": 0} for filename in files]
+
+        cache_key = f"{self.base_data.catalog_key(version)}{self.configured_kernel_type}-{arch}.files"
+        url = self.base_data.versioned_url(version)
+        filelist = self._fetch(cache_key, url, parse,
+                               lambda data: FAILED_TTL if data == FAILED else FILELIST_TTL,
+                               _(f"Failed to retrieve mainline kernel {version} data"), cache=self.catalog,
+                               stream=True)
+        if filelist == FAILED:
+            raise self.KernelUnavailable(_(f"Mainline kernel {version} is unavailable (failed to build)"))
+        if get_size and not all(x["size"] for x in filelist):
+            filelist = self.get_sizes(version, filelist)
+            if all(x["size"] for x in filelist):
+                self.catalog.update(cache_key, url, filelist)
+        return filelist
+
+    def get_sizes(self, version, filelist):
+        """
+        Returns a copy of `filelist`, as returned by `get_filelist()`, with the
+        missing sizes of the files of mainline kernel `version` filled in.
+
+        The sizes are looked up concurrently with HEAD requests sharing one
+        connection pool. Sizes not known after `SIZE_LOOKUP_TIMEOUT` seconds
+        remain 0.
+        """
+        base_url = self.base_data.versioned_url(version)
+        missing = [x["filename"] for x in filelist if not x["size"]]
+        results = queue.Queue()
+
+        def get_size(filename):
+            size = 0
             try:
-                mainline_kernel = KernelPPA_KernelParser(kernel_type=self.configured_kernel_type, arch=arch)
-                mainline_kernel.feed(r.text)
-                mainline_kernel.close()
+                r = self._head(f"{base_url}{filename}", session)
+                length = r.headers.get("Content-Length")
+                if r.ok and length:
+                    size = int(length)
             except:
-                session.close()
-                raise self.ParserError(_(f"Failed to parse mainline kernel {version} data"))
-            if not mainline_kernel.files or len(mainline_kernel.files) < 4:
-                session.close()
-                raise self.KernelUnavailable(_(f"Mainline kernel {version} is unavailable (failed to build)"))
-            for filename in mainline_kernel.files:
-                size = 0
-                if get_size:
-                    try:
-                        r = session.get(f"{self.base_data.base_url}{filename}", stream=True, timeout=5)
-                        length = r.headers.get("Content-Length")
-                        if length:
-                            size = int(length)
-                    except:
-                        pass
-                filelist.append({"filename": filename, "size": size})
+                pass
+            results.put((filename, size))
+
+        def close_session(threads):
+            for thread in threads:
+                thread.join()
             session.close()
-            self._write_cache(cachefile, filelist)
-        return filelist[1:]
+
+        sizes = {}
+        with profiler.phase("mainline sizes", version):
+            session = new_session(max(len(missing), 1))
+            deadline = time.monotonic() + SIZE_LOOKUP_TIMEOUT
+            threads = [threading.Thread(target=get_size, args=(filename,), daemon=True) for filename in missing]
+            for thread in threads:
+                thread.start()
+            try:
+                for _i in range(len(missing)):
+                    filename, size = results.get(timeout=max(deadline - time.monotonic(), 0))
+                    sizes[filename] = size
+            except queue.Empty:
+                pass
+            if len(sizes) == len(missing):
+                session.close()
+            else:
+                # Lookups still running past the deadline no longer count,
+                # the session is closed once they are done
+                threading.Thread(target=close_session, args=(threads,), daemon=True).start()
+        return [{"filename": x["filename"], "size": x["size"] or sizes.get(x["filename"], 0)}
+                for x in filelist]
 
     def get_changelog(self, version):
         """
         Returns a string containing Ubuntu's CHANGES file containing the git
         commit log or on failure an empty string.
         """
-        try:
-            r = requests.get(self.base_data.changelog_url(version), timeout=5)
-            if r.ok:
-                r.encoding = None
-                return r.text
-        except:
-            pass
-        return ""
+        def get():
+            try:
+                r = self._get(url)
+                if r.ok:
+                    r.encoding = None
+                    return r.text
+            except:
+                pass
+            return ""
 
-    def download_files(self, version, filelist):
+        url = self.base_data.changelog_url(version)
+        return changelog_cache.retrieve(url, get)
+
+    def download_files(self, version, filelist, progress=None):
         """
         Downloads `filelist` of packages for mainline kernel `version` into
-        `self.tmpfolder`
-        """
-        import shutil
+        `self.tmpfolder` and verifies them against its CHECKSUMS file.
 
-        if not os.path.exists(self.tmpfolder):
-            os.umask(0)
-            os.makedirs(self.tmpfolder)
+        See `MainlineDownloader` for the `progress` callback.
+        """
         base_url = self.base_data.versioned_url(version)
-        session = requests.Session()
-        downloaded_files = []
-        for filename in filelist:
-            download_failed = False
-            url = base_url + filename
-            try:
-                r = session.get(url, stream=True, timeout=5)
-            except:
-                download_failed = True
-            if not download_failed and r.ok:
-                try:
-                    with open(self.tmpfolder + filename, "wb") as outfile:
-                        r.raw.decode_content = True
-                        shutil.copyfileobj(r.raw, outfile)
-                    downloaded_files.append(self.tmpfolder + filename)
-                except:
-                    download_failed = True
-            else:
-                download_failed = True
-            if download_failed:
-                for downloaded_file in downloaded_files:
-                    if os.path.isfile(downloaded_file):
-                        os.remove(downloaded_file)
-                try:
-                    session.close()
-                except:
-                    pass
-                raise self.DownloadError(_(f"Failed to download {url}"))
-        # verify the checksums
-        verified = False
+        verifier = ChecksumVerifier(self.get_checksums(version))
+        self.downloader = MainlineDownloader(self.tmpfolder, progress)
         try:
-            r = session.get(f"{self.base_data.versioned_url(version)}CHECKSUMS", timeout=5)
-            # TODO: Checksum authentication via CHECKSUMS.gpg necessary?
-            # If we do this, we should supply the key so we do not have to rely on the
-            # keyserver - fingerprint 60AA7B6F30434AE68E569963E50C6A0917C622B0
-            if r.ok:
-                r.encoding = None
-                checksums = r.text
-                verified = self.verify_checksums(checksums, downloaded_files)
-        except:
-            pass
-        if not verified:
-            raise self.DownloadError(_(f"Checksum verification of downloaded files failed"))
-        session.close()
+            make_private_dir(self.tmpfolder)
+            with profiler.phase("mainline download", version):
+                downloaded_files = self.downloader.download(base_url, filelist, verifier)
+            # The files handed to the installer, whatever was checked while downloading them
+            with profiler.phase("mainline verification", version):
+                verifier.verify(downloaded_files)
+        except OSError as e:
+            raise self.DownloadError(str(e))
+        except (MainlineDownloaderError, ChecksumError) as e:
+            raise self.DownloadError(e.args[0])
+        finally:
+            self.downloader = None
+        # Start over with fresh connections, closing those kept since the lookups
+        self.close()
+        self.session = new_session()
         return downloaded_files
 
-    @staticmethod
-    def verify_checksums(checksums, downloaded_files):
-        checksums = checksums.split("Checksums-Sha256:", 1)
-        if not len(checksums) == 2:
+    def prefetch(self, version, filelist, progress=None):
+        """
+        Downloads and verifies `filelist` of packages for mainline kernel
+        `version` into the package cache in the background, with one
+        connection at the lowest CPU priority, so `download_files()` then
+        finds them there. Meant for a thread of its own, which keeps the
+        lowered priority. Canceled by `self.downloader.cancel()`.
+
+        See `MainlineDownloader` for the `progress` callback.
+        """
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICENESS)
+        verifier = ChecksumVerifier(self.get_checksums(version))
+        self.downloader = MainlineDownloader(self.tmpfolder, progress, workers=1)
+        try:
+            with profiler.phase("mainline prefetch", version):
+                self.downloader.fetch(self.base_data.versioned_url(version), filelist, verifier)
+        except OSError as e:
+            raise self.DownloadError(str(e))
+        except MainlineDownloaderError as e:
+            raise self.DownloadError(e.args[0])
+        finally:
+            self.downloader = None
+
+    def is_staged(self, version, filelist):
+        """ Whether `filelist` of packages for mainline kernel `version` was prefetched already """
+        try:
+            verifier = ChecksumVerifier(self.get_checksums(version))
+        except self.MainlineKernelsException:
             return False
-        checksums = checksums[1]
-        for downloaded_file in downloaded_files:
-            for line in checksums.split("\n"):
-                line = line.split()
-                if not len(line) == 2:
-                    continue
-                if os.path.basename(downloaded_file) == line[1]:
-                    # calculate SHA256 hash for downloaded file
-                    sha256_hash = hashlib.sha256()
-                    with open(downloaded_file, "rb") as f:
-                        while True:
-                            data = f.read(65536)
-                            if not data:
-                                break
-                            sha256_hash.update(data)
-                    # compare to the reference hash
-                    if sha256_hash.hexdigest() != line[0]:
-                        return False
-        # If we didn't fail up to here, all files must have been verified
-        return True
+        return MainlineDownloader(self.tmpfolder).is_cached(filelist, verifier)
+
+    def get_checksums(self, version):
+        """ Returns the CHECKSUMS file of mainline kernel `version` """
+        # TODO: Checksum authentication via CHECKSUMS.gpg necessary?
+        # If we do this, we should supply the key so we do not have to rely on the
+        # keyserver - fingerprint 60AA7B6F30434AE68E569963E50C6A0917C622B0
+        def parse(r):
+            r.encoding = None
+            return r.text
+
+        url = f"{self.base_data.versioned_url(version)}CHECKSUMS"
+        return self._fetch(f"{self.base_data.catalog_key(version)}.checksums", url, parse, FILELIST_TTL,
+                           _(f"Failed to download {url}"), cache=self.catalog)
+
+    def mirror(self, directory, versions):
+        """
+        Copies the packages, CHECKSUMS and CHANGES of mainline kernel
+        `versions` into `directory`, laid out like `PPA_URL` with index
+        pages and kernel.org's releases.json, so it can be served to other
+        hosts and set as mainline-mirror. Returns the folders of the
+        versions.
+        """
+        root = os.path.join(directory, self.base_data.folder)
+        folders = []
+        for version in versions:
+            filelist = [x["filename"] for x in self.get_filelist(version, False)]
+            folder = os.path.join(root, os.path.basename(self.base_data.versioned_url(version)[:-1]))
+            os.makedirs(folder, exist_ok=True)
+            for path in self.download_files(version, filelist):
+                shutil.move(path, os.path.join(folder, os.path.basename(path)))
+            with open(os.path.join(folder, "CHECKSUMS"), "w", encoding="utf-8") as f:
+                f.write(self.get_checksums(version))
+            changelog = self.get_changelog(version)
+            if changelog:
+                with open(os.path.join(folder, "CHANGES"), "w", encoding="utf-8") as f:
+                    f.write(changelog)
+            write_index(folder)
+            folders.append(folder)
+        try:
+            r = self._get(self.releases_url)
+            if r.ok:
+                with open(os.path.join(directory, RELEASES_FILE), "wb") as f:
+                    f.write(r.content)
+        except (OSError, ValueError):
+            pass
+        write_index(root)
+        if os.path.normpath(root) != os.path.normpath(directory):
+            write_index(directory)
+        return folders
 
     @staticmethod
     def install(debfiles, is_upgrade=False):
@@ -569,30 +684,17 @@ class MainlineKernels:
             return e.returncode
         return 0
 
-    def _load_cache(self, cachefile):
+    def _fetch(self, cache_key, url, parse, ttl, error_message, session=None, cache=None, stream=False):
         """
-        Returns a json object loaded from `cachefile` or `None`.
+        Returns the data of `url` parsed by `parse(response)`, cached as
+        `cache_key` in `cache` or `self.cache` for `ttl` seconds, see
+        `HTTPCache.fetch()`. With `stream` set, `parse` receives the
+        response before its content.
         """
-        try:
-            if self.use_cache and os.path.exists(cachefile):
-                with open(cachefile) as f:
-                    return json.load(f)
-        except:
-            pass
-        return None
+        def get(url, headers):
+            return self._get(url, session, headers=headers, stream=stream)
 
-    @staticmethod
-    def _write_cache(cachefile, data):
-        """
-        Writes json object `data` into `cachefile` but only if run as root.
-        """
-        if not data or not os.getuid() == 0:
-            return
         try:
-            cachedir = os.path.dirname(cachefile)
-            if not os.path.exists(cachedir):
-                os.makedirs(cachedir)
-            with open(cachefile, "w") as f:
-                json.dump(data, f)
-        except:
-            pass
+            return (cache or self.cache).fetch(cache_key, url, get, parse, ttl, self.use_cache)
+        except HTTPCacheError:
+            raise self.DownloadError(error_message)
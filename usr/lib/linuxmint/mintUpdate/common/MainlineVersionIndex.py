@@ -0,0 +1,88 @@
+from common.KernelVersion import KernelVersion
+
+_last = (None, None)
+
+class MainlineVersionIndex:
+    """
+    Index of the versions of the mainline kernel PPA by series, e.g. "5.4",
+    as used by kernel.org's support status.
+
+    `versions` are sorted newest first. Each series knows its versions, its
+    latest release and whether it only has release candidates so far.
+    """
+
+    def __init__(self, versions, _kernels=None):
+        if _kernels is None:
+            _kernels = sorted((KernelVersion(version) for version in versions), key=lambda x: x.key, reverse=True)
+        self._kernels = _kernels
+        self.versions = [kernel.version for kernel in _kernels]
+        self._series = {}
+        self._latest_release = {}
+        for kernel in _kernels:
+            series = self.series_of(kernel)
+            self._series.setdefault(series, []).append(kernel)
+            if not kernel.is_rc and series not in self._latest_release:
+                self._latest_release[series] = kernel.version
+        # Newest first, like `versions`
+        self.series = list(self._series)
+
+    @classmethod
+    def of(cls, versions):
+        """ Returns the index of `versions`, reusing the last one built if they did not change """
+        global _last
+        key = tuple(versions)
+        if _last[0] != key:
+            _last = (key, cls(versions))
+        return _last[1]
+
+    @staticmethod
+    def series_of(kernel):
+        """ Returns the series of KernelVersion `kernel`, e.g. "5.4" """
+        return f"{kernel.key[0]}.{kernel.key[1]}"
+
+    def versions_in(self, series):
+        """ Returns the versions of `series`, newest first """
+        return [kernel.version for kernel in self._series.get(series, [])]
+
+    def latest(self, series=None):
+        """ Returns the newest version of `series`, or of all, including release candidates """
+        kernels = self._series.get(series, []) if series else self._kernels
+        return kernels[0].version if kernels else None
+
+    def latest_release(self, series):
+        """ Returns the newest version of `series` that is not a release candidate """
+        return self._latest_release.get(series)
+
+    def newest_release_series(self):
+        """ Returns the newest series with a released version """
+        return next((series for series in self.series if series in self._latest_release), None)
+
+    def is_rc_only(self, series):
+        """ Whether `series` only has release candidates so far """
+        return series in self._series and series not in self._latest_release
+
+    def rc_only_series(self):
+        return [series for series in self.series if series not in self._latest_release]
+
+    def filter(self, supported_series=None, filter_eol=True, filter_rc=True, filter_longterm=True):
+        """
+        Returns the index of the versions in the series and of the kinds asked
+        for, see `MainlineKernels.get_available_versions()`.
+
+        With `filter_eol`, only series in `supported_series`, kernel.org's
+        support status, are included, with `filter_longterm` not the
+        longterm ones among them. Release candidates are only included from
+        series without a release and if `filter_rc` is not set.
+        """
+        kernels = []
+        for series in self.series:
+            if filter_eol and (series not in supported_series or
+                               (filter_longterm and supported_series[series] == "longterm")):
+                continue
+            if self.is_rc_only(series):
+                if not filter_rc:
+                    kernels.extend(self._series[series])
+            else:
+                kernels.extend(kernel for kernel in self._series[series] if not kernel.is_rc)
+        # Already sorted
+        return MainlineVersionIndex(None, kernels)
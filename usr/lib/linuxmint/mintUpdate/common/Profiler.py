@@ -0,0 +1,130 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Set to enable profiling, set to a directory to also get cProfile dumps there
+PROFILE_ENV = "MINTUPDATE_PROFILE"
+
+# Audit events raised when a process spawns another one
+SUBPROCESS_EVENTS = ("subprocess.Popen", "os.system", "os.posix_spawn", "os.spawn", "os.exec")
+
+class Profiler:
+    """
+    Opt-in collection of phase durations and counters for field reports.
+
+    Profiling is enabled by the MINTUPDATE_PROFILE environment variable or by
+    calling `enable()`, e.g. for a --profile command line option. Disabled,
+    `phase()` and `count()` cost next to nothing. Spawned subprocesses are
+    counted via an audit hook. `reset()` starts a new profiling run, the
+    cProfile dump covers the thread that called it.
+
+    Results are plain lists and dicts so they can be passed on in a "profile"
+    record and logged by the process that started the profiled one.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.dump_dir = None
+        self._lock = threading.Lock()
+        self._audit_hook_installed = False
+        self._cprofile = None
+        self.phases = []
+        self.counters = {}
+        value = os.environ.get(PROFILE_ENV)
+        if value:
+            self.enable(value if os.path.isdir(value) else None)
+
+    def enable(self, dump_dir=None):
+        """ Enables profiling, with cProfile dumps written to `dump_dir` if it is set """
+        self.enabled = True
+        if dump_dir:
+            self.dump_dir = dump_dir
+        if not self._audit_hook_installed:
+            # Audit hooks cannot be removed, so it checks `self.enabled` itself
+            sys.addaudithook(self._audit)
+            self._audit_hook_installed = True
+
+    def disable(self):
+        self.enabled = False
+        if self._cprofile:
+            self._cprofile.disable()
+            self._cprofile = None
+
+    def reset(self):
+        """ Discards the results so far and starts a new run, e.g. for another refresh """
+        with self._lock:
+            self.phases = []
+            self.counters = {}
+        if self.enabled and self.dump_dir:
+            if self._cprofile:
+                self._cprofile.disable()
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def _audit(self, event, _args):
+        if self.enabled and event in SUBPROCESS_EVENTS:
+            self.count("subprocesses")
+
+    @contextmanager
+    def phase(self, name, detail=None):
+        """ Context manager recording the duration of the enclosed block as phase `name` """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, detail)
+
+    def add(self, name, duration, detail=None):
+        """ Records a phase that took `duration` seconds """
+        if self.enabled:
+            with self._lock:
+                self.phases.append([name, duration, detail])
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def results(self, process):
+        """ Returns the results so far as keyword arguments of a "profile" record """
+        with self._lock:
+            return {"process": process, "phases": list(self.phases), "counters": dict(self.counters)}
+
+    def dump(self, name):
+        """ Writes the cProfile dump if there is one, returns its path """
+        if not self._cprofile:
+            return None
+        self._cprofile.disable()
+        path = os.path.join(self.dump_dir, f"{name}-{os.getpid()}.prof")
+        try:
+            self._cprofile.dump_stats(path)
+        except OSError:
+            path = None
+        self._cprofile = None
+        return path
+
+def format_results(results):
+    """ Returns the lines describing the `results()` of a Profiler """
+    process = results["process"]
+    lines = []
+    for name, duration, detail in results["phases"]:
+        if detail:
+            lines.append(f"Profile {process}: {name} ({detail}): {duration * 1000:.1f} ms")
+        else:
+            lines.append(f"Profile {process}: {name}: {duration * 1000:.1f} ms")
+    for name, value in sorted(results["counters"].items()):
+        lines.append(f"Profile {process}: {name}: {value}")
+    return lines
+
+def log_results(logger, results):
+    """ Writes the `results()` of a Profiler to `logger` """
+    for line in format_results(results):
+        logger.write(line)
+
+profiler = Profiler()
@@ -1,4 +1,6 @@
 import os
+import stat
+import tempfile
 
 from common import settings
 
@@ -33,12 +35,36 @@ class Origin:
 
 
 ### FILES ###
+def get_runtime_dir():
+    """ Returns the user's runtime directory, a private directory in the temp dir if there is none """
+    for runtime_dir in (os.environ.get("XDG_RUNTIME_DIR"), os.path.join("/run/user/", str(os.getuid()))):
+        if runtime_dir and os.path.isdir(runtime_dir):
+            return runtime_dir
+    # Taken by another user or not private, try the next one
+    for attempt in range(100):
+        runtime_dir = os.path.join(tempfile.gettempdir(), f"mintupdate-{os.getuid()}" + (f"-{attempt}" if attempt else ""))
+        try:
+            os.mkdir(runtime_dir, 0o700)
+        except FileExistsError:
+            pass
+        info = os.lstat(runtime_dir)
+        if stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and not info.st_mode & 0o077:
+            return runtime_dir
+    raise OSError(f"No private runtime directory available in {tempfile.gettempdir()}")
+
 ROOT_FUNCTIONS = "/usr/lib/linuxmint/mintUpdate/root_functions.py"
+CHECK_APT = "/usr/lib/linuxmint/mintUpdate/checkAPT.py"
 NAMED_PIPE = os.path.join("/run/user/", str(os.getuid()), "mintupdate.fifo")
+CHECK_APT_SOCKET = os.path.join(get_runtime_dir(), "mintupdate-check.socket")
+# Held by the running checkAPT service
+CHECK_APT_LOCK = f"{CHECK_APT_SOCKET}.lock"
 AUTOMATIC_UPGRADES_CONFFILE = "/etc/mintupdate-automatic-upgrades.conf"
 AUTOMATIC_UPGRADES_LOGFILE = "/var/log/mintupdate.log"
 REBOOT_REQUIRED_FILE = "/run/reboot-required"
 UPDATE_FAILED_FILE = "/var/cache/mintupdate/automatic-upgrades-failed"
+UPDATES_SNAPSHOT_FILE = "/var/cache/mintupdate/updates-snapshot"
+CACHE_DIR = "/var/cache/mintupdate"
+USER_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "mintupdate")
 
 # List of variables to pass through pkexec
 PKEXEC_ENV = [f"HOME={os.environ.get('HOME')}",
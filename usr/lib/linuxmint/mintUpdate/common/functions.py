@@ -1,12 +1,16 @@
+import itertools
 import json
 import os
+import socket
+import stat
 import subprocess
 import time
 import traceback
 from datetime import datetime
 
 from common import settings
-from common.constants import SUPPORTED_KERNEL_TYPES
+from common.constants import CHECK_APT, CHECK_APT_SOCKET, SUPPORTED_KERNEL_TYPES
+from common.records import read_records
 
 
 def read_file(path):
@@ -19,6 +23,20 @@ def read_file(path):
             pass
     return [""]
 
+def is_private_dir(path, uid):
+    """ Returns True if `path` is a directory, not a link, owned by `uid` or root that no one else can write to """
+    try:
+        info = os.lstat(os.path.normpath(path))
+    except OSError:
+        return False
+    return stat.S_ISDIR(info.st_mode) and info.st_uid in (uid, 0) and not info.st_mode & 0o022
+
+def make_private_dir(path):
+    """ Creates directory `path` only the current user can write to, raises OSError if it exists but is not private """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not is_private_dir(path, os.getuid()):
+        raise OSError(f"{path} is not private")
+
 def get_release_dates():
     """ Get distro release dates for support duration calculation """
     release_dates = {}
@@ -78,3 +96,88 @@ def dpkg_locked():
         return True
     except subprocess.CalledProcessError:
         return False
+
+def connect_check_service(mainline=None, profile=False, timeout=600):
+    """
+    Requests an update check from the checkAPT service and returns a binary
+    stream of the resulting records, or `None` if the service is not running.
+    `mainline` enables or disables mainline kernel updates, `None` leaves it
+    to the settings. With `profile` set, the records end with a "profile"
+    record.
+    """
+    command = ["check"]
+    if mainline is not None:
+        command.append("mainline" if mainline else "nomainline")
+    if profile:
+        command.append("profile")
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(timeout)
+        client.connect(CHECK_APT_SOCKET)
+        client.sendall(f"{' '.join(command)}\n".encode("utf-8"))
+        return client.makefile("rb")
+    except OSError:
+        return None
+    finally:
+        # The stream keeps the connection open until it is closed
+        client.close()
+
+def check_service_running():
+    """ Returns whether the checkAPT service accepts connections """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(CHECK_APT_SOCKET)
+        return True
+    except OSError:
+        return False
+    finally:
+        client.close()
+
+def start_check_service(timeout=10):
+    """
+    Starts the checkAPT service unless it is running and waits up to `timeout`
+    seconds for it to accept connections. Of services started at the same
+    time, only one stays, see `APTCheckService`.
+    """
+    if check_service_running():
+        return True
+    subprocess.Popen([CHECK_APT, "--service"], stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check_service_running():
+            return True
+        time.sleep(0.05)
+    return False
+
+def get_check_records(profile=False):
+    """
+    Yields the records of an update check, via the checkAPT service where
+    possible, by running checkAPT.py directly otherwise. With `profile` set,
+    the records end with a "profile" record.
+    """
+    process = None
+    stream = None
+    for attempt in range(2):
+        stream = connect_check_service(profile=profile)
+        if stream:
+            records = read_records(stream)
+            # An outdated service closes the connection without a header
+            header = next(records, None)
+            if header:
+                records = itertools.chain((header,), records)
+                break
+            stream.close()
+            stream = None
+        if attempt or not start_check_service():
+            break
+    if not stream:
+        process = subprocess.Popen([CHECK_APT, "--profile"] if profile else CHECK_APT, stdout=subprocess.PIPE)
+        stream = process.stdout
+        records = read_records(stream)
+    try:
+        yield from records
+    finally:
+        stream.close()
+        if process:
+            process.wait()
@@ -0,0 +1,39 @@
+""" Record stream used by checkAPT.py and checkKernels.py to report their results
+
+A stream is a sequence of UTF-8 encoded JSON objects, one per line. Every
+record has a "type" key, the first record of a stream is a header carrying
+the stream version. Readers skip record types they do not know about.
+"""
+
+import json
+
+RECORDS_VERSION = 1
+
+class RecordStreamError(Exception):
+    pass
+
+def write_header(output):
+    """ Writes the stream header to the binary stream `output` """
+    write_record(output, "header", version=RECORDS_VERSION)
+
+def write_record(output, record_type, **data):
+    """ Writes a single record to the binary stream `output` and flushes it """
+    data["type"] = record_type
+    output.write(json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n")
+    output.flush()
+
+def read_records(stream):
+    """
+    Yields records from the binary stream `stream` as they arrive, including
+    the header. Lines that aren't records, e.g. diagnostic messages, are skipped.
+    """
+    for line in stream:
+        if not line.startswith(b"{"):
+            continue
+        try:
+            record = json.loads(line.decode("utf-8"))
+        except ValueError:
+            continue
+        if record.get("type") == "header" and record.get("version") != RECORDS_VERSION:
+            raise RecordStreamError(f"Unsupported record stream version {record.get('version')}")
+        yield record
@@ -88,8 +88,9 @@ class Preferences:
         self.initialize_widget("mainline-include-longterm")
         self.initialize_widget("allow-kernel-type-selection")
         self.on_use_mainline_toggle(use_mainline_kernels_widget)
-        # This one we don't need in the stand-alone version
+        # These we don't need in the stand-alone version
         self.builder.get_object("mainline-upgrade-eol-series").hide()
+        self.builder.get_object("mainline-prefetch").hide()
         # Show preferences on the stack
         self.kernel_window.main_stack.set_visible_child_name("page_kernels")
 
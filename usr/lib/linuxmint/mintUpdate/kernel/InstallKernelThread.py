@@ -12,6 +12,7 @@ from gi.repository import Gtk, Gdk, GLib
 from common import settings
 from common.constants import (KERNEL_PKG_NAMES, PKEXEC_ENV, ROOT_FUNCTIONS,
                               SUPPORTED_KERNEL_TYPES, Origin)
+from common.KernelIndex import KernelIndex
 from common.MainlineKernelInstaller import MainlineKernelInstaller
 
 
@@ -23,6 +24,7 @@ class InstallKernelThread(threading.Thread):
         self.application = application
         self.kernel_window = kernel_window
         self.cache = None
+        self.kernel_index = None
 
     def __del__(self):
         self.cache = None
@@ -112,7 +114,9 @@ class InstallKernelThread(threading.Thread):
                             last_in_series = False
                     if last_in_series:
                         meta_names = []
-                        _metas = [s for s in self.cache.keys() if s.startswith("linux" + kernel.type)]
+                        if not self.kernel_index:
+                            self.kernel_index = KernelIndex(self.cache.keys())
+                        _metas = self.kernel_index.get_meta_names(kernel.type)
                         if kernel.type == "-generic":
                             _metas.append("linux-virtual")
                         elif kernel.type == "-liquorix":
@@ -97,7 +97,8 @@ class KernelRow(Gtk.ListBoxRow):
         if kernel.origin == Origin.UBUNTU:
             self.add_button(CHANGELOG,
                             source=f"linux-image-{kernel.version}{kernel.type}",
-                            name=f"linux {kernel.version} (Ubuntu)")
+                            name=f"linux {kernel.version} (Ubuntu)",
+                            version=kernel.pkg_version)
             self.add_label(f"<a href='https://launchpad.net/ubuntu/+source/linux/+bugs?field.searchtext={kernel.version}'>{BUG_REPORTS}</a>")
             self.add_label(f"<a href='https://people.canonical.com/~ubuntu-security/cve/pkg/linux.html'>{CVE_TRACKER}</a>")
         # Mainline kernels (Ubuntu's builds)
@@ -119,7 +120,8 @@ class KernelRow(Gtk.ListBoxRow):
         elif kernel.type == "-liquorix":
             self.add_button(CHANGELOG,
                             source=f"linux-image-{kernel.version}-liquorix-amd64",
-                            name=f"linux {kernel.version} (Liquorix)")
+                            name=f"linux {kernel.version} (Liquorix)",
+                            version=kernel.pkg_version)
             self.add_label(f"<a href='https://github.com/damentz/liquorix-package/issues'>{BUG_REPORTS}</a>")
             self.add_label(f"<a href='https://nvd.nist.gov/vuln/search/results?query=linux+kernel'>{CVE_TRACKER}</a>")
         # Valve's experimental mftutex kernels
@@ -127,7 +129,8 @@ class KernelRow(Gtk.ListBoxRow):
             self.add_label(WARNING)
             self.add_button(CHANGELOG,
                             source=f"linux-image-{kernel.version}{kernel.type}",
-                            name=f"linux {kernel.version} (Ubuntu)")
+                            name=f"linux {kernel.version} (Ubuntu)",
+                            version=kernel.pkg_version)
             self.add_label(f"<a href='https://launchpad.net/ubuntu/+source/linux/+bugs?field.searchtext={kernel.version}'>{BUG_REPORTS}</a>")
             self.add_label(f"<a href='https://people.canonical.com/~ubuntu-security/cve/pkg/linux.html'>{CVE_TRACKER}</a>")
 
@@ -160,21 +163,22 @@ class KernelRow(Gtk.ListBoxRow):
         label.set_markup(markup)
         self.box.pack_start(label, False, False, 2)
 
-    def add_button(self, label, source, name="", callback=None):
+    def add_button(self, label, source, name="", callback=None, version=""):
         """ Adds a button to self.button_box_left """
         if not callback:
             callback = self.show_changelog
         button = Gtk.Button.new()
         button.set_label(label)
-        button.connect("clicked", callback, source, name)
+        button.connect("clicked", callback, source, name, version)
         self.button_box_left.add(button)
 
-    def show_changelog(self, widget, source, name):
+    def show_changelog(self, widget, source, name, version):
         ChangelogWindow(source=source,
                         name=name,
                         transient_for=self.kernel_window.window,
                         widget=widget,
-                        modal=True)
+                        modal=True,
+                        version=version)
 
     def show_hide_children(self, _widget):
         if self.revealer.get_child_revealed():
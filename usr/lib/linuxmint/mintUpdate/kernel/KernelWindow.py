@@ -18,6 +18,8 @@ from common.dialogs import show_confirmation_dialog, show_dpkg_lock_msg
 from common.functions import (configured_kernel_type, dpkg_locked,
                               get_release_dates, read_file)
 from common.MainlineKernels import MAINLINE_KERNEL_DATA, MainlineKernels
+from common.Profiler import log_results, profiler
+from common.records import read_records
 from kernel.InstallKernelThread import InstallKernelThread
 from kernel.KernelData import KernelData
 from kernel.KernelRow import KernelRow
@@ -177,13 +179,18 @@ class KernelWindow:
         self.remove_kernels_listbox.clear()
         for child in self.stack.get_children():
             child.destroy()
-        self.kernel_list = ""
+        self.kernel_list = []
+        profiler.reset()
         thread = threading.Thread(target=self.do_refresh_kernels_list)
         thread.start()
         while thread.is_alive():
             Gtk.main_iteration()
         try:
-            self.build_kernels_list(self.kernel_list)
+            with profiler.phase("kernel list build"):
+                self.build_kernels_list(self.kernel_list)
+            if profiler.enabled:
+                log_results(self.application.logger, profiler.results("kernel-manager"))
+                profiler.dump("kernel-manager-refresh")
             del self.kernel_list
             self.stack.show_all()
             self.window.get_window().set_cursor(None)
@@ -195,14 +202,22 @@ class KernelWindow:
             pass
 
     def do_refresh_kernels_list(self):
-        self.kernel_list = subprocess.run(["/usr/lib/linuxmint/mintUpdate/checkKernels.py",
-            self.current_kernel_type], stdout=subprocess.PIPE, encoding="utf-8").stdout
-
-    def build_kernels_list(self, lines):
+        command = ["/usr/lib/linuxmint/mintUpdate/checkKernels.py", self.current_kernel_type]
+        if profiler.enabled:
+            command.append("--profile")
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        with process.stdout:
+            for record in read_records(process.stdout):
+                if record["type"] == "kernel":
+                    self.kernel_list.append(record)
+                elif record["type"] == "profile":
+                    log_results(self.application.logger, record)
+        process.wait()
+
+    def build_kernels_list(self, records):
         now = datetime.now()
         hwe_support_duration = {}
-        lines = lines.split("\n")
-        lines.sort()
+        records.sort(key=lambda record: (".".join(record["version_id"]), record["version"], record["pkg_version"]))
         kernel_list = []
         pages_needed = []
         pages_needed_sort = []
@@ -212,52 +227,51 @@ class KernelWindow:
             self.reboot_menu_button.set_visible(False)
         current_kernel = None
         self.allow_kernel_type_selection = False
-        for line in lines:
+        for record in records:
             kernel_data = KernelData()
-            values = line.split('###')
-            if len(values) == 10:
-                (version_id, kernel_data.version, kernel_data.pkg_version,
-                 installed, used, origin, archive, support_duration,
-                 kernel_data.type) = values[1:]
-                kernel_data.version_id = version_id.split(".")
-                installed = int(installed)
-                # installed is:
-                # 0 if not installed
-                # 1 if manually installed
-                # 2 if automatically installed
-                kernel_data.installed = installed > 0
-                kernel_data.is_auto_installed = installed == 2
-                kernel_data.used = (used == "1")
-                kernel_data.origin = int(origin)
-                if kernel_data.used:
-                    kernel_data.suffix = _("Active")
-                    # ACTIVE_KERNEL_VERSION is used by the MarkKernelRow class
-                    current_kernel = kernel_data.version_id
-                elif kernel_data.installed:
-                    kernel_data.suffix = _("Installed")
-                elif kernel_data.origin == Origin.UBUNTU and "-proposed" in archive:
-                    kernel_data.suffix = _("(Pre-release)")
-                elif kernel_data.origin == Origin.MAINLINE_PPA:
-                    kernel_data.suffix = _("(Mainline)")
-                if kernel_data.type == self.current_kernel_type:
-                    kernel_data.name = kernel_data.version
-                else:
-                    kernel_data.name = kernel_data.version + kernel_data.type
-                    self.allow_kernel_type_selection = True
-                kernel_data.series = ".".join(kernel_data.name.replace("-",".").split(".")[:2])
-                kernel_data.release = archive.split("-", 1)[0]
-                kernel_data.support_duration = int(support_duration)
-                if kernel_data.support_duration and kernel_data.origin == Origin.UBUNTU:
-                    if not kernel_data.release in hwe_support_duration:
-                        hwe_support_duration[kernel_data.release] = []
-                    if not [x for x in hwe_support_duration[kernel_data.release] if x[0] == kernel_data.series]:
-                        hwe_support_duration[kernel_data.release].append(
-                            [kernel_data.series, kernel_data.support_duration])
-
-                kernel_list.append(kernel_data)
-                if kernel_data.series not in pages_needed:
-                    pages_needed.append(kernel_data.series)
-                    pages_needed_sort.append([kernel_data.version_id, kernel_data.series])
+            kernel_data.version_id = record["version_id"]
+            kernel_data.version = record["version"]
+            kernel_data.pkg_version = record["pkg_version"]
+            kernel_data.type = record["kernel_type"]
+            installed = record["installed"]
+            archive = record["archive"]
+            # installed is:
+            # 0 if not installed
+            # 1 if manually installed
+            # 2 if automatically installed
+            kernel_data.installed = installed > 0
+            kernel_data.is_auto_installed = installed == 2
+            kernel_data.used = record["used"] == 1
+            kernel_data.origin = record["origin"]
+            if kernel_data.used:
+                kernel_data.suffix = _("Active")
+                # ACTIVE_KERNEL_VERSION is used by the MarkKernelRow class
+                current_kernel = kernel_data.version_id
+            elif kernel_data.installed:
+                kernel_data.suffix = _("Installed")
+            elif kernel_data.origin == Origin.UBUNTU and "-proposed" in archive:
+                kernel_data.suffix = _("(Pre-release)")
+            elif kernel_data.origin == Origin.MAINLINE_PPA:
+                kernel_data.suffix = _("(Mainline)")
+            if kernel_data.type == self.current_kernel_type:
+                kernel_data.name = kernel_data.version
+            else:
+                kernel_data.name = kernel_data.version + kernel_data.type
+                self.allow_kernel_type_selection = True
+            kernel_data.series = ".".join(kernel_data.name.replace("-",".").split(".")[:2])
+            kernel_data.release = archive.split("-", 1)[0]
+            kernel_data.support_duration = record["support_duration"]
+            if kernel_data.support_duration and kernel_data.origin == Origin.UBUNTU:
+                if not kernel_data.release in hwe_support_duration:
+                    hwe_support_duration[kernel_data.release] = []
+                if not [x for x in hwe_support_duration[kernel_data.release] if x[0] == kernel_data.series]:
+                    hwe_support_duration[kernel_data.release].append(
+                        [kernel_data.series, kernel_data.support_duration])
+
+            kernel_list.append(kernel_data)
+            if kernel_data.series not in pages_needed:
+                pages_needed.append(kernel_data.series)
+                pages_needed_sort.append([kernel_data.version_id, kernel_data.series])
 
         # get kernel support duration
         kernel_support_info = {}
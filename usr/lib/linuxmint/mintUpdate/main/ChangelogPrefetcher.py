@@ -0,0 +1,74 @@
+import queue
+import threading
+import time
+
+from mintcommon import apt_changelog
+
+from main.ChangelogRetriever import retrieve_changelog
+
+# Changelogs retrieved at the same time
+PREFETCH_WORKERS = 3
+# Changelog retrievals started per second at most
+PREFETCH_RATE = 4
+# Order in which changelogs are prefetched by update type, others follow
+PREFETCH_ORDER = ("security", "kernel")
+
+class ChangelogPrefetcher(threading.Thread):
+    """
+    Retrieves the changelogs of the listed updates in the background, so
+    showing them does not wait for the network. Security and kernel updates
+    go first. At most `PREFETCH_WORKERS` retrievals run at the same time and
+    at most `PREFETCH_RATE` start per second.
+
+    Retrieved changelogs are stored in the ChangelogCache and set on the
+    updates. `cancel()` stops the prefetcher, e.g. for a new refresh.
+    """
+
+    def __init__(self, updates):
+        threading.Thread.__init__(self, daemon=True)
+        self.updates = sorted(updates, key=lambda update: PREFETCH_ORDER.index(update.type)
+                              if update.type in PREFETCH_ORDER else len(PREFETCH_ORDER))
+        self.canceled = threading.Event()
+        self._lock = threading.Lock()
+        self._next_start = 0
+
+    def cancel(self):
+        self.canceled.set()
+
+    def run(self):
+        jobs = queue.Queue()
+        for update in self.updates:
+            jobs.put(update)
+        threads = [threading.Thread(target=self._worker, args=(jobs,), daemon=True)
+                   for _i in range(min(PREFETCH_WORKERS, len(self.updates)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _wait_turn(self):
+        """ Waits until the next retrieval may start, returns `False` if canceled """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + 1 / PREFETCH_RATE
+        return not self.canceled.wait(start - now)
+
+    def _worker(self, jobs):
+        _apt_changelog = apt_changelog.AptChangelog()
+        while not self.canceled.is_set():
+            try:
+                update = jobs.get_nowait()
+            except queue.Empty:
+                return
+            # Retrieved on demand already or nothing to retrieve
+            if update.changelog or not update.package_names[0]:
+                continue
+            if not self._wait_turn():
+                return
+            try:
+                changelog = retrieve_changelog(update, _apt_changelog)
+            except Exception:
+                continue
+            if changelog and not update.changelog and not self.canceled.is_set():
+                update.changelog = changelog
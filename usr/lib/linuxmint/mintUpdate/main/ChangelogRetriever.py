@@ -0,0 +1,117 @@
+import itertools
+import queue
+import threading
+
+import gi
+gi.require_version('Gdk', '3.0')
+from gi.repository import Gdk, GLib, GObject
+
+from mintcommon import apt_changelog
+
+from common.ChangelogCache import changelog_cache
+from common.KernelVersion import KernelVersion
+from common.MainlineKernels import MAINLINE_KERNEL_DATA
+
+# Changelogs of selected updates retrieved at the same time
+CHANGELOG_WORKERS = 2
+
+
+def retrieve_changelog(package_update, _apt_changelog):
+    """
+    Returns the changelog of `package_update` from the ChangelogCache, or
+    retrieves it with AptChangelog `_apt_changelog` or from the mainline
+    kernel PPA. Returns `None` if there is none.
+    """
+    if package_update.origin == "ubuntu" and package_update.archive.startswith("mainline-"):
+        def get():
+            r = apt_changelog.requests.get(changelog_url, timeout=5)
+            return r.text if r.ok else None
+
+        try:
+            mainline_branch_id = int(package_update.archive.split("-")[-1])
+            kernel = KernelVersion(package_update.new_version)
+            changelog_url = MAINLINE_KERNEL_DATA[mainline_branch_id].changelog_url(kernel.version)
+            return changelog_cache.retrieve(changelog_url, get)
+        except:
+            return None
+    return changelog_cache.retrieve(package_update.changelog_key(),
+                                    lambda: _apt_changelog.get_changelog(package_update.package_names[0]))
+
+class ChangelogRetriever:
+    """
+    Retrieves the changelogs of the updates selected in the main window with
+    a fixed number of worker threads, each with its own AptChangelog.
+
+    The most recent request goes first. Requests still queued when another
+    one is made are dropped, so moving quickly through the list only
+    retrieves the changelogs of the rows the selection stops at. A request
+    for an update whose changelog is being retrieved already is merged into
+    the running one.
+
+    `callback(package_update)` is called in the main loop when the
+    changelog of a request that is still current has been set on the
+    update. It is not called for dropped requests.
+    """
+
+    def __init__(self, workers=CHANGELOG_WORKERS):
+        self.workers = workers
+        self.threads = []
+        self.queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        # Callbacks of the requests being queued or retrieved, by update
+        self._requests = {}
+
+    def request(self, package_update, callback):
+        """ Retrieves the changelog of `package_update` before those of all earlier requests """
+        with self._lock:
+            # Earlier requests are stale now
+            for update in self._requests:
+                self._requests[update] = None
+            merged = package_update in self._requests
+            self._requests[package_update] = callback
+            if not merged:
+                # Newest first
+                self.queue.put((-next(self._counter), package_update))
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._worker, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+        if merged:
+            GObject.Value.unset(package_update)
+
+    def cancel(self):
+        """ Drops all queued requests and the callbacks of the running ones """
+        with self._lock:
+            for update in self._requests:
+                self._requests[update] = None
+
+    def _worker(self):
+        _apt_changelog = apt_changelog.AptChangelog()
+        while True:
+            _priority, package_update = self.queue.get()
+            with self._lock:
+                dropped = not self._requests[package_update]
+                if dropped:
+                    del self._requests[package_update]
+            if dropped:
+                GObject.Value.unset(package_update)
+                continue
+            try:
+                if not package_update.changelog and package_update.package_names[0]:
+                    package_update.changelog = retrieve_changelog(package_update, _apt_changelog)
+            except:
+                pass
+            if not package_update.changelog:
+                package_update.changelog = _("No changelog available")
+            with self._lock:
+                callback = self._requests.pop(package_update)
+            if callback:
+                Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self._done, callback, package_update)
+            else:
+                GObject.Value.unset(package_update)
+
+    @staticmethod
+    def _done(callback, package_update):
+        callback(package_update)
+        GObject.Value.unset(package_update)
@@ -115,7 +115,11 @@ class HistoryWindow:
         if event.button == 3: # right click
             path = widget.get_path_at_pos(int(event.x), int(event.y))[0]
             package_name = model[path][COL_PACKAGE]
-            ChangelogWindow(source=package_name)
+            old_version = model[path][COL_OLD_VERSION]
+            # Installed rather than upgraded
+            if old_version == "<none>":
+                old_version = ""
+            ChangelogWindow(source=package_name, version=model[path][COL_NEW_VERSION], old_version=old_version)
 
     def on_key_press_event(self, _widget, event):
         """ Ctrl+c handler """
@@ -159,6 +159,9 @@ class InstallThread(threading.Thread):
 
                     # Mainline kernel updates (this should only ever be a single one):
                     if mainline_updates:
+                        # Continue a running prefetch at full speed instead
+                        if self.application.mainline_prefetch:
+                            self.application.mainline_prefetch.cancel()
                         for mainline_branch_id in mainline_updates:
                             mainline = MainlineKernelInstaller(branch_id=mainline_branch_id,
                                                                transient_for=self.application.window)
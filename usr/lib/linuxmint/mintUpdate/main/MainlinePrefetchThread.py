@@ -0,0 +1,40 @@
+import threading
+
+from common.MainlineKernels import MainlineKernels
+
+
+class MainlinePrefetchThread(threading.Thread):
+    """
+    Downloads the packages of a mainline kernel update found by a refresh in
+    the background, so installing it does not have to wait for them
+    """
+
+    def __init__(self, application, package_update):
+        threading.Thread.__init__(self, daemon=True)
+        self.application = application
+        self.pkg = package_update
+        self.mainline = MainlineKernels(branch_id=int(package_update.archive.split("-")[-1]))
+        self.canceled = False
+
+    def cancel(self):
+        self.canceled = True
+        downloader = self.mainline.downloader
+        if downloader:
+            downloader.cancel()
+
+    def run(self):
+        version = self.pkg.new_version
+        try:
+            if self.mainline.is_staged(version, self.pkg.package_names):
+                return
+            self.application.logger.write(f"Prefetching mainline kernel {version}")
+            self.mainline.prefetch(version, self.pkg.package_names, self._progress)
+            self.application.logger.write(f"Mainline kernel {version} prefetched")
+        except (MainlineKernels.MainlineKernelsException, OSError) as e:
+            if not self.canceled:
+                self.application.logger.write_error(f"Prefetching mainline kernel {version} failed: {e}")
+
+    def _progress(self, _received, _total):
+        if self.canceled and self.mainline.downloader:
+            # Canceled before the downloads started
+            self.mainline.downloader.cancel()
@@ -15,6 +15,7 @@ from mintcommon import apt_changelog
 from mintcommon.localization import localized_ui
 
 from common import settings
+from common.ChangelogView import ChangelogView
 from common.constants import PKEXEC_ENV, ROOT_FUNCTIONS
 from common.dialogs import show_confirmation_dialog, show_dpkg_lock_msg
 from common.functions import dpkg_locked
@@ -22,7 +23,7 @@ from common.Logger import Logger
 from kernel.KernelWindow import KernelWindow
 from main.AutomaticRefreshThread import AutomaticRefreshThread
 from main.CacheWatcher import CacheWatcher
-from main.ChangelogRetrieverThread import ChangelogRetrieverThread
+from main.ChangelogRetriever import ChangelogRetriever
 from main.constants import (UPDATE_CHECKED, UPDATE_DISPLAY_NAME,
                             UPDATE_NEW_VERSION, UPDATE_OBJ, UPDATE_OLD_VERSION,
                             UPDATE_SIZE, UPDATE_SIZE_STR, UPDATE_SOURCE,
@@ -65,7 +66,9 @@ class MintUpdate:
         self.refresh_inhibited = False
         self.reboot_required = False
         self.refreshing = False
-        self.changelog_retriever_started = False
+        self.mainline_prefetch = None
+        self.changelog_prefetcher = None
+        self.changelog_retriever = ChangelogRetriever()
         self.logger = Logger("mintupdate")
         self.logger.write("Launching Update Manager")
 
@@ -103,7 +106,7 @@ class MintUpdate:
             self.notebook_details = self.builder.get_object("notebook_details")
             self.textview_packages = self.builder.get_object("textview_packages").get_buffer()
             self.textview_description = self.builder.get_object("textview_description").get_buffer()
-            self.textview_changes = self.builder.get_object("textview_changes").get_buffer()
+            self.changelog_view = ChangelogView(self.builder.get_object("textview_changes"))
             self.paned = self.builder.get_object("paned")
 
             # Updates page
@@ -727,7 +730,7 @@ class MintUpdate:
         try:
             self.textview_packages.set_text("")
             self.textview_description.set_text("")
-            self.textview_changes.set_text("")
+            self.changelog_view.show("")
             model, tree_iter = selection.get_selected()
             if tree_iter:
                 package_update = model.get_value(tree_iter, UPDATE_OBJ)
@@ -739,18 +742,27 @@ class MintUpdate:
             self.logger.write_error(f"Exception showing update details:\n{traceback.format_exc()}")
 
     def display_package_changelog(self, package_update):
-        if not hasattr(package_update, "retrieving_changelog"):
-            if package_update.changelog:
-                self.display_changelog(package_update.changelog)
-                GObject.Value.unset(package_update)
-            else:
-                self.display_changelog(_("Downloading changelog…"))
-                ChangelogRetrieverThread(package_update, self.treeview, self.display_changelog).start()
+        if package_update.changelog:
+            self.display_changelog(package_update.changelog, package_update)
+            GObject.Value.unset(package_update)
+        else:
+            self.display_changelog(_("Downloading changelog…"))
+            self.changelog_retriever.request(package_update, self.on_changelog_retrieved)
 
-    def display_changelog(self, changelog):
-        self.textview_changes.set_text(changelog)
-        while Gtk.events_pending():
-            Gtk.main_iteration()
+    def on_changelog_retrieved(self, package_update):
+        model, tree_iter = self.treeview.get_selection().get_selected()
+        if tree_iter:
+            selected_update = model.get_value(tree_iter, UPDATE_OBJ)
+            if selected_update == package_update and self.notebook_details.get_current_page() == 2:
+                self.display_changelog(package_update.changelog, package_update)
+            GObject.Value.unset(selected_update)
+
+    def display_changelog(self, changelog, package_update=None):
+        """ Shows `changelog`, only the changes of `package_update` if given """
+        if package_update:
+            self.changelog_view.show(changelog, package_update.old_version, package_update.new_version)
+        else:
+            self.changelog_view.show(changelog)
 
     def switch_page(self, _notebook, _page, page_num):
         model, tree_iter = self.treeview.get_selection().get_selected()
@@ -785,7 +797,7 @@ class MintUpdate:
         self.textview_packages.set_text(packages)
 
     def display_package_description(self, package_update):
-        self.textview_description.set_text(package_update.description.replace("\\n", "\n"))
+        self.textview_description.set_text(package_update.description)
 
     def treeview_right_clicked(self, widget, event):
         if event.button == 3:
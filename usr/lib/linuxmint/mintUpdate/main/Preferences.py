@@ -186,6 +186,7 @@ class Preferences:
         self.initialize_widget("mainline-include-rc")
         self.initialize_widget("mainline-include-longterm")
         self.initialize_widget("mainline-upgrade-eol-series", self.set_refresh_required)
+        self.initialize_widget("mainline-prefetch")
         self.initialize_widget("allow-kernel-type-selection")
         self.builder.get_object("mainline_options").set_visible(use_mainline_kernels_widget.get_active())
 
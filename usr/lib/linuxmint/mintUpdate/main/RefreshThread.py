@@ -8,13 +8,15 @@ gi.require_version('Gdk', '3.0')
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gdk, GLib, Gtk
 
-from mintcommon import apt_changelog
-
 from common import settings
+from common.ChangelogLoader import ChangelogLoader
 from common.constants import PRIORITY_UPDATES
-from common.functions import dpkg_locked
+from common.functions import dpkg_locked, get_check_records
+from common.Profiler import log_results, profiler
+from main.ChangelogPrefetcher import ChangelogPrefetcher
 from main.constants import DISTRO_INFO, UPDATE_OBJ, UPDATE_SORT_STR
 from main.functions import size_to_string
+from main.MainlinePrefetchThread import MainlinePrefetchThread
 from main.Update import Update
 
 
@@ -35,6 +37,11 @@ class RefreshThread(threading.Thread):
     def run(self):
         self.application.refreshing = True
         self.application.cache_watcher.pause()
+        # The changelogs of the previous list are no longer needed
+        self.application.changelog_retriever.cancel()
+        if self.application.changelog_prefetcher:
+            self.application.changelog_prefetcher.cancel()
+            self.application.changelog_prefetcher = None
 
         if self.application.refresh_inhibited:
             self.application.logger.write("Refresh temporarily inhibited")
@@ -46,6 +53,7 @@ class RefreshThread(threading.Thread):
                 time.sleep(60)
 
         try:
+            profiler.reset()
             if self.root_mode:
                 self.application.logger.write("Starting refresh (retrieving lists of updates from remote servers)")
             else:
@@ -62,116 +70,129 @@ class RefreshThread(threading.Thread):
                 refresh_command.append("--mintupdate")
                 if settings.get_boolean("update-mintinstall-pkgcache"):
                     refresh_command.append("--mintinstall")
-                subprocess.run(refresh_command)
+                with profiler.phase("cache refresh"):
+                    subprocess.run(refresh_command)
                 settings.set_int64("refresh-last-run", int(time.time()))
 
-            output = subprocess.run("/usr/lib/linuxmint/mintUpdate/checkAPT.py",
-                                    stdout=subprocess.PIPE).stdout.decode("ascii")
+            # Look at the updates one by one as they come in
+            model = Gtk.TreeStore(str, str, str, str, str, int, str, str, str, str, str, object)
+            #  Set pre-sort column (saved sort column will be restored afterwards)
+            model.set_sort_column_id(UPDATE_SORT_STR, Gtk.SortType.ASCENDING)
+            num_visible = 0
+            error = None
+            mainline_update = None
+            updates = []
+            check_start = time.perf_counter()
+            model_build_duration = 0
+            for record in get_check_records(profile=profiler.enabled):
+                if record["type"] == "error":
+                    error = record
+                    continue
+                if record["type"] == "profile":
+                    log_results(self.application.logger, record)
+                    continue
+                if record["type"] != "update":
+                    continue
+                model_build_start = time.perf_counter()
+                # Create update object
+                update = Update(package=None, record=record, source_name=None)
+
+                # Check if self-update is needed
+                if update.source_name in PRIORITY_UPDATES:
+                    self.is_self_update = True
+
+                shortdesc = update.short_description
+                if len(shortdesc) > 100:
+                    try:
+                        shortdesc = shortdesc[:100]
+                        # Remove the last word.. in case we chomped
+                        # a word containing an &#234; character..
+                        # if we ended up with &.. without the code and ; sign
+                        # pango would fail to set the markup
+                        words = shortdesc.split()
+                        shortdesc = " ".join(words[:-1]) + "…"
+                    except:
+                        pass
+
+                update_name = f"<b>{GLib.markup_escape_text(update.display_name)}</b>"
+                if settings.get_boolean("show-descriptions"):
+                    update_name += f"\n{GLib.markup_escape_text(shortdesc)}"
+
+                origin = update.origin
+                # Pretty-print some origins
+                if origin == "linuxmint":
+                    origin = "Linux Mint"
+                elif origin.startswith("LP-PPA-"):
+                    origin = origin.replace("LP-PPA-", "PPA: ", 1)
+
+                type_sort_key = 0
+                if update.type == "kernel":
+                    tooltip = _("Kernel update")
+                    type_sort_key = 2
+                elif update.type == "security":
+                    tooltip = _("Security update")
+                    type_sort_key = 1
+                elif update.type == "unstable":
+                    tooltip = _("Unstable software. Only apply this update to help developers beta-test new software.")
+                    type_sort_key = 5
+                else:
+                    if origin.lower() in ["ubuntu", "debian", "linux mint", "canonical"]:
+                        tooltip = _("Software update")
+                        type_sort_key = 3
+                    else:
+                        update.type = "3rd-party"
+                        tooltip = "%s\n%s" % (_("3rd-party update"), origin)
+                        type_sort_key = 4
 
-            # Check presence of Mint layer
-            if len(output) > 0 and not "CHECK_APT_ERROR" in output and not self.policy_check():
-                return False
+                if update.origin == "ubuntu" and update.archive.startswith("mainline-"):
+                    archive = '-'.join(update.archive.split('-')[:-1])
+                    mainline_update = update
+                else:
+                    archive = update.archive
+
+                # UPDATE_CHECKED, UPDATE_DISPLAY_NAME, UPDATE_OLD_VERSION, UPDATE_NEW_VERSION,
+                # UPDATE_SOURCE, UPDATE_SIZE, UPDATE_SIZE_STR,
+                # UPDATE_TYPE_PIX, UPDATE_TYPE, UPDATE_TOOLTIP,
+                # UPDATE_SORT_STR, UPDATE_OBJ
+                updates.append(update)
+                model.append(None, row=("true", update_name, update.old_version, update.new_version,
+                    f"{origin} / {archive}", update.size, size_to_string(update.size),
+                    f"mintupdate-type-{update.type}-symbolic", update.type, tooltip,
+                    f"{str(type_sort_key)}{update.display_name}", update))
+                model_build_duration += time.perf_counter() - model_build_start
+            profiler.add("update check", time.perf_counter() - check_start - model_build_duration)
+            profiler.add("model build", model_build_duration)
 
             # Return on error
-            if "CHECK_APT_ERROR" in output:
-                try:
-                    error_msg = output.split("Error: ")[1].replace("E:", "\n").strip()
-                    if "apt.cache.FetchFailedException" in output and " changed its " in error_msg:
-                        error_msg += "\n\n%s" % _("Run 'apt update' in a terminal window to address this")
-                except:
-                    error_msg = ""
+            if error:
+                error_msg = error["message"].replace("E:", "\n").strip()
+                if "apt.cache.FetchFailedException" in error["exception"] and " changed its " in error_msg:
+                    error_msg += "\n\n%s" % _("Run 'apt update' in a terminal window to address this")
                 self.application.logger.write_error("Error in checkAPT.py, could not refresh the list of updates")
                 Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self._GUI_show_error, error_msg)
                 return False
 
-            # Look at the updates one by one
-            model = Gtk.TreeStore(str, str, str, str, str, int, str, str, str, str, str, object)
-            #  Set pre-sort column (saved sort column will be restored afterwards)
-            model.set_sort_column_id(UPDATE_SORT_STR, Gtk.SortType.ASCENDING)
-            num_visible = 0
-            lines = output.split("---EOL---")
-            if len(lines):
-                for line in lines:
-                    if not "###" in line:
-                        continue
-
-                    # Create update object
-                    update = Update(package=None, input_string=line, source_name=None)
-
-                    # Check if self-update is needed
-                    if update.source_name in PRIORITY_UPDATES:
-                        self.is_self_update = True
-
-                    shortdesc = update.short_description
-                    if len(shortdesc) > 100:
-                        try:
-                            shortdesc = shortdesc[:100]
-                            # Remove the last word.. in case we chomped
-                            # a word containing an &#234; character..
-                            # if we ended up with &.. without the code and ; sign
-                            # pango would fail to set the markup
-                            words = shortdesc.split()
-                            shortdesc = " ".join(words[:-1]) + "…"
-                        except:
-                            pass
-
-                    update_name = f"<b>{GLib.markup_escape_text(update.display_name)}</b>"
-                    if settings.get_boolean("show-descriptions"):
-                        update_name += f"\n{GLib.markup_escape_text(shortdesc)}"
-
-                    origin = update.origin
-                    # Pretty-print some origins
-                    if origin == "linuxmint":
-                        origin = "Linux Mint"
-                    elif origin.startswith("LP-PPA-"):
-                        origin = origin.replace("LP-PPA-", "PPA: ", 1)
-
-                    type_sort_key = 0
-                    if update.type == "kernel":
-                        tooltip = _("Kernel update")
-                        type_sort_key = 2
-                    elif update.type == "security":
-                        tooltip = _("Security update")
-                        type_sort_key = 1
-                    elif update.type == "unstable":
-                        tooltip = _("Unstable software. Only apply this update to help developers beta-test new software.")
-                        type_sort_key = 5
-                    else:
-                        if origin.lower() in ["ubuntu", "debian", "linux mint", "canonical"]:
-                            tooltip = _("Software update")
-                            type_sort_key = 3
-                        else:
-                            update.type = "3rd-party"
-                            tooltip = "%s\n%s" % (_("3rd-party update"), origin)
-                            type_sort_key = 4
-
-                    if update.origin == "ubuntu" and update.archive.startswith("mainline-"):
-                        archive = '-'.join(update.archive.split('-')[:-1])
-                    else:
-                        archive = update.archive
-
-                    # UPDATE_CHECKED, UPDATE_DISPLAY_NAME, UPDATE_OLD_VERSION, UPDATE_NEW_VERSION,
-                    # UPDATE_SOURCE, UPDATE_SIZE, UPDATE_SIZE_STR,
-                    # UPDATE_TYPE_PIX, UPDATE_TYPE, UPDATE_TOOLTIP,
-                    # UPDATE_SORT_STR, UPDATE_OBJ
-                    model.append(None, row=("true", update_name, update.old_version, update.new_version,
-                        f"{origin} / {archive}", update.size, size_to_string(update.size),
-                        f"mintupdate-type-{update.type}-symbolic", update.type, tooltip,
-                        f"{str(type_sort_key)}{update.display_name}", update))
-
-                # Restore saved sort column
-                model.set_sort_column_id(settings.get_int("sort-column-id"),
-                                         settings.get_int("sort-order"))
-                Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self.application.treeview.set_model, model)
-                # We need to hide the notebook here again because the line above
-                # shows it for some reason
-                Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self.application.notebook_details.hide)
-
-                # Updates found, update status page and message
-                num_visible = len(model)
-                if num_visible:
-                    self.application.logger.write(f"Found {num_visible} software updates")
-                    Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self._GUI_show_updates, model, num_visible)
+            # Check presence of Mint layer
+            with profiler.phase("policy check"):
+                policy_ok = not len(model) or self.policy_check()
+            if not policy_ok:
+                return False
+
+            # Restore saved sort column
+            model.set_sort_column_id(settings.get_int("sort-column-id"),
+                                     settings.get_int("sort-order"))
+            Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self.application.treeview.set_model, model)
+            # We need to hide the notebook here again because the line above
+            # shows it for some reason
+            Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self.application.notebook_details.hide)
+
+            # Updates found, update status page and message
+            num_visible = len(model)
+            if num_visible:
+                self.application.logger.write(f"Found {num_visible} software updates")
+                Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self._GUI_show_updates, model, num_visible)
+                self.application.changelog_prefetcher = ChangelogPrefetcher(updates)
+                self.application.changelog_prefetcher.start()
 
             # Check for infobars to display
             thread = threading.Event()
@@ -180,7 +201,7 @@ class RefreshThread(threading.Thread):
             thread.wait()
 
             # All done, show status message
-            if not len(lines) or not num_visible:
+            if not num_visible:
                 if self.application.is_end_of_life:
                     NO_UPDATES_MSG = _("Your distribution has reached end of life and is no longer supported")
                     log_msg = "System is end of life, no updates available"
@@ -195,7 +216,14 @@ class RefreshThread(threading.Thread):
                     self._GUI_show_no_updates, NO_UPDATES_MSG, tray_icon, status_icon)
                 self.application.logger.write(log_msg)
 
+            # Have the packages of a mainline kernel update ready for its installation
+            if mainline_update and settings.get_boolean("mainline-prefetch"):
+                self.start_mainline_prefetch(mainline_update)
+
             self.application.logger.write("Refresh finished")
+            if profiler.enabled:
+                log_results(self.application.logger, profiler.results("mintupdate"))
+                profiler.dump("mintupdate-refresh")
 
         except:
             self.application.logger.write_error(
@@ -203,6 +231,13 @@ class RefreshThread(threading.Thread):
             Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT, self.application.set_status_icon,
                 "mintupdate-error", _("Could not refresh the list of updates"))
 
+    def start_mainline_prefetch(self, mainline_update):
+        prefetch = self.application.mainline_prefetch
+        if prefetch:
+            prefetch.cancel()
+        self.application.mainline_prefetch = MainlinePrefetchThread(self.application, mainline_update)
+        self.application.mainline_prefetch.start()
+
     def check_policy(self):
         """ Check the presence of the Mint layer """
         p = subprocess.run(['apt-cache', 'policy'], stdout=subprocess.PIPE,
@@ -274,30 +309,26 @@ class RefreshThread(threading.Thread):
             # pylint: disable=E1133, E1136
             textview.get_buffer().set_text(_("Retrieving changelog…") + "\n" + " " * 80)
             package_version = "".join(
-                [row[UPDATE_OBJ].source_packages[0] for row in model if row[UPDATE_OBJ].source_name == "mintupdate"])
+                [row[UPDATE_OBJ].changelog_key() for row in model if row[UPDATE_OBJ].source_name == "mintupdate"])
             if package_version:
                 package_name = "mintupdate"
             else:
                 package_name = model[0][UPDATE_OBJ].source_name
-                package_version = model[0][UPDATE_OBJ].source_packages[0]
-            changelog = ""
+                package_version = model[0][UPDATE_OBJ].changelog_key()
+            def show_changelog(changelog):
+                if not changelog:
+                    changelog = _("No changelog available")
+                if not self.application.window.get_visible():
+                    # Workaround for the automatic resizing of the changelog container not working correctly
+                    # while the app is hidden
+                    self.application.window.connect("show", self.application.show_self_update_changelog,
+                                                    CHANGELOG_HEIGHT, changelog)
+                else:
+                    self.application.show_self_update_changelog(None, CHANGELOG_HEIGHT, changelog)
             if package_name:
-                # Try to load application cached changelog, on error retrieve a new one
-                try:
-                    changelog = self.application.self_update_changelog[package_version]
-                except (AttributeError, KeyError):
-                    _apt_changelog = apt_changelog.AptChangelog()
-                    changelog = _apt_changelog.get_changelog(package_name)
-                    self.application.self_update_changelog = { package_version: changelog }
-            if not changelog:
-                changelog = _("No changelog available")
-            if not self.application.window.get_visible():
-                # Workaround for the automatic resizing of the changelog container not working correctly
-                # while the app is hidden
-                self.application.window.connect("show", self.application.show_self_update_changelog,
-                                                CHANGELOG_HEIGHT, changelog)
+                ChangelogLoader(package_name, package_version, finish=show_changelog).start()
             else:
-                self.application.show_self_update_changelog(None, CHANGELOG_HEIGHT, changelog)
+                show_changelog("")
 
         # Regular updates:
         else:
@@ -1,9 +1,12 @@
-import html
-
+# Attributes of an update which make up its record
+RECORD_FIELDS = ("display_name", "source_name", "real_source_name", "source_packages",
+                 "main_package_name", "package_names", "new_version", "old_version",
+                 "size", "installed_size", "installed_size_change", "type", "origin",
+                 "short_description", "description", "site", "archive")
 
 class Update:
 
-    def __init__(self, package=None, input_string=None, source_name=None):
+    def __init__(self, package=None, record=None, source_name=None):
         self.changelog = None
         self.package_names = []
         self.source_packages = set()
@@ -59,8 +62,8 @@ class Update:
                    self.real_source_name in ["linux", "linux-kernel", "linux-signed", "linux-meta"]:
                     self.type = "kernel"
         else:
-            # Build the class from the input_string
-            self.parse(input_string)
+            # Build the class from the record
+            self.from_record(record)
 
     def add_package(self, pkg):
         self.package_names.append(pkg.name)
@@ -80,29 +83,19 @@ class Update:
         self.short_description = pkg.candidate.summary
         self.main_package_name = pkg.name
 
-    def serialize(self):
-        output_string = u"###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s###%s---EOL---" % \
-        (self.display_name, self.source_name, self.real_source_name, ", ".join(self.source_packages),
-         self.main_package_name, ", ".join(self.package_names), self.new_version,
-         self.old_version, self.size, self.installed_size, self.installed_size_change,
-         self.type, self.origin, self.short_description, self.description, self.site, self.archive)
-        print(output_string.encode("ascii", "xmlcharrefreplace"))
+    def changelog_key(self):
+        """ Returns the "source=version" string the changelog of the update is cached under """
+        if not self.source_packages:
+            return None
+        prefix = f"{self.real_source_name}="
+        return next((x for x in self.source_packages if x.startswith(prefix)), min(self.source_packages))
+
+    def to_record(self):
+        """ Returns the update as a dict for use with `common.records.write_record()` """
+        record = {field: getattr(self, field) for field in RECORD_FIELDS}
+        record["source_packages"] = list(self.source_packages)
+        return record
 
-    def parse(self, input_string):
-        try:
-            parser = html.parser.HTMLParser()
-            input_string = html.unescape(input_string)
-            del parser
-        except:
-            pass
-        values = input_string.split("###")[1:]
-        (self.display_name, self.source_name, self.real_source_name, source_packages,
-         self.main_package_name, package_names, self.new_version,
-         self.old_version, self.size, self.installed_size, self.installed_size_change,
-         self.type, self.origin, self.short_description,
-         self.description, self.site, self.archive) = values
-        self.size = int(self.size)
-        self.installed_size = int(self.installed_size)
-        self.installed_size_change = int(self.installed_size_change)
-        self.package_names = package_names.split(", ")
-        self.source_packages = source_packages.split(", ")
+    def from_record(self, record):
+        for field in RECORD_FIELDS:
+            setattr(self, field, record[field])
@@ -1,33 +1,30 @@
 #!/usr/bin/python3
 
 import argparse
-import fnmatch
 import os
 import subprocess
 import sys
 import traceback
 
 from checkAPT import APTCheck
+from common.Blacklist import BLACKLIST_FILE, Blacklist
 from common.constants import (PRIORITY_UPDATES, REBOOT_REQUIRED_FILE,
                               ROOT_FUNCTIONS, UPDATE_FAILED_FILE)
-from common.functions import check_timeshift, read_file
+from common.functions import check_timeshift, connect_check_service
+from common.KernelVersion import KernelVersion
+from common.MainlineKernels import MAINLINE_KERNEL_DATA, PPA_URL, MainlineKernels
+from common.Profiler import format_results, profiler
+from common.records import read_records
+from main.Update import Update
 
 if __name__ == "__main__":
     failed = False
-    def is_blacklisted(blacklisted_packages, name, version):
-        for blacklist in blacklisted_packages:
-            if "=" in blacklist:
-                (bl_pkg, bl_ver) = blacklist.split("=", 1)
-            else:
-                bl_pkg = blacklist
-                bl_ver = None
-            if fnmatch.fnmatch(name, bl_pkg) and (not bl_ver or bl_ver == version):
-                return True
-        return False
 
     parser = argparse.ArgumentParser(prog="mintupdate-cli")
-    parser.add_argument("command", choices=["list", "upgrade"], nargs='?',
+    parser.add_argument("command", choices=["list", "upgrade", "mirror"], nargs='?',
         help="Command to run")
+    parser.add_argument("directory", nargs='?',
+        help="Target directory of the mirror command")
     group = parser.add_mutually_exclusive_group()
     group.add_argument("-k", "--only-kernel", action="store_true",
         help="Only apply kernel updates")
@@ -56,6 +53,15 @@ if __name__ == "__main__":
         help="Always keep local changes in configuration files (use with caution)")
     parser.add_argument("-t", "--create-snapshot", action="store_true",
         help="Create system snapshot with timeshift before installing updates")
+    parser.add_argument("--branch", choices=[x.name for x in MAINLINE_KERNEL_DATA.values()], default="ppa",
+        help="Mainline kernel builds to mirror (default: ppa, the versioned builds)")
+    parser.add_argument("--versions",
+        help="Mainline kernel versions to mirror (comma-separated list), by default "
+             "the latest version of each series or the latest daily build")
+    parser.add_argument("--flavor", choices=["generic", "lowlatency"],
+        help="Kernel flavor to mirror (default: the configured one)")
+    parser.add_argument("--profile", action="store_true",
+        help="Print the durations of the phases of the update check to stderr")
     parser.add_argument("-v", "--version", action="version", version="__DEB_VERSION__",
         help="Display the current version")
     args = parser.parse_args()
@@ -64,6 +70,41 @@ if __name__ == "__main__":
     if not args.command:
         parser.print_help()
         sys.exit()
+    if bool(args.directory) != (args.command == "mirror"):
+        parser.error("a directory is required by and only allowed for the mirror command")
+
+    if args.command == "mirror":
+        branch_id = next(x for x in MAINLINE_KERNEL_DATA if MAINLINE_KERNEL_DATA[x].name == args.branch)
+        try:
+            # Always mirror the upstream PPA, not a configured mirror
+            mainline = MainlineKernels(branch_id=branch_id, flavor=f"-{args.flavor}" if args.flavor else "",
+                                       ppa_url=PPA_URL)
+            if args.versions:
+                versions = args.versions.split(",")
+            elif mainline.base_data.is_daily:
+                versions = [mainline.get_daily_build()]
+            else:
+                newest = {}
+                for version in mainline.get_available_versions():
+                    newest.setdefault(KernelVersion(version).shortseries_key, version)
+                versions = list(newest.values())
+            if not versions or not all(versions):
+                print("No mainline kernel versions to mirror", file=sys.stderr)
+                sys.exit(1)
+            for version in versions:
+                print(f"Mirroring mainline kernel {version}", flush=True)
+                mainline.mirror(args.directory, [version])
+        except MainlineKernels.MainlineKernelsException as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        except OSError:
+            traceback.print_exc()
+            sys.exit(1)
+        sys.exit()
+
+    if args.profile:
+        profiler.enable()
+        profiler.reset()
 
     # Reload with sudo if not root
     uid = os.getuid()
@@ -76,30 +117,43 @@ if __name__ == "__main__":
             cmd = ["/usr/bin/mint-refresh-cache", "--mintupdate"]
             if not uid == 0:
                 cmd.insert(0, "sudo")
-            subprocess.run(cmd)
-        check = APTCheck(args.mainline)
-        check.find_changes()
-
-        blacklisted = []
-        for line in read_file("/etc/mintupdate.blacklist"):
-            line = line.strip()
-            if line.startswith("#"):
-                continue
-            blacklisted.append(line)
-        if args.ignore:
-            blacklisted.extend(args.ignore.split(","))
+            with profiler.phase("cache refresh"):
+                subprocess.run(cmd)
+        # Use the check service of a running session if we're only listing
+        records = None
+        if args.command == "list" and uid != 0:
+            with profiler.phase("check service"):
+                stream = connect_check_service(mainline=args.mainline, profile=args.profile)
+                if stream:
+                    with stream:
+                        records = list(read_records(stream))
+            if records and [True for record in records if record["type"] == "error"]:
+                records = None
+        if not records:
+            with profiler.phase("update check"):
+                records = APTCheck(args.mainline).check_updates()
+        check_updates = {}
+        for record in records:
+            if record["type"] == "profile":
+                print("\n".join(format_results(record)), file=sys.stderr)
+            elif record["type"] == "update":
+                update = Update(record=record)
+                check_updates[update.source_name] = update
+
+        blacklist = Blacklist(use_settings=False, paths=(BLACKLIST_FILE,),
+                              extra_rules=args.ignore.split(",") if args.ignore else ())
 
         updates = []
         mainline_updates = {}
-        for source_name in sorted(check.updates.keys()):
-            update = check.updates[source_name]
+        for source_name in sorted(check_updates.keys()):
+            update = check_updates[source_name]
             if source_name in PRIORITY_UPDATES:
                 updates.append(update)
             elif args.only_kernel and update.type != "kernel":
                 continue
             elif args.only_security and update.type != "security":
                 continue
-            elif is_blacklisted(blacklisted, update.real_source_name, update.new_version):
+            elif blacklist.matches(update.real_source_name, update.new_version):
                 continue
             elif update.archive.startswith("mainline-"):
                 mainline_branch_id = int(update.archive.split("-")[-1])
@@ -204,8 +258,6 @@ if __name__ == "__main__":
 
             # Install mainline kernel update
             if mainline_updates:
-                from common.MainlineKernels import MainlineKernels
-
                 for mainline_branch_id in mainline_updates:
                     mainline = MainlineKernels(branch_id=mainline_branch_id)
                     # Download
@@ -220,7 +272,10 @@ if __name__ == "__main__":
                             print(f"Installing mainline kernel {mainline_version}", flush=True)
                         else:
                             try:
-                                print(f"Downloading mainline kernel {mainline_version}", flush=True)
+                                if mainline.is_staged(mainline_version, mainline_update.package_names):
+                                    print(f"Using prefetched mainline kernel {mainline_version}", flush=True)
+                                else:
+                                    print(f"Downloading mainline kernel {mainline_version}", flush=True)
                                 downloaded_files = mainline.download_files(
                                     mainline_version, mainline_update.package_names)
                             except mainline.DownloadError as e:
@@ -244,5 +299,9 @@ if __name__ == "__main__":
         traceback.print_exc()
         failed = True
 
+    if args.profile:
+        print("\n".join(format_results(profiler.results("mintupdate-cli"))), file=sys.stderr)
+        profiler.dump("mintupdate-cli")
+
     if failed:
         sys.exit(1)
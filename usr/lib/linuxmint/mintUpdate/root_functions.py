@@ -7,7 +7,7 @@ import sys
 from mintcommon import synaptic
 
 from common.constants import PRIORITY_UPDATES, REBOOT_REQUIRED_FILE
-from common.functions import get_max_snapshots, read_file
+from common.functions import get_max_snapshots, is_private_dir, read_file
 
 if not os.getuid() == 0 or len(sys.argv) < 2:
     sys.exit(1)
@@ -144,15 +144,20 @@ def run_synaptic(xid, selections_file, closeZvt=True):
 ### MAINLINE KERNELS ###
 
 def install_mainline_kernel(mode, debfiles):
-    import tempfile
+    import stat
 
-    tmpfolder = os.path.join(tempfile.gettempdir(), "mintUpdate/")
+    # The user we were run for, only they or root may have written the packages
+    uid = int(os.environ.get("PKEXEC_UID") or os.environ.get("SUDO_UID") or 0)
 
     # Make sure we've got valid packages in the argument
     for debfile in debfiles:
-        if not debfile.startswith(tmpfolder) or \
-           not debfile.endswith(".deb") or \
-           not os.path.isfile(debfile):
+        try:
+            is_file = stat.S_ISREG(os.lstat(debfile).st_mode)
+        except OSError:
+            is_file = False
+        if not debfile.endswith(".deb") or \
+           not is_file or \
+           not is_private_dir(os.path.dirname(os.path.abspath(debfile)), uid):
             sys.exit(2)
 
     # Install debfiles with dpkg